@@ -84,7 +84,41 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# 缓存：默认进程内存（开发/测试），生产可通过环境变量切换为文件或 Redis 等后端
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', 'wms'),
+    }
+}
+
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/login/'
 
+# 入库上架：商品/分类未指定时使用的上架策略（见 warehouse.services.PUTAWAY_STRATEGIES）与空闲空间索引的重建周期（秒）
+WAREHOUSE_PUTAWAY_STRATEGY = os.environ.get('WAREHOUSE_PUTAWAY_STRATEGY', 'first_fit')
+WAREHOUSE_FREE_SPACE_INDEX_TTL = int(os.environ.get('WAREHOUSE_FREE_SPACE_INDEX_TTL', '60'))
+
+# 出入库事务遇到死锁/锁等待超时时的最大尝试次数
+WAREHOUSE_DEADLOCK_RETRIES = int(os.environ.get('WAREHOUSE_DEADLOCK_RETRIES', '3'))
+
+# 货位占用率达到该比例即视为“将满”（货位页与后台筛选）
+WAREHOUSE_NEAR_FULL_RATIO = float(os.environ.get('WAREHOUSE_NEAR_FULL_RATIO', '0.9'))
+
+# 首页统计缓存时长（秒）；商品、批次、出入库、货位变动时会立即失效
+WAREHOUSE_DASHBOARD_CACHE_TTL = int(os.environ.get('WAREHOUSE_DASHBOARD_CACHE_TTL', '300'))
+
+# 分类浏览、库存总览、临期列表的页面内容缓存时长（秒），数据变动时立即失效；
+# 分类块、库存行等片段以内容的更新时间为键，可缓存更久
+WAREHOUSE_PAGE_CACHE_TTL = int(os.environ.get('WAREHOUSE_PAGE_CACHE_TTL', '300'))
+WAREHOUSE_FRAGMENT_CACHE_TTL = int(os.environ.get('WAREHOUSE_FRAGMENT_CACHE_TTL', '86400'))
+
+# 扫码识别码缓存（进程内 LRU）：最多缓存的条码数与有效期（秒）
+WAREHOUSE_SCAN_CACHE_SIZE = int(os.environ.get('WAREHOUSE_SCAN_CACHE_SIZE', '4096'))
+WAREHOUSE_SCAN_CACHE_TTL = int(os.environ.get('WAREHOUSE_SCAN_CACHE_TTL', '60'))
+
+# 商品图片缩略图宽度（像素），上传后按这些宽度生成 WebP/JPEG
+WAREHOUSE_IMAGE_WIDTHS = tuple(
+    int(width) for width in os.environ.get('WAREHOUSE_IMAGE_WIDTHS', '320,640,1280').split(',') if width.strip()
+)
@@ -0,0 +1,62 @@
+(function(){
+  // 为带 data-autocomplete-url 的下拉框加搜索框：按输入分页加载选项，只保留已选项与当前结果
+  function initAutocomplete(select){
+    const url = select.dataset.autocompleteUrl;
+    const search = document.createElement('input');
+    search.type = 'search';
+    search.placeholder = '输入关键字搜索…';
+    search.className = 'autocomplete-search';
+    search.autocomplete = 'off';
+    const more = document.createElement('button');
+    more.type = 'button';
+    more.className = 'btn-secondary autocomplete-more';
+    more.textContent = '加载更多';
+    more.hidden = true;
+    select.parentNode.insertBefore(search, select);
+    select.parentNode.insertBefore(more, select.nextSibling);
+    if (select.disabled) { search.hidden = true; return; }
+
+    let query = null;
+    let page = 1;
+    let timer = null;
+    let pending = null;
+
+    function keepOptions(){
+      // 保留空选项与当前选中项，其余替换为搜索结果
+      Array.from(select.options).forEach((opt)=>{
+        if (opt.value !== '' && !opt.selected) opt.remove();
+      });
+    }
+
+    function load(q, nextPage){
+      if (pending) pending.abort();
+      pending = new AbortController();
+      const params = new URLSearchParams({q: q, page: String(nextPage)});
+      fetch(`${url}?${params}`, {headers: {'Accept': 'application/json'}, credentials: 'same-origin', signal: pending.signal})
+        .then((r)=> r.ok ? r.json() : Promise.reject(r.status))
+        .then((data)=>{
+          if (nextPage === 1) keepOptions();
+          const existing = new Set(Array.from(select.options).map((opt)=> opt.value));
+          data.results.forEach((row)=>{
+            if (existing.has(String(row.id))) return;
+            select.add(new Option(row.text, row.id));
+          });
+          query = q;
+          page = nextPage;
+          more.hidden = !data.more;
+        })
+        .catch((err)=>{ if (err && err.name === 'AbortError') return; more.hidden = true; });
+    }
+
+    search.addEventListener('input', ()=>{
+      clearTimeout(timer);
+      timer = setTimeout(()=> load(search.value.trim(), 1), 250);
+    });
+    search.addEventListener('keydown', (e)=>{ if (e.key === 'Enter') { e.preventDefault(); select.focus(); } });
+    select.addEventListener('focus', ()=>{ if (query === null) load('', 1); });
+    more.addEventListener('click', ()=> load(query || '', page + 1));
+  }
+  document.addEventListener('DOMContentLoaded', ()=>{
+    document.querySelectorAll('select[data-autocomplete-url]').forEach(initAutocomplete);
+  });
+})();
@@ -1,33 +1,238 @@
 (function(){
-  function initCarousel(root){
+  // 虚拟化轮播：带 data-slides-url 的分类轮播只保留可视窗口及两侧缓冲区的幻灯片节点，
+  // 滑出窗口的节点回收后填入新位置的内容；数据按页从 catalog_slides 接口加载。
+  // 位置、聚焦缩放在 requestAnimationFrame 中统一更新，
+  // IntersectionObserver 负责暂停屏幕外的轮播，并只给可见的幻灯片开启过渡动画。
+  const GAP = 16;
+  const BUFFER = 3;
+  const hasObserver = 'IntersectionObserver' in window;
+
+  function buildMedia(data){
+    if (!data || !data.image) {
+      const placeholder = document.createElement('div');
+      placeholder.className = 'carousel-placeholder';
+      placeholder.textContent = data ? (Array.from(data.name)[0] || '') : '';
+      return placeholder;
+    }
+    // 与 responsive_image.html 渲染的结构一致
+    const img = document.createElement('img');
+    img.src = data.image.src;
+    img.alt = data.image.alt;
+    img.loading = 'lazy';
+    img.decoding = 'async';
+    if (data.image.width) { img.width = data.image.width; img.height = data.image.height; }
+    if (!data.image.webp_srcset) return img;
+    const picture = document.createElement('picture');
+    const source = document.createElement('source');
+    source.type = 'image/webp';
+    source.srcset = data.image.webp_srcset;
+    source.sizes = '240px';
+    img.srcset = data.image.jpeg_srcset;
+    img.sizes = '240px';
+    picture.append(source, img);
+    return picture;
+  }
+
+  function fillSlide(slide, data){
+    // 数据未加载时显示空白占位，加载后再次填充；文本一律用 textContent
+    const caption = document.createElement('div');
+    caption.className = 'carousel-caption';
+    if (data) {
+      const name = document.createElement('strong');
+      name.textContent = data.name;
+      const sku = document.createElement('span');
+      sku.textContent = `SKU：${data.sku_code}`;
+      caption.append(name, sku);
+      if (data.size_text) {
+        const size = document.createElement('span');
+        size.textContent = `规格：${data.size_text}`;
+        caption.appendChild(size);
+      }
+    }
+    slide.replaceChildren(buildMedia(data), caption);
+    slide.classList.toggle('is-loading', !data);
+  }
+
+  function defaultFetchPage(url){
+    return (page)=> fetch(`${url}?${new URLSearchParams({page: String(page)})}`, {headers: {'Accept': 'application/json'}, credentials: 'same-origin'})
+      .then((r)=> r.ok ? r.json() : Promise.reject(r.status));
+  }
+
+  function initCarousel(root, options){
+    options = options || {};
     const track = root.querySelector('[data-carousel-track]');
-    const slides = Array.from(track.children);
     const prev = root.querySelector('[data-carousel-prev]');
     const next = root.querySelector('[data-carousel-next]');
-    if (!slides.length) return;
+    const initial = Array.from(track.children);
+    const dataScript = root.querySelector('script[type="application/json"]');
+    const url = root.dataset.slidesUrl;
+    // 没有分页数据源的轮播（如扫码页的商品图片）保留全部节点，只用同一套更新逻辑
+    const virtual = Boolean(options.fetchPage || (url && dataScript));
+    let total = virtual ? (options.total || Number(root.dataset.total) || 0) : initial.length;
+    if (!total) return null;
+    const pageSize = options.pageSize || Number(root.dataset.pageSize) || 1;
+    const buffer = options.buffer == null ? BUFFER : options.buffer;
+    const fetchPage = options.fetchPage || (virtual ? defaultFetchPage(url) : null);
+    const data = virtual ? new Array(total).fill(null) : null;
+    const requested = new Set();
+    const live = new Map(); // 位置 -> 节点
+    const pool = [];
     let index = 0;
-    function update(){
-      slides.forEach((s,i)=>{
-        s.classList.toggle('active', i === index);
+    let step = 0;
+    let containerWidth = 0;
+    let activeNode = null;
+    let visible = !hasObserver;
+    let frame = 0;
+    let dirty = true;
+
+    const slideObserver = hasObserver
+      ? new IntersectionObserver((entries)=>{
+        entries.forEach((e)=> e.target.classList.toggle('in-view', e.isIntersecting));
+      }, {root: root})
+      : null;
+
+    function observe(node){
+      if (slideObserver) slideObserver.observe(node); else node.classList.add('in-view');
+      return node;
+    }
+
+    function createSlide(){
+      const slide = document.createElement('div');
+      slide.className = 'carousel-slide';
+      track.appendChild(slide);
+      return observe(slide);
+    }
+
+    function ensureLoaded(i){
+      const page = Math.floor(i / pageSize) + 1;
+      if (requested.has(page)) return;
+      requested.add(page);
+      fetchPage(page).then((result)=>{
+        const start = (page - 1) * pageSize;
+        result.results.forEach((row, n)=>{ if (start + n < total) data[start + n] = row; });
+        if (!result.more && start + result.results.length < total) {
+          // 渲染后商品变少：收缩总数，回收多出的位置
+          total = Math.max(1, start + result.results.length);
+          data.length = total;
+          index = Math.min(index, total - 1);
+        }
+        live.forEach((node, pos)=>{ if (pos >= start && pos < start + pageSize) fillSlide(node, data[pos] || null); });
+        schedule(true);
+      }).catch(()=>{ requested.delete(page); });
+    }
+
+    function measure(){
+      // offsetWidth 不含聚焦缩放；隐藏的回收节点宽度为 0，沿用上次的值
+      const sample = virtual ? live.values().next().value : initial[0];
+      if (sample && sample.offsetWidth) step = sample.offsetWidth + GAP;
+      containerWidth = root.getBoundingClientRect().width;
+      if (virtual) {
+        track.style.width = `${total * step}px`;
+        live.forEach((node, pos)=>{ node.style.left = `${pos * step}px`; });
+      }
+    }
+
+    function place(node, pos){
+      node.style.left = `${pos * step}px`;
+      node.dataset.index = pos;
+      node.hidden = false;
+      if (data[pos]) fillSlide(node, data[pos]); else { fillSlide(node, null); ensureLoaded(pos); }
+    }
+
+    function recycle(){
+      const half = Math.ceil(containerWidth / step / 2);
+      const lo = Math.max(0, index - half - buffer);
+      const hi = Math.min(total - 1, index + half + buffer);
+      live.forEach((node, pos)=>{
+        if (pos < lo || pos > hi) { live.delete(pos); node.hidden = true; pool.push(node); }
       });
-      const slideWidth = slides[0].getBoundingClientRect().width + 16; // include gap
-      const containerWidth = root.getBoundingClientRect().width;
-      const offset = (containerWidth/2) - (slideWidth/2) - (index * slideWidth);
+      for (let pos = lo; pos <= hi; pos++) {
+        if (live.has(pos)) continue;
+        const node = pool.pop() || createSlide();
+        place(node, pos);
+        live.set(pos, node);
+      }
+      // 预取下一页，避免翻到时才出现空白占位
+      if (hi + 1 < total && !data[hi + 1]) ensureLoaded(hi + 1);
+    }
+
+    function render(){
+      frame = 0;
+      if (!visible) return;
+      if (dirty) { measure(); dirty = false; }
+      if (virtual) recycle();
+      const node = virtual ? live.get(index) : initial[index];
+      if (node !== activeNode) {
+        if (activeNode) activeNode.classList.remove('active');
+        if (node) node.classList.add('active');
+        activeNode = node;
+      }
+      const offset = (containerWidth/2) - (step/2) - (index * step);
       track.style.transform = `translateX(${offset}px)`;
     }
-    prev && prev.addEventListener('click', ()=>{ index = (index - 1 + slides.length) % slides.length; update(); });
-    next && next.addEventListener('click', ()=>{ index = (index + 1) % slides.length; update(); });
-    // wheel for fun
-    root.addEventListener('wheel', (e)=>{ e.preventDefault(); if (e.deltaY > 0) { index = (index + 1) % slides.length; } else { index = (index - 1 + slides.length) % slides.length; } update(); }, {passive:false});
+
+    function schedule(remeasure){
+      if (remeasure) dirty = true;
+      if (!frame) frame = requestAnimationFrame(render);
+    }
+
+    function go(i){ index = ((i % total) + total) % total; schedule(); }
+    function forward(){ go(index + 1); }
+    function backward(){ go(index - 1); }
+
+    if (virtual) {
+      // 首屏数据来自页面内嵌 JSON，其余位置滑到附近时按页加载
+      const first = dataScript ? JSON.parse(dataScript.textContent) : [];
+      first.forEach((row, n)=>{ if (n < total) data[n] = row; });
+      if (first.length) requested.add(1);
+      step = (initial[0] ? initial[0].offsetWidth : 240) + GAP;
+      // 服务端渲染的首屏节点内容与内嵌数据一致，直接作为对应位置的节点
+      initial.forEach((node, n)=>{
+        observe(node);
+        if (data[n]) { node.dataset.index = n; live.set(n, node); } else { node.hidden = true; pool.push(node); }
+      });
+      track.classList.add('is-virtual');
+    } else {
+      initial.forEach(observe);
+    }
+
+    prev && prev.addEventListener('click', backward);
+    next && next.addEventListener('click', forward);
+    // 触控板一次滑动会触发大量 wheel 事件，每帧最多翻一张
+    let wheelFrame = 0;
+    root.addEventListener('wheel', (e)=>{
+      e.preventDefault();
+      if (wheelFrame) return;
+      if (e.deltaY > 0) forward(); else backward();
+      wheelFrame = requestAnimationFrame(()=>{ wheelFrame = 0; });
+    }, {passive:false});
     // drag support
     let startX=null;
     track.addEventListener('pointerdown', (e)=>{ startX = e.clientX; track.setPointerCapture(e.pointerId); });
-    track.addEventListener('pointerup', (e)=>{ if (startX==null) return; const dx = e.clientX - startX; if (Math.abs(dx)>30){ if (dx<0) index=(index+1)%slides.length; else index=(index-1+slides.length)%slides.length; } startX = null; update(); });
-    window.addEventListener('resize', update);
-    update();
+    track.addEventListener('pointerup', (e)=>{ if (startX==null) return; const dx = e.clientX - startX; startX = null; if (Math.abs(dx)>30){ if (dx<0) forward(); else backward(); } });
+    window.addEventListener('resize', ()=> schedule(true));
+    if (hasObserver) {
+      // 屏幕外的轮播不更新也不加载数据，接近视口时再渲染
+      new IntersectionObserver((entries)=>{
+        visible = entries[entries.length - 1].isIntersecting;
+        if (visible) schedule();
+      }, {rootMargin: '200px 0px'}).observe(root);
+    }
+    schedule(true);
+
+    return {
+      go: go,
+      next: forward,
+      prev: backward,
+      get index(){ return index; },
+      get total(){ return total; },
+      // 当前挂在 DOM 中的幻灯片节点数（含回收池中隐藏的节点）
+      get nodeCount(){ return track.children.length; },
+    };
   }
+
+  window.WarehouseCarousel = {init: initCarousel};
   document.addEventListener('DOMContentLoaded', ()=>{
-    document.querySelectorAll('[data-carousel]').forEach(initCarousel);
+    document.querySelectorAll('[data-carousel]').forEach((root)=> initCarousel(root));
   });
 })();
-
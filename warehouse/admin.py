@@ -1,6 +1,7 @@
-﻿from django.contrib import admin
+﻿from django.contrib import admin, messages
 
-from .models import BatchLocation, Category, Item, ItemBatch, ItemImage, Location, Movement
+from .models import ApiToken, BatchLocation, Category, Item, ItemBatch, ItemImage, Location, Movement
+from .services import recompute_occupancy, refresh_item_occupancy, refresh_item_stock
 
 
 class ItemImageInline(admin.TabularInline):
@@ -10,7 +11,7 @@ class ItemImageInline(admin.TabularInline):
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ('name', 'slug', 'order')
+    list_display = ('name', 'slug', 'order', 'putaway_strategy')
     search_fields = ('name', 'slug')
     prepopulated_fields = {'slug': ('name',)}
     ordering = ('order', 'name')
@@ -19,32 +20,103 @@ class CategoryAdmin(admin.ModelAdmin):
 @admin.register(Item)
 class ItemAdmin(admin.ModelAdmin):
     list_display = ('name', 'sku_code', 'category', 'unit', 'packaging_volume', 'active')
-    list_filter = ('category', 'active', 'has_shelf_life')
+    list_filter = ('category', 'active', 'has_shelf_life', 'putaway_strategy')
+    list_select_related = ('category',)
     search_fields = ('name', 'sku_code')
     inlines = [ItemImageInline]
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and 'packaging_volume' in form.changed_data:
+            refresh_item_occupancy(obj)
+
 
 @admin.register(ItemBatch)
 class ItemBatchAdmin(admin.ModelAdmin):
     list_display = ('item', 'batch_number', 'barcode', 'production_date', 'expiry_date', 'quantity_units')
     search_fields = ('batch_number', 'barcode', 'item__name', 'item__sku_code')
     list_filter = ('expiry_date', 'item__category')
+    list_select_related = ('item',)
+
+
+class NearFullFilter(admin.SimpleListFilter):
+    title = '占用情况'
+    parameter_name = 'occupancy'
+
+    def lookups(self, request, model_admin):
+        return (('near_full', '将满'), ('empty', '空闲'))
+
+    def queryset(self, request, queryset):
+        if self.value() == 'near_full':
+            return queryset.near_full()
+        if self.value() == 'empty':
+            return queryset.filter(occupied_volume__lte=0)
+        return queryset
 
 
 @admin.register(Location)
 class LocationAdmin(admin.ModelAdmin):
-    list_display = ('code', 'name', 'capacity_volume')
+    list_display = ('code', 'name', 'capacity_volume', 'occupied_volume', 'occupancy_percent')
+    list_filter = (NearFullFilter,)
     search_fields = ('code', 'name')
+    readonly_fields = ('occupied_volume',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_occupancy()
+
+    @admin.display(description='占用率', ordering='occupancy_pct')
+    def occupancy_percent(self, obj):
+        return f"{obj.occupancy_pct:.1f}%"
 
 
 @admin.register(BatchLocation)
 class BatchLocationAdmin(admin.ModelAdmin):
     list_display = ('batch', 'location', 'quantity_units')
+    list_select_related = ('batch__item', 'location')
     search_fields = ('batch__batch_number', 'batch__item__name', 'location__code')
 
+    # 后台直接改动批次货位时，重新核算涉及货位的占用体积与商品库存汇总
+    def save_model(self, request, obj, form, change):
+        previous_location_id = form.initial.get('location') if change else None
+        previous_batch = ItemBatch.objects.filter(pk=form.initial.get('batch')).first() if change else None
+        super().save_model(request, obj, form, change)
+        recompute_occupancy({obj.location_id, previous_location_id} - {None})
+        refresh_item_stock({obj.batch.item_id} | ({previous_batch.item_id} if previous_batch else set()))
+
+    def delete_model(self, request, obj):
+        location_id = obj.location_id
+        item_id = obj.batch.item_id
+        super().delete_model(request, obj)
+        recompute_occupancy([location_id])
+        refresh_item_stock([item_id])
+
+    def delete_queryset(self, request, queryset):
+        location_ids = set(queryset.values_list('location_id', flat=True))
+        item_ids = set(queryset.values_list('batch__item_id', flat=True))
+        super().delete_queryset(request, queryset)
+        recompute_occupancy(location_ids)
+        refresh_item_stock(item_ids)
+
 
 @admin.register(Movement)
 class MovementAdmin(admin.ModelAdmin):
     list_display = ('direction', 'batch', 'quantity_units', 'user', 'location', 'created_at')
     list_filter = ('direction', 'created_at')
+    list_select_related = ('batch__item', 'user', 'location')
     search_fields = ('batch__batch_number', 'batch__item__name')
+
+
+@admin.register(ApiToken)
+class ApiTokenAdmin(admin.ModelAdmin):
+    list_display = ('name', 'user', 'active', 'created_at', 'last_used_at')
+    list_filter = ('active',)
+    list_select_related = ('user',)
+    search_fields = ('name', 'user__username')
+    readonly_fields = ('created_at', 'last_used_at')
+
+    # 新建时生成令牌，明文只在保存后的提示中出现一次
+    def save_model(self, request, obj, form, change):
+        key = None if change else obj.generate_key()
+        super().save_model(request, obj, form, change)
+        if key:
+            messages.warning(request, f'请立即复制令牌，之后将无法再次查看：{key}')
@@ -0,0 +1,327 @@
+"""Compact JSON endpoints for handheld scanners.
+
+Requests authenticate with ``Authorization: Token <key>`` (see ``ApiToken``).
+The token's user is attached to the request directly, without logging in, so
+terminals never create or rotate sessions. Writes go through the same
+services as the HTML views. ``scan`` is an async view (read-only, async
+ORM) and answers conditional GETs from a one-row version probe before
+building the body, so polling an unchanged code costs the token lookup plus
+one small query and an empty 304.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.db import transaction
+from django.db.models import F
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from .forms import ApiInboundForm, ApiOutboundForm
+from .models import ApiToken, BatchLocation, Item, ItemBatch, ItemStock, Movement
+from .scancodes import aresolve_scan_code, resolve_scan_code
+from .services import (
+    allocate_inbound,
+    lock_inbound_plan,
+    plan_inbound,
+    receive_batch,
+    release_item_outbound,
+    release_outbound,
+    retry_on_deadlock,
+)
+
+# 令牌最近使用时间的最小更新间隔，避免每次扫码都写一次库
+TOKEN_TOUCH_INTERVAL = timedelta(minutes=1)
+# 按 SKU 扫码时返回的在库批次数上限（按先到期先出排序）
+SCAN_BATCH_LIMIT = 20
+
+
+def _json(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')})
+
+
+def _error(message, status, **extra):
+    return _json({'error': message, **extra}, status=status)
+
+
+def _token_lookup(request):
+    """Queryset for the request's active token, or ``None`` when no token was sent."""
+    scheme, _, key = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() not in ('token', 'bearer') or not key.strip():
+        return None
+    return ApiToken.objects.select_related('user').filter(
+        digest=ApiToken.hash_key(key.strip()), active=True, user__is_active=True
+    )
+
+
+def _touch(token):
+    """Queryset to stamp ``last_used_at`` on, or ``None`` if it was stamped recently."""
+    now = timezone.now()
+    if token.last_used_at is not None and token.last_used_at >= now - TOKEN_TOUCH_INTERVAL:
+        return None
+    token.last_used_at = now
+    return ApiToken.objects.filter(pk=token.pk)
+
+
+def token_required(perm=None):
+    """Authenticate by API token and optionally require ``perm``; answers 401/403 as JSON.
+
+    Works on both sync and async views; async views are authenticated with the
+    async ORM.
+    """
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                tokens = _token_lookup(request)
+                if tokens is None:
+                    return _error('缺少访问令牌', 401)
+                token = await tokens.afirst()
+                if token is None:
+                    return _error('访问令牌无效或已停用', 401)
+                stale = _touch(token)
+                if stale is not None:
+                    await stale.aupdate(last_used_at=token.last_used_at)
+                request.user = token.user
+                if perm and not await request.user.ahas_perm(perm):
+                    return _error('没有操作权限', 403)
+                return await view(request, *args, **kwargs)
+
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            tokens = _token_lookup(request)
+            if tokens is None:
+                return _error('缺少访问令牌', 401)
+            token = tokens.first()
+            if token is None:
+                return _error('访问令牌无效或已停用', 401)
+            stale = _touch(token)
+            if stale is not None:
+                stale.update(last_used_at=token.last_used_at)
+            request.user = token.user
+            if perm and not request.user.has_perm(perm):
+                return _error('没有操作权限', 403)
+            return view(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _payload(request):
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+    return request.POST
+
+
+def _form_error(form):
+    fields = {name: [e['message'] for e in errors] for name, errors in form.errors.get_json_data().items()}
+    return _error('参数错误', 400, fields=fields)
+
+
+def _stock_units(item):
+    try:
+        return item.stock.total_units
+    except ItemStock.DoesNotExist:
+        return 0
+
+
+def _item_json(item):
+    return {'id': item.pk, 'sku': item.sku_code, 'name': item.name, 'unit': item.unit, 'stock': _stock_units(item)}
+
+
+def _batch_json(batch):
+    return {
+        'id': batch.pk,
+        'number': batch.batch_number,
+        'barcode': batch.barcode,
+        'production': batch.production_date,
+        'expiry': batch.expiry_date,
+        'qty': batch.quantity_units,
+    }
+
+
+def _scan_version(match):
+    """One-row probe whose value changes whenever the scan payload of ``match`` can change."""
+    if match.is_batch:
+        return ItemBatch.objects.filter(pk=match.batch_id).values_list(
+            'updated_at', 'item__updated_at', 'item__stock__updated_at'
+        )
+    return Item.objects.filter(pk=match.item_id).values_list('updated_at', 'stock__updated_at')
+
+
+async def _scan_payload(match):
+    if match.is_batch:
+        batch = await ItemBatch.objects.select_related('item__stock').filter(pk=match.batch_id).afirst()
+        if batch is None:
+            return None
+        locations = (
+            BatchLocation.objects.filter(batch=batch, quantity_units__gt=0)
+            .order_by('location__code')
+            .values_list('location__code', 'quantity_units')
+        )
+        return {
+            'item': _item_json(batch.item),
+            'batch': {**_batch_json(batch), 'locations': [list(row) async for row in locations]},
+        }
+    item = await Item.objects.select_related('stock').filter(pk=match.item_id).afirst()
+    if item is None:
+        return None
+    batches = item.batches.filter(quantity_units__gt=0).order_by(
+        F('expiry_date').asc(nulls_last=True), 'created_at', 'id'
+    )[:SCAN_BATCH_LIMIT]
+    return {'item': _item_json(item), 'batches': [_batch_json(batch) async for batch in batches]}
+
+
+@require_GET
+@token_required()
+async def scan(request, code):
+    # django 的 condition 装饰器会同步调用 etag 函数，这里手动做条件请求判断
+    match = await aresolve_scan_code(code)
+    version = await _scan_version(match).afirst() if match else None
+    if version is None:
+        return _error('未找到匹配的商品或批次', 404)
+    etag = quote_etag(hashlib.md5(repr((match, version)).encode()).hexdigest())
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        data = await _scan_payload(match)
+        if data is None:
+            return _error('未找到匹配的商品或批次', 404)
+        response = _json(data)
+    response.headers.setdefault('ETag', etag)
+    # 终端每次都带 If-None-Match 重新验证，未变化时只收到 304
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@csrf_exempt
+@require_POST
+@token_required('warehouse.add_movement')
+@retry_on_deadlock
+@transaction.atomic
+def inbound(request):
+    data = _payload(request)
+    if data is None:
+        return _error('请求体不是有效的 JSON 对象', 400)
+    form = ApiInboundForm(data)
+    if not form.is_valid():
+        return _form_error(form)
+    cleaned = form.cleaned_data
+    match = resolve_scan_code(cleaned['code'])
+    if match is None:
+        return _error('未找到匹配的商品或批次', 404)
+    if match.is_batch:
+        batch = ItemBatch.objects.select_related('item').filter(pk=match.batch_id).first()
+        if batch is None:
+            return _error('未找到匹配的商品或批次', 404)
+        item = batch.item
+    else:
+        if not cleaned['batch_number'] or not cleaned['barcode']:
+            return _error('按 SKU 入库需提供批次号与条码', 400)
+        item = Item.objects.filter(pk=match.item_id).first()
+        if item is None:
+            return _error('未找到匹配的商品或批次', 404)
+        taken = (
+            ItemBatch.objects.filter(barcode=cleaned['barcode'])
+            .exclude(item=item, batch_number=cleaned['batch_number'])
+            .exists()
+        )
+        if taken:
+            return _error('条码已被其他批次使用', 409)
+        # 只读取已有批次用于规划；写批次放在锁定货位之后
+        batch = ItemBatch.objects.filter(item=item, batch_number=cleaned['batch_number']).first()
+    qty = cleaned['quantity']
+    location = cleaned['location']
+    plan = plan_inbound(item, qty, preferred=location, batch=batch)
+    if not plan.fits:
+        return _error('货位容量不足', 409, placeable=plan.placeable_units)
+    # 与入库页一致：先锁货位再写批次，加锁顺序与出库相同
+    lock_inbound_plan(plan, location, batch=batch)
+    if not match.is_batch:
+        batch = receive_batch(
+            item, cleaned['batch_number'], cleaned['barcode'], cleaned['production_date'], cleaned['expiry_date']
+        )
+    allocation = allocate_inbound(batch, qty, plan=plan)
+    Movement.objects.create(
+        batch=batch,
+        direction=Movement.Direction.IN,
+        quantity_units=qty,
+        user=request.user,
+        location=location,
+        note='终端入库',
+    )
+    return _json(
+        {
+            'batch': _batch_json(batch),
+            'allocated': [[loc.code, units] for loc, units in allocation.assignments],
+            'unassigned': allocation.remaining_units,
+        }
+    )
+
+
+@csrf_exempt
+@require_POST
+@token_required('warehouse.add_movement')
+@retry_on_deadlock
+@transaction.atomic
+def outbound(request):
+    data = _payload(request)
+    if data is None:
+        return _error('请求体不是有效的 JSON 对象', 400)
+    form = ApiOutboundForm(data)
+    if not form.is_valid():
+        return _form_error(form)
+    cleaned = form.cleaned_data
+    qty = cleaned['quantity']
+    note = cleaned['note'] or '终端出库'
+    match = resolve_scan_code(cleaned['code'])
+    if match and match.is_batch:
+        batch = ItemBatch.objects.select_related('item').filter(pk=match.batch_id).first()
+        if batch is None:
+            return _error('未找到匹配的商品或批次', 404)
+        try:
+            result = release_outbound(batch, qty, preferred=cleaned['location'])
+        except ValueError:
+            return _error('出库数量超过现有库存', 409, available=batch.quantity_units)
+        Movement.objects.create(
+            batch=batch,
+            direction=Movement.Direction.OUT,
+            quantity_units=qty,
+            user=request.user,
+            location=cleaned['location'],
+            note=note,
+        )
+        return _json(
+            {
+                'batch': _batch_json(batch),
+                'removed': [[loc.code, units] for loc, units in result.assignments],
+                'unlocated': qty - result.removed_units,
+            }
+        )
+    item = Item.objects.filter(pk=match.item_id).first() if match else None
+    if item is None:
+        return _error('未找到匹配的商品或批次', 404)
+    try:
+        result = release_item_outbound(item, qty, user=request.user, note=note)
+    except ValueError:
+        return _error('出库数量超过已上架库存', 409)
+    return _json(
+        {
+            'item': {'id': item.pk, 'sku': item.sku_code},
+            'picks': [[bl.batch.batch_number, bl.location.code, units] for bl, units in result.picks],
+        }
+    )
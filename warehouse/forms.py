@@ -1,6 +1,7 @@
 ﻿from django import forms
 
 from .models import Category, Item, ItemBatch, Location, Movement
+from .widgets import AutocompleteSelect
 
 
 class ScanForm(forms.Form):
@@ -15,7 +16,12 @@ class ScanForm(forms.Form):
 class InboundForm(forms.Form):
     batch_id = forms.IntegerField(widget=forms.HiddenInput(), required=False)
     item_id = forms.IntegerField(widget=forms.HiddenInput(), required=False)
-    item = forms.ModelChoiceField(queryset=Item.objects.select_related('category').order_by('name'), required=False, label='商品')
+    item = forms.ModelChoiceField(
+        queryset=Item.objects.select_related('category').order_by('name'),
+        required=False,
+        label='商品',
+        widget=AutocompleteSelect('warehouse:autocomplete_items'),
+    )
     batch_number = forms.CharField(max_length=100, label='批次号')
     production_date = forms.DateField(
         label='生产日期',
@@ -29,7 +35,12 @@ class InboundForm(forms.Form):
     )
     barcode = forms.CharField(max_length=64, label='条码/批次码')
     quantity_units = forms.IntegerField(min_value=1, label='数量')
-    location = forms.ModelChoiceField(queryset=Location.objects.all(), required=False, label='优先货位')
+    location = forms.ModelChoiceField(
+        queryset=Location.objects.all(),
+        required=False,
+        label='优先货位',
+        widget=AutocompleteSelect('warehouse:autocomplete_locations'),
+    )
 
     def __init__(self, *args, lock_dates: bool = False, lock_item: bool = False, **kwargs):
         super().__init__(*args, **kwargs)
@@ -46,13 +57,15 @@ class OutboundForm(forms.Form):
     batch = forms.ModelChoiceField(
         queryset=ItemBatch.objects.filter(quantity_units__gt=0).select_related('item').order_by('-updated_at'),
         label='选择批次',
-        help_text='仅显示当前还有库存的批次',
+        help_text='输入批次号、条码或 SKU 搜索，仅显示当前还有库存的批次',
+        widget=AutocompleteSelect('warehouse:autocomplete_batches'),
     )
     quantity_units = forms.IntegerField(min_value=1, label='数量')
     location = forms.ModelChoiceField(
         queryset=Location.objects.all().order_by('code'),
         required=False,
         label='货位（可选）',
+        widget=AutocompleteSelect('warehouse:autocomplete_locations'),
     )
     note = forms.CharField(max_length=255, required=False, label='备注')
 
@@ -66,6 +79,43 @@ class OutboundForm(forms.Form):
         return cleaned
 
 
+class ItemOutboundForm(forms.Form):
+    item = forms.ModelChoiceField(
+        queryset=Item.objects.order_by('name'),
+        label='商品',
+        help_text='按过期日期从早到晚，自动从各批次、各货位扣减',
+        widget=AutocompleteSelect('warehouse:autocomplete_items'),
+    )
+    quantity_units = forms.IntegerField(min_value=1, label='数量')
+    note = forms.CharField(max_length=50, required=False, label='备注')
+
+
+class ApiInboundForm(forms.Form):
+    code = forms.CharField(max_length=64, label='识别编码', help_text='批次条码或 SKU')
+    quantity = forms.IntegerField(min_value=1, label='数量')
+    batch_number = forms.CharField(max_length=100, required=False, label='批次号')
+    barcode = forms.CharField(max_length=64, required=False, label='条码/批次码')
+    production_date = forms.DateField(required=False, label='生产日期')
+    expiry_date = forms.DateField(required=False, label='过期日期')
+    location = forms.ModelChoiceField(queryset=Location.objects.all(), to_field_name='code', required=False, label='优先货位')
+
+
+class ApiOutboundForm(forms.Form):
+    code = forms.CharField(max_length=64, label='识别编码', help_text='批次条码按批次出库，SKU 按先到期先出')
+    quantity = forms.IntegerField(min_value=1, label='数量')
+    location = forms.ModelChoiceField(queryset=Location.objects.all(), to_field_name='code', required=False, label='货位')
+    note = forms.CharField(max_length=50, required=False, label='备注')
+
+
+class MovementImportForm(forms.Form):
+    file = forms.FileField(label='导入文件', help_text='CSV 或 JSON Lines，每行一条入库/出库记录')
+    format = forms.ChoiceField(
+        choices=(('', '按扩展名判断'), ('csv', 'CSV'), ('jsonl', 'JSON Lines')),
+        required=False,
+        label='格式',
+    )
+
+
 class LocationForm(forms.ModelForm):
     class Meta:
         model = Location
@@ -75,7 +125,7 @@ class LocationForm(forms.ModelForm):
 class ItemPackagingForm(forms.ModelForm):
     class Meta:
         model = Item
-        fields = ['category', 'size_text', 'unit', 'packaging_volume', 'has_shelf_life', 'description', 'active']
+        fields = ['category', 'size_text', 'unit', 'packaging_volume', 'has_shelf_life', 'putaway_strategy', 'description', 'active']
         widgets = {
             'category': forms.Select(attrs={'class': 'form-select'}),
             'description': forms.Textarea(attrs={'rows': 3}),
@@ -0,0 +1,243 @@
+"""In-process free-space index over location capacity.
+
+The index keeps two views of ``capacity_volume - occupied_volume`` per
+location:
+
+* a list sorted by available volume, for best-fit / worst-fit lookups via
+  ``bisect``;
+* a max segment tree laid out in ``code`` order, for first-fit lookups
+  ("first location by code with at least N free").
+
+Both answer a query in logarithmic time (plus one step per excluded
+location skipped). Updates are O(log n) in the tree but O(n) in the sorted
+list, whose delete and insert shift the tail; that is a memmove of pointers,
+cheap at warehouse scale. The index is a per-process hint:
+allocation services validate every pick against the database rows they
+load anyway and rebuild it after ``WAREHOUSE_FREE_SPACE_INDEX_TTL`` seconds
+so changes made by other processes are picked up.
+
+Writers never touch the index inside their transaction: occupancy deltas
+(``queue_occupancy_deltas``) and corrections of stale entries
+(``queue_index_correction``) are applied when the transaction commits, and
+dropped if it rolls back. A correction re-reads the committed row, so the
+deltas the same transaction queues after it are skipped rather than counted
+twice.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from bisect import bisect_left, insort
+from contextlib import contextmanager
+from decimal import Decimal
+from typing import Collection, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Location
+
+
+Entry = Tuple[Decimal, str, int]  # (available, code, location_id)
+
+
+class FreeSpaceIndex:
+    def __init__(self, rows: Iterable[Tuple[int, str, Decimal]]):
+        """``rows`` are ``(location_id, code, available_volume)`` tuples."""
+        ordered = sorted(rows, key=lambda row: row[1])
+        self._codes: List[str] = [code for _, code, _ in ordered]
+        self._ids: List[int] = [location_id for location_id, _, _ in ordered]
+        self._position: Dict[int, int] = {location_id: i for i, location_id in enumerate(self._ids)}
+        self._available: Dict[int, Decimal] = {location_id: available for location_id, _, available in ordered}
+        self._by_available: List[Entry] = sorted((available, code, location_id) for location_id, code, available in ordered)
+        size = 1
+        while size < max(1, len(ordered)):
+            size *= 2
+        self._size = size
+        self._tree: List[Optional[Decimal]] = [None] * (2 * size)
+        for i, (_, _, available) in enumerate(ordered):
+            self._tree[size + i] = available
+        for node in range(size - 1, 0, -1):
+            self._tree[node] = self._max(self._tree[2 * node], self._tree[2 * node + 1])
+        self.built_at = time.monotonic()
+
+    @classmethod
+    def from_database(cls) -> 'FreeSpaceIndex':
+        return cls(Location.objects.with_occupancy().values_list('id', 'code', 'available'))
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, location_id: int) -> bool:
+        return location_id in self._position
+
+    @staticmethod
+    def _max(a: Optional[Decimal], b: Optional[Decimal]) -> Optional[Decimal]:
+        if a is None:
+            return b
+        if b is None:
+            return a
+        return a if a >= b else b
+
+    def available(self, location_id: int) -> Optional[Decimal]:
+        return self._available.get(location_id)
+
+    def set_available(self, location_id: int, available: Decimal) -> None:
+        """Move one location to a new available volume.
+
+        The tree update is O(log n); the sorted-list delete and ``insort``
+        find their slot by bisection but shift the tail, so the whole call is
+        O(n).
+        """
+        old = self._available.get(location_id)
+        if old is None or old == available:
+            return
+        pos = self._position[location_id]
+        code = self._codes[pos]
+        i = bisect_left(self._by_available, (old, code, location_id))
+        del self._by_available[i]
+        insort(self._by_available, (available, code, location_id))
+        self._available[location_id] = available
+        node = self._size + pos
+        self._tree[node] = available
+        node //= 2
+        while node:
+            self._tree[node] = self._max(self._tree[2 * node], self._tree[2 * node + 1])
+            node //= 2
+
+    def adjust(self, location_id: int, delta: Decimal) -> None:
+        current = self._available.get(location_id)
+        if current is not None:
+            self.set_available(location_id, current + delta)
+
+    def best_fit(self, need: Decimal, exclude: Collection[int] = ()) -> Optional[int]:
+        """Location with the smallest available volume that is still ``>= need``."""
+        i = bisect_left(self._by_available, (need, '', -1))
+        while i < len(self._by_available):
+            location_id = self._by_available[i][2]
+            if location_id not in exclude:
+                return location_id
+            i += 1
+        return None
+
+    def worst_fit(self, need: Decimal, exclude: Collection[int] = ()) -> Optional[int]:
+        """Location with the largest available volume, if it is ``>= need``."""
+        i = len(self._by_available) - 1
+        while i >= 0:
+            available, _, location_id = self._by_available[i]
+            if available < need:
+                return None
+            if location_id not in exclude:
+                return location_id
+            i -= 1
+        return None
+
+    def first_fit(self, need: Decimal, exclude: Collection[int] = ()) -> Optional[int]:
+        """First location in ``code`` order whose available volume is ``>= need``."""
+        start = 0
+        while True:
+            pos = self._leftmost(start, need)
+            if pos is None:
+                return None
+            location_id = self._ids[pos]
+            if location_id not in exclude:
+                return location_id
+            start = pos + 1
+
+    def _leftmost(self, start: int, need: Decimal) -> Optional[int]:
+        def descend(node: int, lo: int, hi: int) -> Optional[int]:
+            value = self._tree[node]
+            if hi < start or value is None or value < need:
+                return None
+            if lo == hi:
+                return lo
+            mid = (lo + hi) // 2
+            found = descend(2 * node, lo, mid)
+            if found is not None:
+                return found
+            return descend(2 * node + 1, mid + 1, hi)
+
+        return descend(1, 0, self._size - 1)
+
+
+_lock = threading.RLock()
+_index: Optional[FreeSpaceIndex] = None
+
+
+def _ttl() -> float:
+    return float(getattr(settings, 'WAREHOUSE_FREE_SPACE_INDEX_TTL', 60))
+
+
+@contextmanager
+def free_space_index() -> Iterator[FreeSpaceIndex]:
+    """Hold the process-wide index, rebuilding it when missing or older than the TTL."""
+    global _index
+    with _lock:
+        if _index is None or time.monotonic() - _index.built_at > _ttl():
+            _index = FreeSpaceIndex.from_database()
+        yield _index
+
+
+def invalidate_free_space_index() -> None:
+    global _index
+    with _lock:
+        _index = None
+
+
+class _TransactionUpdates:
+    """Index updates queued by one transaction; its commit callbacks run in the order they were queued."""
+
+    def __init__(self):
+        self.corrected: Set[int] = set()
+        self.committing = False
+
+
+_pending = threading.local()
+
+
+def _transaction_updates() -> _TransactionUpdates:
+    # 每个线程同一时刻只有一个事务；上一个事务的回调开始执行后换新记录，回滚的事务留下的记录为空可复用
+    updates = getattr(_pending, 'updates', None)
+    if updates is None or updates.committing:
+        updates = _pending.updates = _TransactionUpdates()
+    return updates
+
+
+def queue_occupancy_deltas(deltas: Dict[int, Decimal]) -> None:
+    """Apply occupancy deltas (location_id -> volume delta) to the index once the transaction commits."""
+    updates = _transaction_updates()
+
+    def apply() -> None:
+        updates.committing = True
+        apply_occupancy_deltas({key: delta for key, delta in deltas.items() if key not in updates.corrected})
+
+    transaction.on_commit(apply)
+
+
+def queue_index_correction(location_id: int) -> None:
+    """Re-read a stale location into the index once the transaction commits."""
+    updates = _transaction_updates()
+
+    def correct() -> None:
+        updates.committing = True
+        updates.corrected.add(location_id)
+        available = (
+            Location.objects.with_occupancy().filter(pk=location_id).values_list('available', flat=True).first()
+        )
+        with _lock:
+            if available is None:
+                # 货位已删除：重建索引
+                invalidate_free_space_index()
+            elif _index is not None:
+                _index.set_available(location_id, available)
+
+    transaction.on_commit(correct)
+
+
+def apply_occupancy_deltas(deltas: Dict[int, Decimal]) -> None:
+    """Mirror committed occupancy changes (location_id -> volume delta) into a built index."""
+    with _lock:
+        if _index is None:
+            return
+        for location_id, delta in deltas.items():
+            _index.adjust(location_id, -delta)
@@ -0,0 +1,155 @@
+"""Responsive variants for item images.
+
+For every upload a WebP and a JPEG copy is written at each configured width
+(never upscaled), next to the original in the same storage directory. The
+pixels are rotated according to the EXIF orientation first and the copies
+are saved without any metadata, so GPS and camera EXIF never reach the
+browser; templates only link the variants. An original that carries EXIF or
+XMP is re-saved upright, in the same format, without them, since it is still
+served from the media URL (and linked from the admin).
+
+Files are never deleted before their replacement is written: new files are
+saved under a name the storage picks (it appends a suffix when the old file
+is still there), the record is pointed at them, and only then are the files
+they replace removed. A failed encode or save leaves the previous original
+and variants in place.
+
+The result is recorded in ``ItemImage.variants``::
+
+    {"source": "item_images/a.jpg", "width": 3000, "height": 2000,
+     "sizes": [{"w": 320, "h": 213, "webp": "item_images/a__w320.webp",
+                "jpeg": "item_images/a__w320.jpg"}, ...]}
+
+``source`` tells whether the variants still belong to the current file.
+"""
+from __future__ import annotations
+
+import io
+import logging
+import posixpath
+from typing import Dict, List
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import Item, ItemImage
+from .stats import CATALOG, bump_cache_version
+
+logger = logging.getLogger(__name__)
+
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+ORIGINAL_JPEG_QUALITY = 95
+# 重新保存原图时保留的信息（颜色配置与调色板透明色），其余元数据一律丢弃
+ORIGINAL_INFO_KEPT = ('icc_profile', 'transparency')
+
+
+def variant_widths() -> List[int]:
+    return sorted(set(getattr(settings, 'WAREHOUSE_IMAGE_WIDTHS', (320, 640, 1280))))
+
+
+def is_current(image: ItemImage) -> bool:
+    return bool(image.image) and (image.variants or {}).get('source') == image.image.name
+
+
+def _encode(picture: Image.Image, fmt: str) -> bytes:
+    buffer = io.BytesIO()
+    if fmt == 'webp':
+        picture.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+    else:
+        # JPEG 不支持透明通道，铺白底
+        if picture.mode != 'RGB':
+            background = Image.new('RGB', picture.size, 'white')
+            background.paste(picture, mask=picture.getchannel('A') if 'A' in picture.getbands() else None)
+            picture = background
+        picture.save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def _has_metadata(picture: Image.Image) -> bool:
+    return bool(picture.getexif()) or any(key in picture.info for key in ('exif', 'xmp', 'XML:com.adobe.xmp'))
+
+
+def _strip_original(image: ItemImage, picture: Image.Image, fmt: str) -> None:
+    """Replace the uploaded file with the upright ``picture`` minus its metadata."""
+    clean = picture.copy()
+    clean.info = {key: picture.info[key] for key in ORIGINAL_INFO_KEPT if key in picture.info}
+    # 相机的多图 JPEG（MPO）按普通 JPEG 保存
+    fmt = 'JPEG' if fmt == 'MPO' else fmt
+    params = dict(clean.info)
+    if fmt == 'JPEG':
+        params.update(quality=ORIGINAL_JPEG_QUALITY, optimize=True)
+    buffer = io.BytesIO()
+    try:
+        clean.save(buffer, fmt, **params)
+    except (OSError, KeyError, ValueError):
+        logger.warning('无法重新保存商品图片 %s，原图仍带有元数据', image.image.name)
+        return
+    storage = image.image.storage
+    name = image.image.name
+    # 先写新文件（原文件仍在，存储会另取文件名），改好记录后再删除原文件
+    saved = storage.save(name, ContentFile(buffer.getvalue()))
+    ItemImage.objects.filter(pk=image.pk).update(image=saved)
+    image.image.name = saved
+    if saved != name:
+        storage.delete(name)
+
+
+def delete_variants(variants: Dict) -> None:
+    storage = ItemImage._meta.get_field('image').storage
+    for size in (variants or {}).get('sizes', []):
+        for key in ('webp', 'jpeg'):
+            if size.get(key):
+                storage.delete(size[key])
+
+
+def generate_variants(image: ItemImage) -> Dict:
+    """Write the variants of ``image`` and store their manifest; returns the manifest.
+
+    Unreadable files are logged and leave ``variants`` empty, so templates show
+    a placeholder instead of linking the original.
+    """
+    storage = image.image.storage
+    old = image.variants or {}
+    try:
+        with image.image.open('rb') as handle:
+            source = Image.open(handle)
+            fmt, metadata = source.format, _has_metadata(source)
+            picture = ImageOps.exif_transpose(source)
+            picture.load()
+    except (OSError, UnidentifiedImageError):
+        logger.warning('无法读取商品图片 %s，跳过生成缩略图', image.image.name)
+        variants: Dict = {}
+    else:
+        if metadata:
+            _strip_original(image, picture, fmt)
+        if picture.mode not in ('RGB', 'RGBA'):
+            picture = picture.convert('RGBA' if 'transparency' in picture.info or 'A' in picture.getbands() else 'RGB')
+        stem = posixpath.splitext(image.image.name)[0]
+        sizes = []
+        widths = [w for w in variant_widths() if w < picture.width] or [picture.width]
+        try:
+            for width in widths:
+                height = max(1, round(picture.height * width / picture.width))
+                resized = picture if width == picture.width else picture.resize((width, height), Image.LANCZOS)
+                entry = {'w': width, 'h': height}
+                sizes.append(entry)
+                for fmt, ext in (('webp', 'webp'), ('jpeg', 'jpg')):
+                    # 旧缩略图仍在时存储会另取文件名，旧文件在清单更新后才删除
+                    entry[fmt] = storage.save(f'{stem}__w{width}.{ext}', ContentFile(_encode(resized, fmt)))
+        except Exception:
+            # 已写出的新文件作废，清单仍指向旧缩略图
+            delete_variants({'sizes': sizes})
+            raise
+        variants = {'source': image.image.name, 'width': picture.width, 'height': picture.height, 'sizes': sizes}
+    # 只删除新清单不再引用的旧文件
+    kept = {size[key] for size in variants.get('sizes', []) for key in ('webp', 'jpeg')}
+    delete_variants({'sizes': [{k: v for k, v in size.items() if v not in kept} for size in old.get('sizes', [])]})
+    ItemImage.objects.filter(pk=image.pk).update(variants=variants)
+    image.variants = variants
+    # 分类浏览页引用缩略图地址，让对应的分类片段与页面缓存失效
+    Item.objects.filter(pk=image.item_id).update(updated_at=timezone.now())
+    bump_cache_version(CATALOG)
+    return variants
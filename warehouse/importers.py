@@ -0,0 +1,584 @@
+"""Streaming bulk import of inbound/outbound lines (CSV or JSON Lines).
+
+Each record is one movement line::
+
+    direction,code,batch_number,barcode,quantity,location,production_date,expiry_date,note
+    IN,6901234567890,B2026-01,690123456789001,120,A-01-01,2026-01-05,2027-01-05,
+    OUT,690123456789001,,,30,,,,
+
+``code`` is a batch barcode or an item SKU (batch barcode wins, like the
+scan page). Inbound lines by SKU need ``batch_number`` and, for a new batch,
+``barcode``. Outbound lines by SKU are picked first-expired-first-out.
+
+The input is read lazily and processed in chunks: codes are resolved with
+chunked ``in`` lookups, the whole chunk is planned in memory against locked
+rows, and the result is written with bulk statements in one bounded
+transaction per chunk, so memory stays flat whatever the file size. Only the
+locations the chunk touches are locked; a dry run on unlocked rows picks
+them first. Lines that fail validation are reported and skipped; the rest of
+the chunk is kept.
+"""
+from __future__ import annotations
+
+import csv
+import io
+import json
+from dataclasses import dataclass, field
+from datetime import date
+from decimal import Decimal
+from itertools import islice
+from typing import Callable, Dict, IO, Iterable, Iterator, List, Optional, Set, Tuple
+
+from django.db import transaction
+from django.db.models import IntegerField, Q
+from django.utils import timezone
+
+from .freespace import FreeSpaceIndex, free_space_index
+from .models import BatchLocation, Item, ItemBatch, Location, Movement, SearchTerm
+from .scancodes import scan_cache
+from .search import index_objects
+from .services import (
+    INDEX_PLAN_ATTEMPTS,
+    PUTAWAY_STRATEGIES,
+    _lock_locations,
+    _shift_column,
+    _shift_occupancy,
+    _units_volume,
+    record_movements,
+    refresh_item_stock,
+    resolve_putaway_strategy,
+    retry_on_deadlock,
+)
+from .stats import SCAN, bump_cache_version
+
+
+FIELDS = ('direction', 'code', 'batch_number', 'barcode', 'quantity', 'location', 'production_date', 'expiry_date', 'note')
+DEFAULT_CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 200
+
+
+class LineError(Exception):
+    pass
+
+
+@dataclass
+class ImportReport:
+    processed: int = 0
+    imported: int = 0
+    chunks: int = 0
+    error_count: int = 0
+    errors: List[Tuple[int, str]] = field(default_factory=list)
+
+    def add_error(self, line_no: int, message: str) -> None:
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line_no, message))
+
+
+@dataclass
+class _Line:
+    line_no: int
+    direction: str
+    code: str
+    quantity: int
+    batch_number: str = ''
+    barcode: str = ''
+    location_code: str = ''
+    production_date: Optional[date] = None
+    expiry_date: Optional[date] = None
+    note: str = ''
+    item: Optional[Item] = None
+    batch: Optional[ItemBatch] = None
+    location: Optional[Location] = None
+
+
+def iter_records(stream: IO, fmt: str) -> Iterator[Tuple[int, dict]]:
+    """Yield ``(line_no, record)`` lazily from a text or binary stream."""
+    if isinstance(stream.read(0), bytes):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == 'jsonl':
+        for line_no, raw in enumerate(stream, start=1):
+            raw = raw.strip()
+            if not raw:
+                continue
+            try:
+                record = json.loads(raw)
+            except json.JSONDecodeError as exc:
+                yield line_no, {'__error__': f'JSON 格式错误：{exc.msg}'}
+                continue
+            yield line_no, record if isinstance(record, dict) else {'__error__': '每行必须是 JSON 对象'}
+    else:
+        raise ValueError(f'Unsupported import format: {fmt}')
+
+
+def _parse_date(value) -> Optional[date]:
+    value = str(value or '').strip()
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise LineError(f'日期格式错误：{value}（应为 YYYY-MM-DD）')
+
+
+def _parse(line_no: int, record: dict) -> _Line:
+    if '__error__' in record:
+        raise LineError(record['__error__'])
+    values = {key: str(record.get(key) if record.get(key) is not None else '').strip() for key in FIELDS}
+    direction = (values['direction'] or Movement.Direction.IN).upper()
+    if direction not in Movement.Direction.values:
+        raise LineError(f'方向只能是 IN 或 OUT：{direction}')
+    if not values['code']:
+        raise LineError('缺少 code（SKU 或批次条码）')
+    try:
+        quantity = int(values['quantity'])
+    except ValueError:
+        raise LineError(f"数量必须是整数：{values['quantity']}")
+    if quantity <= 0:
+        raise LineError('数量必须大于 0')
+    return _Line(
+        line_no=line_no,
+        direction=direction,
+        code=values['code'],
+        quantity=quantity,
+        batch_number=values['batch_number'],
+        barcode=values['barcode'],
+        location_code=values['location'],
+        production_date=_parse_date(values['production_date']),
+        expiry_date=_parse_date(values['expiry_date']),
+        note=values['note'][:255],
+    )
+
+
+def guess_format(filename: str) -> str:
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def import_movements(
+    stream: IO,
+    fmt: str,
+    user=None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    on_error: Optional[Callable[[int, str], None]] = None,
+) -> ImportReport:
+    """Import a CSV/JSONL stream chunk by chunk; see the module docstring for the format."""
+    report = ImportReport()
+    records = iter_records(stream, fmt)
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            break
+        report.chunks += 1
+        lines: List[_Line] = []
+        for line_no, record in chunk:
+            report.processed += 1
+            try:
+                lines.append(_parse(line_no, record))
+            except LineError as exc:
+                _fail(report, on_error, line_no, str(exc))
+        if not lines:
+            continue
+        try:
+            imported, failures = _import_chunk(lines, user)
+        except Exception as exc:  # noqa: BLE001 - 整块回滚，逐行报告后继续下一块
+            failures = [(line.line_no, f'整块导入失败：{exc}') for line in lines]
+            imported = 0
+        report.imported += imported
+        for line_no, message in failures:
+            _fail(report, on_error, line_no, message)
+    return report
+
+
+def _fail(report: ImportReport, on_error, line_no: int, message: str) -> None:
+    report.add_error(line_no, message)
+    if on_error:
+        on_error(line_no, message)
+
+
+@retry_on_deadlock
+@transaction.atomic
+def _import_chunk(lines: List[_Line], user) -> Tuple[int, List[Tuple[int, str]]]:
+    importer = _ChunkImporter(lines, user)
+    importer.resolve()
+    importer.lock_and_load()
+    importer.plan()
+    importer.write()
+    return len(importer.done), importer.failures
+
+
+def _free_volume(loc: Location) -> Decimal:
+    return loc.capacity_volume - loc.occupied_volume
+
+
+class _ChunkImporter:
+    """Plans one chunk in memory against locked rows and writes it with bulk statements."""
+
+    def __init__(self, lines: List[_Line], user):
+        self.lines = lines
+        self.user = user
+        self.failures: List[Tuple[int, str]] = []
+        # (line, [((batch_id, location_id), units), ...])
+        self.done: List[Tuple[_Line, List[Tuple[Tuple[int, int], int]]]] = []
+        self.batches: Dict[int, ItemBatch] = {}
+        self.locations: Dict[int, Location] = {}
+        self.stock: Dict[Tuple[int, int], int] = {}
+        self.initial_stock: Dict[Tuple[int, int], BatchLocation] = {}
+        self.batch_delta: Dict[int, int] = {}
+        self.strategies: Dict[Tuple[str, int], object] = {}
+        # 本块新建批次所属的商品；即使这些行最终都被拒绝，批次已写入，库存汇总也要刷新
+        self.created_item_ids: Set[int] = set()
+        # 有入库行因货位容量不足被拒绝（试排时据此扩大候选货位）
+        self.short = False
+
+    def _reject(self, line: _Line, message: str) -> None:
+        self.failures.append((line.line_no, message))
+
+    def resolve(self) -> None:
+        codes = {line.code for line in self.lines} | {line.barcode for line in self.lines if line.barcode}
+        by_barcode = {b.barcode: b for b in ItemBatch.objects.filter(barcode__in=codes).select_related('item__category')}
+        by_sku = {i.sku_code: i for i in Item.objects.filter(sku_code__in=codes).select_related('category')}
+        location_codes = {line.location_code for line in self.lines if line.location_code}
+        by_location = {loc.code: loc for loc in Location.objects.filter(code__in=location_codes)}
+
+        pending_new: Dict[Tuple[int, str], ItemBatch] = {}
+        resolved: List[_Line] = []
+        for line in self.lines:
+            if line.location_code:
+                line.location = by_location.get(line.location_code)
+                if line.location is None:
+                    self._reject(line, f'货位不存在：{line.location_code}')
+                    continue
+            if line.code in by_barcode:
+                line.batch = by_barcode[line.code]
+                line.item = line.batch.item
+            elif line.code in by_sku:
+                line.item = by_sku[line.code]
+            else:
+                self._reject(line, f'未找到 SKU 或批次条码：{line.code}')
+                continue
+            if line.direction == Movement.Direction.IN and line.batch is None:
+                if not line.batch_number:
+                    self._reject(line, '按 SKU 入库时必须提供 batch_number')
+                    continue
+                pending_new.setdefault(
+                    (line.item.pk, line.batch_number),
+                    ItemBatch(
+                        item=line.item,
+                        batch_number=line.batch_number,
+                        barcode=line.barcode,
+                        production_date=line.production_date,
+                        expiry_date=line.expiry_date,
+                    ),
+                )
+            resolved.append(line)
+        self.lines = resolved
+        self._create_batches(pending_new)
+
+    def _create_batches(self, pending: Dict[Tuple[int, str], ItemBatch]) -> None:
+        if not pending:
+            return
+        item_ids = {item_id for item_id, _ in pending}
+        numbers = {number for _, number in pending}
+        existing = {
+            (b.item_id, b.batch_number): b
+            for b in ItemBatch.objects.filter(item_id__in=item_ids, batch_number__in=numbers).select_related('item')
+        }
+        missing = [b for key, b in pending.items() if key not in existing]
+        taken = set(ItemBatch.objects.filter(barcode__in=[b.barcode for b in missing]).values_list('barcode', flat=True))
+        creatable = [b for b in missing if b.barcode and b.barcode not in taken]
+        if creatable:
+            ItemBatch.objects.bulk_create(creatable)
+            # MySQL 的 bulk_create 不回填主键，按条码取回
+            created = list(ItemBatch.objects.filter(barcode__in=[b.barcode for b in creatable]).select_related('item'))
+            for b in created:
+                existing[(b.item_id, b.batch_number)] = b
+            self.created_item_ids.update(b.item_id for b in created)
+            # bulk_create 不触发信号，手动维护搜索索引与扫码缓存（新条码优先于同名 SKU）
+            index_objects(SearchTerm.Kind.BATCH, created)
+            scan_cache.discard(*(b.barcode for b in created))
+            transaction.on_commit(lambda: bump_cache_version(SCAN))
+        kept = []
+        for line in self.lines:
+            if line.batch is None and line.direction == Movement.Direction.IN:
+                line.batch = existing.get((line.item.pk, line.batch_number))
+                if line.batch is None:
+                    reason = '新批次缺少 barcode' if not line.barcode else f'批次条码已被占用：{line.barcode}'
+                    self._reject(line, reason)
+                    continue
+            kept.append(line)
+        self.lines = kept
+
+    def lock_and_load(self) -> None:
+        # 固定加锁顺序：货位（按 id）→ 批次（按 id）→ 批次货位
+        self.locations = self._lock_planned_locations()
+        self._load(lock=True)
+
+    def _batch_filter(self):
+        batch_ids = {line.batch.pk for line in self.lines if line.batch}
+        fefo_items = {line.item.pk for line in self.lines if line.direction == Movement.Direction.OUT and line.batch is None}
+        return ItemBatch.objects.filter(pk__in=batch_ids) | ItemBatch.objects.filter(item_id__in=fefo_items)
+
+    def _source_location_ids(self) -> Set[int]:
+        held = BatchLocation.objects.filter(batch__in=self._batch_filter().values('pk'))
+        return set(held.values_list('location_id', flat=True)) | {line.location.pk for line in self.lines if line.location}
+
+    def _lock_planned_locations(self) -> Dict[int, Location]:
+        """Lock the chunk's source locations plus the ones its inbound lines are planned into.
+
+        The plan is first run on an unlocked snapshot of the candidate
+        locations (see ``_dry_plan``). Only the picked rows are then locked by
+        id and re-checked, as ``services._confirm_plan`` does, so scanners
+        working on other locations are not blocked for the whole chunk.
+        """
+        sources = self._source_location_ids()
+        if not any(line.direction == Movement.Direction.IN for line in self.lines):
+            return _lock_locations(sources)
+        locked: Dict[int, Location] = {}
+        for _ in range(INDEX_PLAN_ATTEMPTS):
+            dry = self._dry_plan(sources)
+            planned = {
+                location_id
+                for line, moves in dry.done
+                if line.direction == Movement.Direction.IN
+                for (_, location_id), _ in moves
+            }
+            locked.update(_lock_locations((sources | planned) - set(locked)))
+            # 其他写入在试排与加锁之间占用了空间时重新试排（已加的锁保留到事务结束）
+            stale = [
+                pk
+                for pk in planned
+                if pk not in locked or _free_volume(locked[pk]) < _free_volume(dry.locations[pk])
+            ]
+            if not stale:
+                break
+        return locked
+
+    def _dry_plan(self, sources: Set[int]) -> '_ChunkImporter':
+        """Plan the chunk on unlocked rows of its candidate locations.
+
+        Candidates are the source locations plus the ones the shared
+        free-space index picks for the inbound demand. When they cannot take
+        every inbound line, more index picks are added; only when the index
+        has nothing more to offer, or after ``INDEX_PLAN_ATTEMPTS`` rounds,
+        does the plan read every location with room.
+        """
+        candidates = set(sources) | self._zero_volume_targets()
+        for attempt in range(INDEX_PLAN_ATTEMPTS):
+            picked = self._index_candidates(exclude=candidates)
+            # 索引再也挑不出新货位时直接按全部有空间的货位试排
+            if attempt and not picked:
+                break
+            candidates |= picked
+            dry = self._dry_run(Location.objects.filter(pk__in=candidates))
+            if not dry.short:
+                return dry
+        return self._dry_run(Location.objects.filter(Q(pk__in=sources) | Q(pk__in=Location.objects.with_room().values('pk'))))
+
+    def _dry_run(self, locations) -> '_ChunkImporter':
+        dry = _ChunkImporter(self.lines, self.user)
+        dry.strategies = self.strategies
+        dry.locations = {loc.pk: loc for loc in locations}
+        dry._load(lock=False)
+        dry.plan()
+        return dry
+
+    def _inbound_lines(self) -> List[_Line]:
+        return [line for line in self.lines if line.direction == Movement.Direction.IN and line.batch is not None]
+
+    def _zero_volume_targets(self) -> Set[int]:
+        # 零体积商品未指定货位时放入编码最小的货位，与 _plan_in 一致
+        if any(line.location is None and not line.batch.item.packaging_volume for line in self._inbound_lines()):
+            return set(Location.objects.order_by('code').values_list('pk', flat=True)[:1])
+        return set()
+
+    def _index_candidates(self, exclude: Set[int]) -> Set[int]:
+        """Locations the shared index would pick for the inbound lines, outside ``exclude``.
+
+        The index is only read; what earlier lines take is tracked locally so
+        two lines do not both count on the same free space.
+        """
+        picked: Set[int] = set()
+        claimed: Dict[int, Decimal] = {}
+        with free_space_index() as index:
+            for line in self._inbound_lines():
+                per_unit = line.batch.item.packaging_volume or Decimal('0')
+                if per_unit <= 0:
+                    continue
+                strategy = self._strategy(line.batch)
+                used = set(exclude)
+                remaining = line.quantity
+                while remaining > 0:
+                    location_id = strategy.pick(index, per_unit, remaining, used)
+                    if location_id is None:
+                        break
+                    used.add(location_id)
+                    available = index.available(location_id) - claimed.get(location_id, Decimal('0'))
+                    take = min(int(available // per_unit), remaining) if available > 0 else 0
+                    if take <= 0:
+                        continue
+                    picked.add(location_id)
+                    claimed[location_id] = claimed.get(location_id, Decimal('0')) + _units_volume(take, per_unit)
+                    remaining -= take
+        return picked
+
+    def _strategy(self, batch: ItemBatch):
+        name = resolve_putaway_strategy(batch.item)
+        if (name, batch.pk) not in self.strategies:
+            self.strategies[(name, batch.pk)] = PUTAWAY_STRATEGIES[name](batch.item, batch)
+        return self.strategies[(name, batch.pk)]
+
+    def _load(self, lock: bool) -> None:
+        """Load batches and placements (row-locked when ``lock``) and index ``self.locations``."""
+        batches = self._batch_filter()
+        # 只读取已加锁货位上的批次货位；加锁前读取货位列表之后新增的放置不参与本块
+        held = BatchLocation.objects.filter(batch__in=batches.values('pk'), location_id__in=list(self.locations))
+        if lock:
+            batches, held = batches.select_for_update(), held.select_for_update()
+        self.batches = {b.pk: b for b in batches.select_related('item__category').order_by('id')}
+        for bl in held:
+            self.stock[(bl.batch_id, bl.location_id)] = bl.quantity_units
+            self.initial_stock[(bl.batch_id, bl.location_id)] = bl
+        for line in self.lines:
+            if line.batch is not None:
+                line.batch = self.batches[line.batch.pk]
+        self.index = FreeSpaceIndex((loc.pk, loc.code, _free_volume(loc)) for loc in self.locations.values())
+
+    def plan(self) -> None:
+        for line in self.lines:
+            if line.direction == Movement.Direction.IN:
+                moves = self._plan_in(line)
+            else:
+                moves = self._plan_out(line)
+            if moves is None:
+                continue
+            self.done.append((line, moves))
+
+    def _plan_in(self, line: _Line) -> Optional[List[Tuple[Tuple[int, int], int]]]:
+        batch = line.batch
+        per_unit = batch.item.packaging_volume or Decimal('0')
+        picks: List[Tuple[int, int]] = []
+        remaining = line.quantity
+        if per_unit <= 0:
+            target = line.location or min(self.locations.values(), key=lambda loc: loc.code, default=None)
+            if target is None:
+                self._reject(line, '没有可用货位')
+                return None
+            picks.append((target.pk, remaining))
+            remaining = 0
+        else:
+            used = set()
+            if line.location is not None:
+                used.add(line.location.pk)
+                available = self.index.available(line.location.pk) or Decimal('0')
+                take = min(int(available // per_unit), remaining) if available > 0 else 0
+                if take > 0:
+                    picks.append((line.location.pk, take))
+                    remaining -= take
+            strategy = self._strategy(batch)
+            while remaining > 0:
+                location_id = strategy.pick(self.index, per_unit, remaining, used)
+                if location_id is None:
+                    break
+                used.add(location_id)
+                take = min(int(self.index.available(location_id) // per_unit), remaining)
+                if take > 0:
+                    picks.append((location_id, take))
+                    remaining -= take
+        if remaining > 0:
+            self.short = True
+            self._reject(line, f'货位容量不足，还差 {remaining}')
+            return None
+        for location_id, take in picks:
+            self.index.adjust(location_id, -_units_volume(take, per_unit))
+            key = (batch.pk, location_id)
+            self.stock[key] = self.stock.get(key, 0) + take
+        self.batch_delta[batch.pk] = self.batch_delta.get(batch.pk, 0) + line.quantity
+        return [((batch.pk, location_id), take) for location_id, take in picks]
+
+    def _plan_out(self, line: _Line) -> Optional[List[Tuple[Tuple[int, int], int]]]:
+        if line.batch is not None:
+            candidates = [key for key, qty in self.stock.items() if key[0] == line.batch.pk and qty > 0]
+            candidates.sort(key=lambda key: (key[1] != getattr(line.location, 'pk', None), -self.stock[key]))
+        else:
+            # 按 SKU 出库：先到期先出，无过期日期的批次最后
+            batches = sorted(
+                (b for b in self.batches.values() if b.item_id == line.item.pk),
+                key=lambda b: (b.expiry_date is None, b.expiry_date or date.max, b.created_at, b.pk),
+            )
+            order = {b.pk: i for i, b in enumerate(batches)}
+            candidates = [key for key, qty in self.stock.items() if key[0] in order and qty > 0]
+            candidates.sort(key=lambda key: (order[key[0]], self.locations[key[1]].code))
+        if sum(self.stock[key] for key in candidates) < line.quantity:
+            self._reject(line, '出库数量超过已上架库存')
+            return None
+        picks = []
+        remaining = line.quantity
+        for key in candidates:
+            if remaining <= 0:
+                break
+            take = min(self.stock[key], remaining)
+            self.stock[key] -= take
+            batch = self.batches[key[0]]
+            self.index.adjust(key[1], _units_volume(take, batch.item.packaging_volume))
+            self.batch_delta[batch.pk] = self.batch_delta.get(batch.pk, 0) - take
+            picks.append((key, take))
+            remaining -= take
+        return picks
+
+    def write(self) -> None:
+        if not self.done:
+            refresh_item_stock(self.created_item_ids)
+            return
+        created, emptied, changed = [], [], {}
+        occupancy: Dict[Location, Decimal] = {}
+        for key, qty in self.stock.items():
+            before = self.initial_stock.get(key)
+            delta = qty - (before.quantity_units if before else 0)
+            if not delta:
+                continue
+            batch = self.batches[key[0]]
+            loc = self.locations[key[1]]
+            occupancy[loc] = occupancy.get(loc, Decimal('0')) + _units_volume(delta, batch.item.packaging_volume)
+            if before is None:
+                created.append(BatchLocation(batch_id=key[0], location_id=key[1], quantity_units=qty))
+            elif qty <= 0:
+                emptied.append(before.pk)
+            else:
+                changed[before.pk] = delta
+        BatchLocation.objects.filter(pk__in=emptied).delete()
+        _shift_column(BatchLocation.objects.all(), 'id', 'quantity_units', changed, IntegerField())
+        BatchLocation.objects.bulk_create(created)
+        _shift_occupancy(occupancy)
+        _shift_column(
+            ItemBatch.objects.all(),
+            'id',
+            'quantity_units',
+            self.batch_delta,
+            IntegerField(),
+            updated_at=timezone.now(),
+        )
+        refresh_item_stock({batch.item_id for batch in self.batches.values()} | self.created_item_ids)
+        record_movements(Movement.objects.bulk_create(list(self._movements())))
+
+    def _movements(self) -> Iterable[Movement]:
+        for line, moves in self.done:
+            # 按 SKU 出库可能跨多个批次，每个批次各记一条明细
+            per_batch: Dict[int, List[int]] = {}
+            quantities: Dict[int, int] = {}
+            for (batch_id, location_id), take in moves:
+                per_batch.setdefault(batch_id, []).append(location_id)
+                quantities[batch_id] = quantities.get(batch_id, 0) + take
+            for batch_id, location_ids in per_batch.items():
+                location = line.location or (self.locations[location_ids[0]] if len(location_ids) == 1 else None)
+                yield Movement(
+                    batch=self.batches[batch_id],
+                    direction=line.direction,
+                    quantity_units=quantities[batch_id],
+                    user=self.user,
+                    location=location,
+                    note=line.note or f'批量导入第 {line.line_no} 行',
+                )
@@ -0,0 +1,173 @@
+import asyncio
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from warehouse.models import ApiToken, BatchLocation, Item, ItemBatch, Location
+from warehouse.services import refresh_item_stock
+
+
+class Command(BaseCommand):
+    help = (
+        "用进程内测试客户端对比 ASGI（AsyncClient）与 WSGI（Client）处理扫码、临期、库存总览与扫码接口的"
+        "吞吐量与尾延迟（测试数据写入单独创建的测试数据库，不读写现有数据）"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=32, help='并发请求数，默认 32')
+        parser.add_argument('--requests', type=int, default=400, help='每个页面、每种方式的请求总数，默认 400')
+        parser.add_argument('--items', type=int, default=50, help='测试商品数（每个商品 4 个批次），默认 50')
+        parser.add_argument(
+            '--noinput', '--no-input', action='store_false', dest='interactive', help='测试数据库已存在时不提示，直接重建'
+        )
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError('--concurrency 与 --requests 必须为正数')
+        setup_test_environment()
+        workdir = tempfile.mkdtemp(prefix='wms-bench-')
+        if connection.vendor == 'sqlite':
+            # 共享缓存的内存测试库只有表级锁，并发请求会报 table is locked，改用临时文件库
+            connection.settings_dict['TEST']['NAME'] = os.path.join(workdir, 'benchmark.sqlite3')
+        # 基准数据只写入测试数据库，结束后整库删除
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=not options['interactive'], serialize=False)
+        try:
+            user, key, targets = self._setup('BENCH', options['items'])
+            width = max(len(label) for label, _ in targets)
+            # 令牌请求头对会话页面无影响，供扫码接口认证
+            headers = {'Authorization': f'Token {key}'}
+            self.stdout.write(f"{'页面':<{width}}  方式  {'请求/秒':>8}  {'平均ms':>7}  {'p95ms':>7}  {'p99ms':>7}  {'最大ms':>7}")
+            for label, url in targets:
+                for mode, run in (('WSGI', self._run_wsgi), ('ASGI', self._run_asgi)):
+                    latencies, wall, failures = run(user, url, headers, options)
+                    if failures:
+                        raise CommandError(f"{label} {mode}：{failures} 个请求失败")
+                    latencies.sort()
+                    self.stdout.write(
+                        f"{label:<{width}}  {mode}  {len(latencies) / wall:>8.1f}  {statistics.mean(latencies):>7.1f}  "
+                        f"{self._percentile(latencies, 0.95):>7.1f}  {self._percentile(latencies, 0.99):>7.1f}  {latencies[-1]:>7.1f}"
+                    )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            shutil.rmtree(workdir, ignore_errors=True)
+            teardown_test_environment()
+
+    @staticmethod
+    def _percentile(sorted_values, ratio):
+        return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * ratio))]
+
+    def _run_wsgi(self, user, url, headers, options):
+        latencies = []
+        failures = 0
+        lock = threading.Lock()
+        local = threading.local()
+
+        def request(_):
+            nonlocal failures
+            # 每个线程一个已登录的客户端，复用会话
+            if not hasattr(local, 'client'):
+                local.client = Client()
+                local.client.force_login(user)
+            started = time.perf_counter()
+            response = local.client.get(url, headers=headers)
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                latencies.append(elapsed)
+                failures += response.status_code != 200
+
+        def close(_):
+            connection.close()
+
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            started = time.perf_counter()
+            list(pool.map(request, range(options['requests'])))
+            wall = time.perf_counter() - started
+            list(pool.map(close, range(options['concurrency'])))
+        return latencies, wall, failures
+
+    def _run_asgi(self, user, url, headers, options):
+        async def run():
+            latencies = []
+            failures = 0
+            queue = asyncio.Queue()
+            for i in range(options['requests']):
+                queue.put_nowait(i)
+
+            async def worker():
+                nonlocal failures
+                client = AsyncClient()
+                await client.aforce_login(user)
+                while not queue.empty():
+                    queue.get_nowait()
+                    started = time.perf_counter()
+                    response = await client.get(url, headers=headers)
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    failures += response.status_code != 200
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(options['concurrency'])))
+            return latencies, time.perf_counter() - started, failures
+
+        return asyncio.run(run())
+
+    def _setup(self, prefix, item_count):
+        today = timezone.localdate()
+        # 没有可用密码，只通过 force_login 登录
+        user = get_user_model().objects.create_superuser(prefix.lower(), f'{prefix.lower()}@example.com', None)
+        token = ApiToken(user=user, name=prefix)
+        key = token.generate_key()
+        token.save()
+        locations = Location.objects.bulk_create(
+            [
+                Location(code=f'{prefix}-L{i:03d}', name=f'基准货位{i}', capacity_volume=Decimal('100000'))
+                for i in range(max(1, item_count // 5))
+            ]
+        )
+        items = Item.objects.bulk_create(
+            [
+                Item(name=f'{prefix} 基准商品{i:04d}', sku_code=f'{prefix}-{i:04d}', packaging_volume=Decimal('1.000'))
+                for i in range(item_count)
+            ]
+        )
+        batches = ItemBatch.objects.bulk_create(
+            [
+                ItemBatch(
+                    item=item,
+                    batch_number=f'{prefix}-{i:04d}-{n}',
+                    barcode=f'{prefix}-{i:04d}-{n}',
+                    expiry_date=today + timedelta(days=(i + n * 17) % 120),
+                    quantity_units=20,
+                )
+                for i, item in enumerate(items)
+                for n in range(4)
+            ]
+        )
+        BatchLocation.objects.bulk_create(
+            [
+                BatchLocation(batch=batch, location=locations[i % len(locations)], quantity_units=20)
+                for i, batch in enumerate(batches)
+            ]
+        )
+        refresh_item_stock([item.pk for item in items])
+        item, batch = items[0], batches[0]
+        targets = [
+            ('scan', f"{reverse('warehouse:scan')}?code={item.sku_code}"),
+            ('near_expiry', reverse('warehouse:near_expiry')),
+            ('inventory', reverse('warehouse:inventory')),
+            ('api_scan', reverse('warehouse:api_scan', kwargs={'code': batch.barcode})),
+        ]
+        return user, key, targets
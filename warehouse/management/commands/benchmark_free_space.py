@@ -0,0 +1,75 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from warehouse.freespace import free_space_index, invalidate_free_space_index
+from warehouse.models import Item, Location
+from warehouse.services import PUTAWAY_STRATEGIES, PlacementPlan, _plan_by_scan, plan_inbound
+
+
+class Command(BaseCommand):
+    help = "对比空闲空间索引与逐货位扫描的入库规划耗时（在回滚事务中生成测试货位，不影响现有数据）"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--locations', type=int, default=5000, help='生成的测试货位数量，默认 5000')
+        parser.add_argument('--rounds', type=int, default=200, help='每种方式规划的次数，默认 200')
+        parser.add_argument('--strategy', choices=list(PUTAWAY_STRATEGIES), default='best_fit', help='索引方式使用的上架策略')
+        parser.add_argument('--seed', type=int, default=7, help='随机种子')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            item = self._seed(rng, options['locations'])
+            quantities = [rng.randint(1, 40) for _ in range(options['rounds'])]
+
+            invalidate_free_space_index()
+            started = time.perf_counter()
+            with free_space_index() as index:
+                size = len(index)
+            build_ms = (time.perf_counter() - started) * 1000
+
+            scan = self._measure(
+                lambda qty: _plan_by_scan(PlacementPlan(item, qty, item.packaging_volume, []), None),
+                quantities,
+            )
+            indexed = self._measure(lambda qty: plan_inbound(item, qty, strategy=options['strategy']), quantities)
+            transaction.set_rollback(True)
+        invalidate_free_space_index()
+
+        self.stdout.write(f"货位数：{size}，索引构建：{build_ms:.1f} ms")
+        self.stdout.write(f"{'方式':<18}{'平均 ms':>10}{'p95 ms':>10}{'平均查询数':>12}")
+        for label, (timings, queries) in (('scan', scan), (f"index/{options['strategy']}", indexed)):
+            p95 = sorted(timings)[max(0, int(len(timings) * 0.95) - 1)]
+            self.stdout.write(f"{label:<18}{statistics.mean(timings):>10.2f}{p95:>10.2f}{statistics.mean(queries):>12.1f}")
+
+    def _seed(self, rng, count):
+        locations = []
+        for i in range(count):
+            capacity = Decimal(rng.randint(10, 200))
+            # 约一半货位部分占用，模拟运行中的仓库
+            filled = Decimal(rng.randint(50, 100)) / 100 if rng.random() < 0.5 else Decimal('0')
+            locations.append(
+                Location(
+                    code=f'BENCH-{i:06d}',
+                    name=f'基准货位{i}',
+                    capacity_volume=capacity,
+                    occupied_volume=(capacity * filled).quantize(Decimal('0.001')),
+                )
+            )
+        Location.objects.bulk_create(locations, batch_size=1000)
+        return Item.objects.create(name='基准商品', sku_code='BENCH-FREE-SPACE', packaging_volume=Decimal('1.500'))
+
+    def _measure(self, plan, quantities):
+        timings, queries = [], []
+        for qty in quantities:
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                plan(qty)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries.append(len(ctx))
+        return timings, queries
@@ -0,0 +1,36 @@
+import argparse
+
+from django.core.management.base import BaseCommand, CommandError
+
+from warehouse.queryplans import explain, full_scans, plan_checks
+
+
+class Command(BaseCommand):
+    help = (
+        "对现有数据的关键查询执行 EXPLAIN，发现全表扫描即报错（只读，不生成数据、不更新统计信息）；"
+        "按固定数据量检查见 warehouse.tests.test_query_plans"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--search', default='商品', help='检查全局搜索计划时使用的关键字，默认“商品”')
+        # 兼容旧用法：命令只检查现有数据，已不再生成测试数据
+        parser.add_argument('--no-seed', action='store_true', help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        checks = plan_checks(options['search'])
+        if not checks:
+            raise CommandError('没有批次或货位数据，无法检查查询计划')
+        failures = []
+        for label, model, queryset in checks:
+            plan = explain(queryset)
+            table = model._meta.db_table
+            if options['verbosity'] > 1:
+                self.stdout.write(f"--- {label}\n{plan}")
+            if table in full_scans(plan):
+                failures.append(label)
+                self.stderr.write(self.style.ERROR(f"{label}：{table} 全表扫描"))
+            else:
+                self.stdout.write(f"{label}：通过")
+        if failures:
+            raise CommandError(f"{len(failures)} 个查询出现全表扫描：{'，'.join(failures)}")
+        self.stdout.write(self.style.SUCCESS('关键查询均走索引'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from warehouse.images import generate_variants, is_current
+from warehouse.models import ItemImage
+
+
+class Command(BaseCommand):
+    help = "为已有商品图片补生成缩略图（WebP/JPEG，去除 EXIF）；默认跳过已是最新的图片"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='全部重新生成（如修改了 WAREHOUSE_IMAGE_WIDTHS）')
+
+    def handle(self, *args, **options):
+        generated = skipped = failed = 0
+        for image in ItemImage.objects.exclude(image='').order_by('pk').iterator(chunk_size=200):
+            if not options['force'] and is_current(image):
+                skipped += 1
+                continue
+            if generate_variants(image):
+                generated += 1
+            else:
+                failed += 1
+                self.stderr.write(f"无法处理：{image.image.name}")
+        self.stdout.write(self.style.SUCCESS(f'已生成 {generated} 张，跳过 {skipped} 张，失败 {failed} 张'))
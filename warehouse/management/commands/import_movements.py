@@ -0,0 +1,37 @@
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from warehouse.importers import DEFAULT_CHUNK_SIZE, guess_format, import_movements
+
+
+class Command(BaseCommand):
+    help = "流式批量导入出入库明细（CSV / JSON Lines），按块规划货位并批量写入，逐行报告错误"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='导入文件路径，使用 - 表示标准输入')
+        parser.add_argument('--format', choices=('csv', 'jsonl'), help='文件格式，默认按扩展名判断')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help=f'每个事务处理的行数，默认 {DEFAULT_CHUNK_SIZE}')
+        parser.add_argument('--user', help='记录为操作人的用户名')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = get_user_model().objects.get(username=options['user'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"用户不存在：{options['user']}")
+        path = options['path']
+        fmt = options['format'] or guess_format(path)
+
+        def report_error(line_no, message):
+            self.stderr.write(f"第 {line_no} 行：{message}")
+
+        if path == '-':
+            report = import_movements(sys.stdin, fmt, user=user, chunk_size=options['chunk_size'], on_error=report_error)
+        else:
+            with open(path, 'rb') as stream:
+                report = import_movements(stream, fmt, user=user, chunk_size=options['chunk_size'], on_error=report_error)
+        style = self.style.SUCCESS if not report.error_count else self.style.WARNING
+        self.stdout.write(style(f"共 {report.processed} 行，成功 {report.imported} 行，失败 {report.error_count} 行（{report.chunks} 块）"))
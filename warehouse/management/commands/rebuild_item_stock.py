@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from warehouse.models import Item, ItemStock
+from warehouse.services import STOCK_FIELDS, measure_item_stock, refresh_item_stock, refresh_stale_item_stock
+
+
+class Command(BaseCommand):
+    help = "重建或校验商品库存汇总（ItemStock）；每天零点后定时执行 --stale 刷新跨天的临期数量"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true', help='只校验，不写入；存在偏差时返回非零状态')
+        parser.add_argument('--stale', action='store_true', help='只刷新计算日期早于今天的汇总行（每日定时任务）')
+        parser.add_argument('--chunk-size', type=int, default=500, help='每批处理的商品数，默认 500')
+
+    def handle(self, *args, **options):
+        if options['stale']:
+            refreshed = refresh_stale_item_stock(options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(f"已刷新 {refreshed} 个跨天商品的临期数量"))
+            return
+        item_ids = list(Item.objects.order_by('id').values_list('id', flat=True))
+        chunk_size = options['chunk_size']
+        if options['verify']:
+            drifted = 0
+            for start in range(0, len(item_ids), chunk_size):
+                chunk = item_ids[start:start + chunk_size]
+                stored = {row.item_id: row for row in ItemStock.objects.filter(item_id__in=chunk)}
+                for item_id, expected in measure_item_stock(chunk).items():
+                    row = stored.get(item_id)
+                    if row is None:
+                        if expected['batch_count']:
+                            drifted += 1
+                            self.stderr.write(f"商品 {item_id}：缺少库存汇总")
+                        continue
+                    diffs = [
+                        f"{name} {getattr(row, name)} ≠ {expected[name]}"
+                        for name in STOCK_FIELDS
+                        if getattr(row, name) != expected[name]
+                    ]
+                    if diffs:
+                        drifted += 1
+                        self.stderr.write(f"商品 {item_id}：{'，'.join(diffs)}")
+            if drifted:
+                raise CommandError(f"{drifted} 个商品的库存汇总存在偏差")
+            self.stdout.write(self.style.SUCCESS(f"已校验 {len(item_ids)} 个商品，库存汇总一致"))
+            return
+
+        for start in range(0, len(item_ids), chunk_size):
+            with transaction.atomic():
+                refresh_item_stock(item_ids[start:start + chunk_size])
+        self.stdout.write(self.style.SUCCESS(f"已重建 {len(item_ids)} 个商品的库存汇总"))
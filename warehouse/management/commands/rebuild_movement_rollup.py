@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from warehouse.services import rebuild_movement_rollup
+
+
+class Command(BaseCommand):
+    help = "根据出入库明细重建商品每日进出汇总（高频进出页面的数据来源）"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=0, help='只重建最近 N 天（含今天），默认全部历史')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['days'] > 0:
+            since = timezone.localdate() - timezone.timedelta(days=options['days'] - 1)
+        with transaction.atomic():
+            rows = rebuild_movement_rollup(since)
+        scope = f"{since} 起" if since else '全部历史'
+        self.stdout.write(self.style.SUCCESS(f"已重建{scope}的每日汇总，共 {rows} 行"))
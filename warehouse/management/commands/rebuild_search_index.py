@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from warehouse.models import SearchTerm
+from warehouse.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "重建商品、批次、货位的搜索索引（批量导入或直接改库后使用）"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--kind',
+            action='append',
+            choices=SearchTerm.Kind.values,
+            help='只重建指定类型，可重复指定；默认全部',
+        )
+        parser.add_argument('--chunk-size', type=int, default=1000, help='每批处理的记录数，默认 1000')
+
+    def handle(self, *args, **options):
+        total = rebuild_search_index(options['kind'], chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'已重建 {total} 条记录的搜索索引'))
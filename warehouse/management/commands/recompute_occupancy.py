@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from warehouse.models import Location
+from warehouse.services import recompute_occupancy
+
+
+class Command(BaseCommand):
+    help = "按批次货位明细重新计算货位已用体积，修复与存储值之间的偏差"
+
+    def add_arguments(self, parser):
+        parser.add_argument('codes', nargs='*', help='只校正指定编码的货位，默认全部')
+        parser.add_argument('--dry-run', action='store_true', help='只报告偏差，不写回数据库')
+
+    def handle(self, *args, **options):
+        location_ids = None
+        if options['codes']:
+            location_ids = list(Location.objects.filter(code__in=options['codes']).values_list('id', flat=True))
+        with transaction.atomic():
+            drifted = recompute_occupancy(location_ids, dry_run=options['dry_run'])
+        for loc, stored, actual in drifted:
+            self.stdout.write(f"{loc.code}: 存储 {stored} -> 实际 {actual}")
+        verb = '发现' if options['dry_run'] else '已校正'
+        self.stdout.write(self.style.SUCCESS(f"{verb} {len(drifted)} 个货位的占用偏差"))
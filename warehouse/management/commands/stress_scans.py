@@ -0,0 +1,304 @@
+import logging
+import random
+import re
+import statistics
+import threading
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.messages import get_messages
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q, Sum
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from warehouse.models import ApiToken, BatchLocation, Item, ItemBatch, ItemStock, Location, Movement
+from warehouse.services import (
+    PUTAWAY_STRATEGIES,
+    PutawayStrategy,
+    allocate_inbound,
+    measure_item_stock,
+    plan_inbound,
+    recompute_occupancy,
+    register_putaway_strategy,
+    release_outbound,
+    retry_on_deadlock,
+)
+
+# services 直接调用服务层；view 经入库/出库页面（按商品+批次号入库，会同步条码）；
+# api 经 /api/ 接口（按 SKU 入库与先到期先出）。后两者走的是线上的完整加锁路径
+PATHS = ('services', 'view', 'api')
+UNPLACED = re.compile(r'未分配货位的数量为 (\d+)')
+# 需求要求的最低扫码速率（次/秒）
+MIN_RATE = 50.0
+
+
+class StressStrategy(PutawayStrategy):
+    """First fit over the stress run's own locations, so planning never touches real ones."""
+
+    name = 'stress_scans'
+    label = '压测货位（仅压测期间注册）'
+    location_ids = frozenset()
+
+    def pick(self, index, per_unit, remaining, exclude):
+        for location_id in sorted(self.location_ids):
+            available = index.available(location_id)
+            if location_id not in exclude and available is not None and available >= per_unit:
+                return location_id
+        return None
+
+
+class Command(BaseCommand):
+    help = "多线程并发入库/出库压测，结束后校验库存、货位分配与占用体积是否一致（使用独立的 STRESS- 测试数据）"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=16, help='并发线程数，默认 16')
+        parser.add_argument('--seconds', type=float, default=10.0, help='压测时长（秒），默认 10')
+        parser.add_argument('--rate', type=float, default=60.0, help='目标总扫码次数/秒，默认 60')
+        parser.add_argument('--batches', type=int, default=4, help='参与争用的批次数，越少冲突越多，默认 4')
+        parser.add_argument('--locations', type=int, default=12, help='测试货位数，默认 12')
+        parser.add_argument(
+            '--min-rate',
+            type=float,
+            default=MIN_RATE,
+            help=f'实测扫码速率低于该值（次/秒）时判定失败，默认 {MIN_RATE:g}，0 表示不检查',
+        )
+        parser.add_argument('--keep', action='store_true', help='保留测试数据，便于事后排查')
+        parser.add_argument(
+            '--paths',
+            default=','.join(PATHS),
+            help=f"每次扫码随机选用的调用路径，逗号分隔：{'/'.join(PATHS)}，默认全部",
+        )
+
+    def handle(self, *args, **options):
+        paths = [path.strip() for path in options['paths'].split(',') if path.strip()]
+        if not paths or set(paths) - set(PATHS):
+            raise CommandError(f"--paths 只能取 {'/'.join(PATHS)}")
+        prefix = f"STRESS-{int(time.time())}"
+        # 测试数据在任何异常下都要清理，规划只用压测货位
+        register_putaway_strategy(StressStrategy)
+        try:
+            self._stress(prefix, paths, options)
+        finally:
+            PUTAWAY_STRATEGIES.pop(StressStrategy.name, None)
+            if options['keep']:
+                # 保留的测试商品不能引用其他进程中不存在的上架策略
+                Item.objects.filter(sku_code=prefix).update(putaway_strategy='')
+            else:
+                self._cleanup(prefix)
+
+    def _stress(self, prefix, paths, options):
+        batch_ids, location_ids = self._setup(prefix, options['batches'], options['locations'])
+        stats = {'in': 0, 'out': 0, 'rejected': 0, 'errors': 0, 'latency': [], **{path: 0 for path in paths}}
+        unplaced = {batch_id: 0 for batch_id in batch_ids}
+        lock = threading.Lock()
+        deadline = time.monotonic() + options['seconds']
+        interval = options['workers'] / options['rate'] if options['rate'] > 0 else 0
+
+        def worker(seed):
+            rng = random.Random(seed)
+            try:
+                clients = self._clients(paths)
+                while time.monotonic() < deadline:
+                    started = time.perf_counter()
+                    path = rng.choice(paths)
+                    try:
+                        batch_id = rng.choice(batch_ids)
+                        if path == 'services':
+                            kind, short = self._scan(rng, batch_id, location_ids)
+                        else:
+                            scan = self._scan_view if path == 'view' else self._scan_api
+                            kind, short = scan(clients[path], rng, batch_id, location_ids)
+                    except Exception as exc:  # noqa: BLE001 - 统计后继续压测
+                        kind = 'errors'
+                        self.stderr.write(f"[error] {path} {type(exc).__name__}: {exc}")
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        stats[kind] += 1
+                        stats[path] += 1
+                        if kind == 'in':
+                            unplaced[batch_id] += short
+                        stats['latency'].append(elapsed * 1000)
+                    if interval > elapsed:
+                        time.sleep(interval - elapsed)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(options['workers'])]
+        # 测试客户端需要 testserver 主机名；库存不足的 409 是预期结果，不逐条记录警告
+        setup_test_environment()
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.ERROR)
+        try:
+            started = time.monotonic()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            wall = time.monotonic() - started
+        finally:
+            request_logger.setLevel(level)
+            teardown_test_environment()
+
+        scans = stats['in'] + stats['out'] + stats['rejected']
+        latency = sorted(stats['latency']) or [0.0]
+        self.stdout.write(
+            f"扫码 {scans} 次（{scans / wall:.1f}/s），入库 {stats['in']}，出库 {stats['out']}，"
+            f"库存不足拒绝 {stats['rejected']}，异常 {stats['errors']}"
+            f"（{'，'.join(f'{path} {stats[path]}' for path in paths)}）"
+        )
+        self.stdout.write(
+            f"延迟 ms：平均 {statistics.mean(latency):.1f}，p95 {latency[int(len(latency) * 0.95) - 1]:.1f}，最大 {latency[-1]:.1f}"
+        )
+
+        problems = self._verify(batch_ids, location_ids, unplaced)
+        for problem in problems:
+            self.stderr.write(self.style.ERROR(problem))
+        if problems or stats['errors']:
+            raise CommandError(f"一致性校验失败：{len(problems)} 项不一致，{stats['errors']} 次异常")
+        self.stdout.write(self.style.SUCCESS('库存、货位分配与占用体积一致'))
+        if scans / wall < options['min_rate']:
+            raise CommandError(f"扫码速率 {scans / wall:.1f}/s 低于要求的 {options['min_rate']:g}/s")
+
+    def _setup(self, prefix, batch_count, location_count):
+        # 不设密码（不可用于登录）：页面用 force_login，接口用令牌
+        self.user = get_user_model().objects.create_superuser(prefix.lower(), f'{prefix.lower()}@example.com', None)
+        token = ApiToken(user=self.user, name=prefix)
+        self.token_key = token.generate_key()
+        token.save()
+        locations = [
+            Location.objects.create(code=f'{prefix}-L{i:03d}', name=f'压测货位{i}', capacity_volume=Decimal('500'))
+            for i in range(location_count)
+        ]
+        StressStrategy.location_ids = frozenset(loc.pk for loc in locations)
+        item = Item.objects.create(
+            name=f'{prefix} 压测商品',
+            sku_code=prefix,
+            packaging_volume=Decimal('1.000'),
+            putaway_strategy=StressStrategy.name,
+        )
+        batches = [
+            ItemBatch.objects.create(item=item, batch_number=f'{prefix}-B{i}', barcode=f'{prefix}-B{i}')
+            for i in range(batch_count)
+        ]
+        self.item = item
+        self.batch_numbers = {b.pk: b.batch_number for b in batches}
+        self.location_codes = {loc.pk: loc.code for loc in locations}
+        return [b.pk for b in batches], [loc.pk for loc in locations]
+
+    def _clients(self, paths):
+        # 每个线程各用一组客户端（Client 不是线程安全的）
+        clients = {}
+        if 'view' in paths:
+            clients['view'] = Client()
+            clients['view'].force_login(self.user)
+        if 'api' in paths:
+            clients['api'] = Client(HTTP_AUTHORIZATION=f'Token {self.token_key}')
+        return clients
+
+    def _barcode(self, rng, batch_id):
+        # 两个条码轮换，使入库每次都可能改写批次条码（保存批次会刷新并锁定库存汇总）
+        return self.batch_numbers[batch_id] + rng.choice(('', '-X'))
+
+    def _scan_view(self, client, rng, batch_id, location_ids):
+        location_id = rng.choice(location_ids)
+        qty = rng.randint(1, 20)
+        if rng.random() < 0.55:
+            data = {
+                'item_id': self.item.pk,
+                'batch_number': self.batch_numbers[batch_id],
+                'barcode': self._barcode(rng, batch_id),
+                'quantity_units': qty,
+                'location': location_id,
+            }
+            response = client.post(reverse('warehouse:inbound'), data)
+            if response.status_code != 302:
+                # 容量不足时重新显示表单
+                return self._rejected(response)
+            notes = [UNPLACED.search(str(message)) for message in get_messages(response.wsgi_request)]
+            return 'in', sum(int(match.group(1)) for match in notes if match)
+        data = {'batch': batch_id, 'quantity_units': qty, 'location': location_id}
+        response = client.post(reverse('warehouse:outbound'), data)
+        return ('out', 0) if response.status_code == 302 else self._rejected(response)
+
+    def _scan_api(self, client, rng, batch_id, location_ids):
+        qty = rng.randint(1, 20)
+        data = {'code': self.item.sku_code, 'quantity': qty, 'location': self.location_codes[rng.choice(location_ids)]}
+        if rng.random() < 0.55:
+            data.update(batch_number=self.batch_numbers[batch_id], barcode=self._barcode(rng, batch_id))
+            response = client.post(reverse('warehouse:api_inbound'), data, content_type='application/json')
+            if response.status_code != 200:
+                return self._rejected(response)
+            return 'in', response.json()['unassigned']
+        # 按 SKU 先到期先出，跨批次扣减
+        response = client.post(reverse('warehouse:api_outbound'), data, content_type='application/json')
+        return ('out', 0) if response.status_code == 200 else self._rejected(response)
+
+    @staticmethod
+    def _rejected(response):
+        if response.status_code not in (200, 409):
+            raise RuntimeError(f'{response.request["PATH_INFO"]} 返回 {response.status_code}')
+        return 'rejected', 0
+
+    @retry_on_deadlock(attempts=8)
+    @transaction.atomic
+    def _scan(self, rng, batch_id, location_ids):
+        batch = ItemBatch.objects.select_related('item').get(pk=batch_id)
+        preferred = Location.objects.get(pk=rng.choice(location_ids))
+        qty = rng.randint(1, 20)
+        if rng.random() < 0.55:
+            # 与 inbound_view 相同：先按规划校验容量，再提交规划
+            plan = plan_inbound(batch.item, qty, preferred=preferred, batch=batch)
+            if not plan.fits:
+                return 'rejected', 0
+            result = allocate_inbound(batch, qty, plan=plan)
+            direction, short = Movement.Direction.IN, result.remaining_units
+        else:
+            try:
+                result = release_outbound(batch, qty, preferred=preferred)
+            except ValueError:
+                return 'rejected', 0
+            direction, qty, short = Movement.Direction.OUT, result.removed_units, 0
+        Movement.objects.create(batch=batch, direction=direction, quantity_units=qty, location=preferred, note='压测')
+        return ('in' if direction == Movement.Direction.IN else 'out'), short
+
+    def _verify(self, batch_ids, location_ids, unplaced):
+        problems = []
+        for batch in ItemBatch.objects.filter(pk__in=batch_ids).annotate(
+            moved_in=Sum('movements__quantity_units', filter=Q(movements__direction=Movement.Direction.IN)),
+            moved_out=Sum('movements__quantity_units', filter=Q(movements__direction=Movement.Direction.OUT)),
+        ):
+            expected = (batch.moved_in or 0) - (batch.moved_out or 0)
+            placed = BatchLocation.objects.filter(batch=batch).aggregate(total=Sum('quantity_units'))['total'] or 0
+            if batch.quantity_units != expected:
+                problems.append(f"{batch.batch_number}: 库存 {batch.quantity_units} ≠ 流水净额 {expected}")
+            # 入库时因并发占满而未能上架的数量会留在批次库存中，但不在任何货位上
+            if placed > batch.quantity_units or placed + unplaced[batch.pk] < batch.quantity_units:
+                problems.append(
+                    f"{batch.batch_number}: 货位合计 {placed}（未上架 {unplaced[batch.pk]}）与库存 {batch.quantity_units} 不符"
+                )
+        item_id = ItemBatch.objects.filter(pk__in=batch_ids).values_list('item_id', flat=True).first()
+        stock = ItemStock.objects.filter(item_id=item_id).first()
+        expected = measure_item_stock([item_id])[item_id]
+        if stock is None or any(getattr(stock, name) != value for name, value in expected.items()):
+            problems.append(f"库存汇总与批次不符：{expected}")
+        # 上架策略限定在测试货位，落到其他货位即为错误
+        outside = Location.objects.filter(batch_locations__batch_id__in=batch_ids).exclude(pk__in=location_ids)
+        for code in outside.values_list('code', flat=True).distinct():
+            problems.append(f"{code}: 压测批次落到了测试货位以外的货位")
+        for loc, stored, actual in recompute_occupancy(location_ids, dry_run=True):
+            problems.append(f"{loc.code}: 占用体积 {stored} ≠ 实际 {actual}")
+        for loc in Location.objects.filter(pk__in=location_ids):
+            if loc.occupied_volume > loc.capacity_volume:
+                problems.append(f"{loc.code}: 占用 {loc.occupied_volume} 超出容量 {loc.capacity_volume}")
+        return problems
+
+    def _cleanup(self, prefix):
+        ItemBatch.objects.filter(item__sku_code=prefix).delete()
+        Item.objects.filter(sku_code=prefix).delete()
+        Location.objects.filter(code__startswith=f'{prefix}-').delete()
+        get_user_model().objects.filter(username=prefix.lower()).delete()
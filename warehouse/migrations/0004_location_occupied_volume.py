@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:40
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+
+
+def backfill_occupied_volume(apps, schema_editor):
+    Location = apps.get_model('warehouse', 'Location')
+    BatchLocation = apps.get_model('warehouse', 'BatchLocation')
+    rows = (
+        BatchLocation.objects.values('location_id')
+        .annotate(
+            used=Sum(
+                ExpressionWrapper(
+                    F('quantity_units') * F('batch__item__packaging_volume'),
+                    output_field=DecimalField(max_digits=15, decimal_places=3),
+                )
+            )
+        )
+    )
+    for row in rows:
+        used = Decimal(str(row['used'] or 0)).quantize(Decimal('0.001'))
+        Location.objects.filter(pk=row['location_id']).update(occupied_volume=used)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0003_alter_batchlocation_batch_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='occupied_volume',
+            field=models.DecimalField(
+                decimal_places=3,
+                default=0,
+                editable=False,
+                help_text='由出入库服务增量维护，可用 recompute_occupancy 命令校正',
+                max_digits=15,
+                verbose_name='已用体积',
+            ),
+        ),
+        migrations.RunPython(backfill_occupied_volume, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:44
+
+import warehouse.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0004_location_occupied_volume'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='putaway_strategy',
+            field=models.CharField(
+                blank=True,
+                choices=warehouse.models.putaway_strategy_choices,
+                help_text='留空则使用系统默认策略',
+                max_length=32,
+                verbose_name='上架策略',
+            ),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='putaway_strategy',
+            field=models.CharField(
+                blank=True,
+                choices=warehouse.models.putaway_strategy_choices,
+                help_text='留空则沿用分类的上架策略',
+                max_length=32,
+                verbose_name='上架策略',
+            ),
+        ),
+    ]
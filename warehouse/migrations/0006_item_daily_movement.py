@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_daily_movements(apps, schema_editor):
+    ItemDailyMovement = apps.get_model('warehouse', 'ItemDailyMovement')
+    Movement = apps.get_model('warehouse', 'Movement')
+    totals = {}
+    rows = Movement.objects.order_by().values_list('batch__item_id', 'direction', 'quantity_units', 'created_at')
+    for item_id, direction, quantity, created_at in rows.iterator(chunk_size=2000):
+        day = timezone.localdate(created_at) if timezone.is_aware(created_at) else created_at.date()
+        counters = totals.setdefault((item_id, day), [0, 0, 0])
+        counters[0] += 1
+        counters[1 if direction == 'IN' else 2] += quantity
+    ItemDailyMovement.objects.bulk_create(
+        [
+            ItemDailyMovement(item_id=item_id, day=day, moves=moves, units_in=units_in, units_out=units_out)
+            for (item_id, day), (moves, units_in, units_out) in totals.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0005_putaway_strategy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemDailyMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='日期')),
+                ('moves', models.PositiveIntegerField(default=0, verbose_name='进出次数')),
+                ('units_in', models.PositiveIntegerField(default=0, verbose_name='入库数量')),
+                ('units_out', models.PositiveIntegerField(default=0, verbose_name='出库数量')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_movements', to='warehouse.item', verbose_name='商品')),
+            ],
+            options={
+                'verbose_name': '商品每日进出',
+                'verbose_name_plural': '商品每日进出',
+                'indexes': [models.Index(fields=['day', 'item'], name='warehouse_daily_day_item')],
+                'unique_together': {('item', 'day')},
+            },
+        ),
+        migrations.RunPython(backfill_daily_movements, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0006_item_daily_movement'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='batchlocation',
+            index=models.Index(fields=['location', 'quantity_units'], name='warehouse_bl_location_qty'),
+        ),
+        migrations.AddIndex(
+            model_name='itembatch',
+            index=models.Index(fields=['expiry_date', 'quantity_units'], name='warehouse_batch_expiry_qty'),
+        ),
+        migrations.AddIndex(
+            model_name='itembatch',
+            index=models.Index(fields=['item', 'expiry_date'], name='warehouse_batch_item_expiry'),
+        ),
+        migrations.AddIndex(
+            model_name='movement',
+            index=models.Index(fields=['-created_at'], name='warehouse_mv_created'),
+        ),
+        migrations.AddIndex(
+            model_name='movement',
+            index=models.Index(fields=['batch', '-created_at'], name='warehouse_mv_batch_created'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+
+def backfill_item_stock(apps, schema_editor):
+    ItemBatch = apps.get_model('warehouse', 'ItemBatch')
+    BatchLocation = apps.get_model('warehouse', 'BatchLocation')
+    ItemStock = apps.get_model('warehouse', 'ItemStock')
+    today = timezone.localdate()
+    threshold = today + timezone.timedelta(days=30)
+    locations = dict(
+        BatchLocation.objects.filter(quantity_units__gt=0)
+        .values('batch__item_id')
+        .annotate(n=Count('location_id', distinct=True))
+        .order_by()
+        .values_list('batch__item_id', 'n')
+    )
+    rows = (
+        ItemBatch.objects.values('item_id')
+        .annotate(
+            total=Sum('quantity_units'),
+            near=Sum('quantity_units', filter=Q(expiry_date__isnull=False, expiry_date__lte=threshold)),
+            batches=Count('id'),
+        )
+        .order_by()
+    )
+    ItemStock.objects.bulk_create(
+        [
+            ItemStock(
+                item_id=row['item_id'],
+                total_units=row['total'] or 0,
+                near_expiry_units=row['near'] or 0,
+                batch_count=row['batches'],
+                location_count=locations.get(row['item_id'], 0),
+                computed_on=today,
+            )
+            for row in rows
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0007_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemStock',
+            fields=[
+                ('item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stock', serialize=False, to='warehouse.item', verbose_name='商品')),
+                ('total_units', models.PositiveIntegerField(default=0, verbose_name='库存数量')),
+                ('near_expiry_units', models.PositiveIntegerField(default=0, verbose_name='临期数量')),
+                ('batch_count', models.PositiveIntegerField(default=0, verbose_name='批次数')),
+                ('location_count', models.PositiveIntegerField(default=0, verbose_name='货位数')),
+                ('computed_on', models.DateField(help_text='临期数量按该日期起 30 天计算，跨天后需刷新', verbose_name='临期计算日期')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '商品库存汇总',
+                'verbose_name_plural': '商品库存汇总',
+            },
+        ),
+        migrations.RunPython(backfill_item_stock, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:11
+
+import unicodedata
+
+from django.db import migrations, models
+
+# 与 warehouse.search 的分词规则一致（迁移中不引用应用代码）
+INDEXED = {
+    'item': ('Item', {'sku_code': 3, 'name': 1, 'size_text': 1}),
+    'batch': ('ItemBatch', {'barcode': 3, 'batch_number': 3}),
+    'location': ('Location', {'code': 3, 'name': 1}),
+}
+
+
+def _grams(text):
+    found = set()
+    for word in unicodedata.normalize('NFKC', text or '').lower().split():
+        if len(word) < 2:
+            found.add(word)
+        found.update(word[i:i + 2] for i in range(len(word) - 1))
+    return found
+
+
+def backfill_search_terms(apps, schema_editor):
+    SearchTerm = apps.get_model('warehouse', 'SearchTerm')
+    for kind, (model_name, fields) in INDEXED.items():
+        model = apps.get_model('warehouse', model_name)
+        terms = []
+        for obj in model.objects.only('pk', *fields).iterator(chunk_size=1000):
+            weights = {}
+            for field, weight in fields.items():
+                for gram in _grams(getattr(obj, field)):
+                    weights[gram] = max(weight, weights.get(gram, 0))
+            terms.extend(SearchTerm(gram=g, kind=kind, object_id=obj.pk, weight=w) for g, w in weights.items())
+            if len(terms) >= 5000:
+                SearchTerm.objects.bulk_create(terms, batch_size=1000)
+                terms = []
+        SearchTerm.objects.bulk_create(terms, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0009_api_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gram', models.CharField(max_length=2, verbose_name='词元')),
+                ('kind', models.CharField(choices=[('item', '商品'), ('batch', '批次'), ('location', '货位')], max_length=8, verbose_name='类型')),
+                ('object_id', models.PositiveIntegerField(verbose_name='对象 ID')),
+                ('weight', models.PositiveSmallIntegerField(default=1, help_text='编码类字段权重高于名称', verbose_name='权重')),
+            ],
+            options={
+                'verbose_name': '搜索索引',
+                'verbose_name_plural': '搜索索引',
+                'indexes': [models.Index(fields=['kind', 'object_id'], name='warehouse_search_object')],
+                'unique_together': {('gram', 'kind', 'object_id')},
+            },
+        ),
+        migrations.RunPython(backfill_search_terms, migrations.RunPython.noop),
+    ]
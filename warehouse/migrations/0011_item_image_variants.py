@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0010_search_terms'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='itemimage',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='上传后自动生成的各尺寸 WebP/JPEG 文件，见 warehouse.images', verbose_name='缩略图'),
+        ),
+    ]
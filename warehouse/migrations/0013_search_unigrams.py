@@ -0,0 +1,47 @@
+import unicodedata
+
+from django.db import migrations
+
+# 与 warehouse.search.index_grams 一致（迁移中不引用应用代码）：二元词元加每个单字
+INDEXED = {
+    'item': ('Item', {'sku_code': 3, 'name': 1, 'size_text': 1}),
+    'batch': ('ItemBatch', {'barcode': 3, 'batch_number': 3}),
+    'location': ('Location', {'code': 3, 'name': 1}),
+}
+
+
+def _grams(text):
+    found = set()
+    for word in unicodedata.normalize('NFKC', text or '').lower().split():
+        found.update(word)
+        found.update(word[i:i + 2] for i in range(len(word) - 1))
+    return found
+
+
+def rebuild_search_terms(apps, schema_editor):
+    SearchTerm = apps.get_model('warehouse', 'SearchTerm')
+    SearchTerm.objects.all().delete()
+    for kind, (model_name, fields) in INDEXED.items():
+        model = apps.get_model('warehouse', model_name)
+        terms = []
+        for obj in model.objects.only('pk', *fields).iterator(chunk_size=1000):
+            weights = {}
+            for field, weight in fields.items():
+                for gram in _grams(getattr(obj, field)):
+                    weights[gram] = max(weight, weights.get(gram, 0))
+            terms.extend(SearchTerm(gram=g, kind=kind, object_id=obj.pk, weight=w) for g, w in weights.items())
+            if len(terms) >= 5000:
+                SearchTerm.objects.bulk_create(terms, batch_size=1000)
+                terms = []
+        SearchTerm.objects.bulk_create(terms, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0012_location_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_search_terms, migrations.RunPython.noop),
+    ]
@@ -1,16 +1,39 @@
-﻿from django.db import models
+﻿import hashlib
+import secrets
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import models
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, Sum, Value, When
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 
 
 User = get_user_model()
 
+# 临期判定：过期日期在今天起 30 天内
+NEAR_EXPIRY_DAYS = 30
+
+
+def putaway_strategy_choices():
+    from .services import putaway_strategy_choices as choices
+
+    return choices()
+
 
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True, verbose_name='名称')
     slug = models.SlugField(max_length=120, unique=True, verbose_name='别名', help_text='用于URL或筛选的唯一标识')
     description = models.TextField(blank=True, verbose_name='描述')
     order = models.PositiveIntegerField(default=0, verbose_name='排序', help_text='数字越小越靠前')
+    putaway_strategy = models.CharField(
+        max_length=32,
+        blank=True,
+        choices=putaway_strategy_choices,
+        verbose_name='上架策略',
+        help_text='留空则使用系统默认策略',
+    )
 
     class Meta:
         ordering = ('order', 'name')
@@ -31,8 +54,15 @@ class Item(models.Model):
     has_shelf_life = models.BooleanField(default=False, verbose_name='是否有保质期')
     description = models.TextField(blank=True, verbose_name='描述')
     active = models.BooleanField(default=True, verbose_name='启用')
+    putaway_strategy = models.CharField(
+        max_length=32,
+        blank=True,
+        choices=putaway_strategy_choices,
+        verbose_name='上架策略',
+        help_text='留空则沿用分类的上架策略',
+    )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
-    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name='更新时间')
 
     class Meta:
         ordering = ('name',)
@@ -47,6 +77,13 @@ class ItemImage(models.Model):
     item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='images', verbose_name='商品')
     image = models.ImageField(upload_to='item_images/', verbose_name='图片')
     alt = models.CharField(max_length=200, blank=True, verbose_name='替代文本')
+    variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='缩略图',
+        help_text='上传后自动生成的各尺寸 WebP/JPEG 文件，见 warehouse.images',
+    )
 
     class Meta:
         verbose_name = '商品图片'
@@ -55,12 +92,90 @@ class ItemImage(models.Model):
     def __str__(self) -> str:
         return f"{self.item.name} 图片"
 
+    def _srcset(self, fmt: str) -> str:
+        storage = self.image.storage
+        return ', '.join(f"{storage.url(size[fmt])} {size['w']}w" for size in self.variants.get('sizes', []))
+
+    @property
+    def webp_srcset(self) -> str:
+        return self._srcset('webp')
+
+    @property
+    def jpeg_srcset(self) -> str:
+        return self._srcset('jpeg')
+
+    @property
+    def display_size(self):
+        """不支持 srcset 的浏览器使用的 JPEG 尺寸（不超过 640 宽），没有缩略图时为 None。"""
+        sizes = self.variants.get('sizes') or []
+        if not sizes:
+            return None
+        fitting = [size for size in sizes if size['w'] <= 640]
+        return fitting[-1] if fitting else sizes[0]
+
+    @property
+    def display_url(self) -> str:
+        """不支持 srcset 时使用的 JPEG 缩略图地址；没有缩略图时为空，不回退到原图。"""
+        size = self.display_size
+        return self.image.storage.url(size['jpeg']) if size else ''
+
+
+VOLUME_FIELD = DecimalField(max_digits=15, decimal_places=3)
+
+
+class LocationQuerySet(models.QuerySet):
+    def with_room(self):
+        return self.filter(occupied_volume__lt=F('capacity_volume'))
+
+    def with_occupancy(self):
+        """按已存储的占用体积标注 used / available / occupancy_pct（百分比），不关联批次货位。"""
+        return self.annotate(
+            used=F('occupied_volume'),
+            available=ExpressionWrapper(F('capacity_volume') - F('occupied_volume'), output_field=VOLUME_FIELD),
+            occupancy_pct=Case(
+                When(capacity_volume__gt=0, then=F('occupied_volume') * Value(100) / F('capacity_volume')),
+                default=Value(Decimal('0')),
+                output_field=DecimalField(max_digits=9, decimal_places=2),
+            ),
+        )
+
+    def with_live_occupancy(self):
+        """从批次货位实时汇总 live_used，用于校对已存储的占用体积。"""
+        return self.annotate(
+            live_used=Coalesce(
+                Sum(
+                    ExpressionWrapper(
+                        F('batch_locations__quantity_units') * F('batch_locations__batch__item__packaging_volume'),
+                        output_field=VOLUME_FIELD,
+                    )
+                ),
+                Value(Decimal('0')),
+                output_field=VOLUME_FIELD,
+            )
+        )
+
+    def near_full(self, ratio=None):
+        if ratio is None:
+            ratio = settings.WAREHOUSE_NEAR_FULL_RATIO
+        return self.filter(capacity_volume__gt=0, occupied_volume__gte=F('capacity_volume') * Value(Decimal(str(ratio))))
+
 
 class Location(models.Model):
     code = models.CharField(max_length=64, unique=True, verbose_name='编码')
     name = models.CharField(max_length=120, verbose_name='名称')
     capacity_volume = models.DecimalField(max_digits=12, decimal_places=3, verbose_name='容积')
     note = models.CharField(max_length=255, blank=True, verbose_name='备注')
+    occupied_volume = models.DecimalField(
+        max_digits=15,
+        decimal_places=3,
+        default=0,
+        editable=False,
+        verbose_name='已用体积',
+        help_text='由出入库服务增量维护，可用 recompute_occupancy 命令校正',
+    )
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name='更新时间')
+
+    objects = LocationQuerySet.as_manager()
 
     class Meta:
         ordering = ('code',)
@@ -72,10 +187,7 @@ class Location(models.Model):
 
     @property
     def used_volume(self) -> float:
-        total = 0.0
-        for bl in self.batch_locations.select_related('batch__item').all():
-            total += float(bl.quantity_units) * float(bl.batch.item.packaging_volume)
-        return total
+        return float(self.occupied_volume)
 
     @property
     def available_volume(self) -> float:
@@ -90,10 +202,16 @@ class ItemBatch(models.Model):
     barcode = models.CharField(max_length=64, unique=True, verbose_name='批次条码', help_text='批次识别码（数字）')
     quantity_units = models.PositiveIntegerField(default=0, verbose_name='库存数量')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
-    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name='更新时间')
 
     class Meta:
         unique_together = ('item', 'batch_number')
+        indexes = [
+            # 临期查询：过期日期范围 + 有库存
+            models.Index(fields=['expiry_date', 'quantity_units'], name='warehouse_batch_expiry_qty'),
+            # 按商品先到期先出
+            models.Index(fields=['item', 'expiry_date'], name='warehouse_batch_item_expiry'),
+        ]
         ordering = ('item__name', 'batch_number')
         verbose_name = '商品批次'
         verbose_name_plural = '商品批次'
@@ -105,7 +223,7 @@ class ItemBatch(models.Model):
     def is_near_expiry(self) -> bool:
         if not self.expiry_date:
             return False
-        return 0 <= (self.expiry_date - timezone.localdate()).days <= 30
+        return 0 <= (self.expiry_date - timezone.localdate()).days <= NEAR_EXPIRY_DAYS
 
 
 class BatchLocation(models.Model):
@@ -115,6 +233,7 @@ class BatchLocation(models.Model):
 
     class Meta:
         unique_together = ('batch', 'location')
+        indexes = [models.Index(fields=['location', 'quantity_units'], name='warehouse_bl_location_qty')]
         verbose_name = '批次货位'
         verbose_name_plural = '批次货位'
 
@@ -137,8 +256,101 @@ class Movement(models.Model):
 
     class Meta:
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['-created_at'], name='warehouse_mv_created'),
+            models.Index(fields=['batch', '-created_at'], name='warehouse_mv_batch_created'),
+        ]
         verbose_name = '出入库明细'
         verbose_name_plural = '出入库明细'
 
     def __str__(self) -> str:
         return f"{self.get_direction_display()} {self.batch} x{self.quantity_units}"
+
+
+class ItemDailyMovement(models.Model):
+    """每个商品每天的出入库汇总，由出入库服务增量维护，供高频进出统计使用。"""
+
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='daily_movements', verbose_name='商品')
+    day = models.DateField(verbose_name='日期')
+    moves = models.PositiveIntegerField(default=0, verbose_name='进出次数')
+    units_in = models.PositiveIntegerField(default=0, verbose_name='入库数量')
+    units_out = models.PositiveIntegerField(default=0, verbose_name='出库数量')
+
+    class Meta:
+        unique_together = ('item', 'day')
+        indexes = [models.Index(fields=['day', 'item'], name='warehouse_daily_day_item')]
+        verbose_name = '商品每日进出'
+        verbose_name_plural = '商品每日进出'
+
+    def __str__(self) -> str:
+        return f"{self.item} {self.day} x{self.moves}"
+
+
+class ItemStock(models.Model):
+    """每个商品的库存汇总，由出入库服务与批次变动在同一事务内刷新。"""
+
+    item = models.OneToOneField(Item, on_delete=models.CASCADE, primary_key=True, related_name='stock', verbose_name='商品')
+    total_units = models.PositiveIntegerField(default=0, verbose_name='库存数量')
+    near_expiry_units = models.PositiveIntegerField(default=0, verbose_name='临期数量')
+    batch_count = models.PositiveIntegerField(default=0, verbose_name='批次数')
+    location_count = models.PositiveIntegerField(default=0, verbose_name='货位数')
+    computed_on = models.DateField(verbose_name='临期计算日期', help_text='临期数量按该日期起 30 天计算，跨天后需刷新')
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name='更新时间')
+
+    class Meta:
+        verbose_name = '商品库存汇总'
+        verbose_name_plural = '商品库存汇总'
+
+    def __str__(self) -> str:
+        return f"{self.item} 库存:{self.total_units}"
+
+
+class SearchTerm(models.Model):
+    """商品、批次、货位文本的二元词元（bigram）倒排索引，由保存/删除信号维护，供全局搜索使用。"""
+
+    class Kind(models.TextChoices):
+        ITEM = 'item', '商品'
+        BATCH = 'batch', '批次'
+        LOCATION = 'location', '货位'
+
+    gram = models.CharField(max_length=2, verbose_name='词元')
+    kind = models.CharField(max_length=8, choices=Kind.choices, verbose_name='类型')
+    object_id = models.PositiveIntegerField(verbose_name='对象 ID')
+    weight = models.PositiveSmallIntegerField(default=1, verbose_name='权重', help_text='编码类字段权重高于名称')
+
+    class Meta:
+        unique_together = ('gram', 'kind', 'object_id')
+        indexes = [models.Index(fields=['kind', 'object_id'], name='warehouse_search_object')]
+        verbose_name = '搜索索引'
+        verbose_name_plural = '搜索索引'
+
+    def __str__(self) -> str:
+        return f"{self.gram} → {self.kind}#{self.object_id}"
+
+
+class ApiToken(models.Model):
+    """手持终端调用 /api/ 接口的访问令牌；只保存摘要，明文令牌仅在创建时显示一次。"""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='api_tokens', verbose_name='用户')
+    name = models.CharField(max_length=100, verbose_name='名称', help_text='如终端编号或使用位置')
+    digest = models.CharField(max_length=64, unique=True, editable=False, verbose_name='令牌摘要')
+    active = models.BooleanField(default=True, verbose_name='是否启用')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    last_used_at = models.DateTimeField(null=True, blank=True, editable=False, verbose_name='最近使用时间')
+
+    class Meta:
+        verbose_name = '接口令牌'
+        verbose_name_plural = '接口令牌'
+
+    def __str__(self) -> str:
+        return f"{self.name} ({self.user})"
+
+    @staticmethod
+    def hash_key(key: str) -> str:
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def generate_key(self) -> str:
+        """生成新令牌并记录摘要，返回明文（需调用方保存模型）。"""
+        key = secrets.token_urlsafe(30)
+        self.digest = self.hash_key(key)
+        return key
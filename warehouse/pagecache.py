@@ -0,0 +1,191 @@
+"""Shared caching of rendered page content and fragments.
+
+The catalog, near-expiry and inventory pages look the same for every
+operator, so the HTML of their ``{% block content %}`` is cached once for
+everybody. The navigation, messages and CSRF token around it are still
+rendered per request. Page keys carry the namespace versions from
+``warehouse.stats``; signals and the bulk stock services bump them on commit,
+so a hit runs no database query and a stale page is never served.
+
+Fragments (a catalog category block, an inventory row) are keyed by what
+they show: ``updated_at`` columns, counts, names. When a page is rebuilt
+after one item changed, only that item's fragment is rendered again. Their
+keys change with their content, so they can live much longer than pages.
+
+Both use the ``default`` cache, so the backend is swappable
+(``DJANGO_CACHE_BACKEND``; local memory, file or a shared cache).
+
+The same pages (and the location list) also answer conditional GETs. Their
+ETag combines one small database query (the latest ``updated_at`` of the
+tables they show, indexed; row counts for deletions; the latest
+``Movement.id``) with the cache versions their content is invalidated by.
+The versions cover changes that move no timestamp on those tables, such as
+an admin edit of a batch's location rows or an occupancy recompute. A browser refreshing an unchanged page gets
+an empty ``304 Not Modified`` before the view builds anything. There is no
+``Last-Modified``: deletions and the date rollover do not move any
+timestamp, so a date alone could revalidate a stale page.
+"""
+from __future__ import annotations
+
+import hashlib
+from functools import wraps
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db.models import Aggregate, Count, Max, QuerySet
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.utils.safestring import SafeString, mark_safe
+
+from .models import Item, ItemBatch, ItemStock, Location, Movement
+from .stats import DASHBOARD, STOCK, cache_version, fetch_scalars
+
+
+def _digest(parts: Iterable[object]) -> str:
+    return hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def page_cache_key(request, namespaces: Sequence[str]) -> str:
+    """Key of the page at ``request``'s full path under the current versions of ``namespaces``.
+
+    The local date is part of the key because near-expiry figures move with it.
+    """
+    versions = '.'.join(str(cache_version(namespace)) for namespace in namespaces)
+    return (
+        f"warehouse:page:{'.'.join(namespaces)}:{versions}:{timezone.localdate().isoformat()}:"
+        f"{_digest([request.get_full_path()])}"
+    )
+
+
+def cached_page(request, namespaces: Sequence[str], build: Callable[[], str]) -> SafeString:
+    """Rendered page content from the cache, or from ``build()`` (rendered HTML) on a miss."""
+    key = page_cache_key(request, namespaces)
+    content = cache.get(key)
+    if content is None:
+        content = build()
+        cache.set(key, content, settings.WAREHOUSE_PAGE_CACHE_TTL)
+    return mark_safe(content)
+
+
+async def acached_page(request, namespaces: Sequence[str], build: Callable[[], Awaitable[str]]) -> SafeString:
+    """``cached_page`` for async views; ``build`` is a coroutine function."""
+    key = await sync_to_async(page_cache_key)(request, namespaces)
+    content = await cache.aget(key)
+    if content is None:
+        content = await build()
+        await cache.aset(key, content, settings.WAREHOUSE_PAGE_CACHE_TTL)
+    return mark_safe(content)
+
+
+def fragment_key(name: str, vary_on: Iterable[object]) -> str:
+    return f'warehouse:fragment:{name}:{_digest(vary_on)}'
+
+
+def cached_fragments(
+    name: str,
+    objects: Sequence,
+    vary_on: Callable[[object], Iterable[object]],
+    render: Callable[[List], List[str]],
+) -> List[SafeString]:
+    """HTML for each of ``objects``, in order, fetched with one ``get_many``.
+
+    ``render`` is called once with the objects that missed (so it can load
+    what they need in bulk) and returns their HTML in the same order.
+    """
+    keys = [fragment_key(name, vary_on(obj)) for obj in objects]
+    found = cache.get_many(keys) if keys else {}
+    missing = [i for i, key in enumerate(keys) if key not in found]
+    if missing:
+        fresh = dict(zip((keys[i] for i in missing), render([objects[i] for i in missing])))
+        cache.set_many(fresh, settings.WAREHOUSE_FRAGMENT_CACHE_TTL)
+        found.update(fresh)
+    return [mark_safe(found[key]) for key in keys]
+
+
+def _freshness_etag(
+    request, probes: Dict[str, Tuple[QuerySet, Aggregate]], namespaces: Sequence[str]
+) -> Optional[str]:
+    """ETag of a page built from the tables in ``probes`` (read with one query) and ``namespaces``.
+
+    The page around the content shows the operator's name and CSRF token, so
+    the tag is bound to the session (a new login rotates both). While flash
+    messages are pending there is no tag, otherwise a 304 would hide them.
+    """
+    if get_messages(request):
+        return None
+    values = fetch_scalars(probes)
+    versions = [cache_version(namespace) for namespace in namespaces]
+    return _digest([request.session.session_key, timezone.localdate().isoformat(), *versions, *values.values()])
+
+
+def inventory_etag(request) -> Optional[str]:
+    return _freshness_etag(
+        request,
+        {
+            'movement': (Movement.objects.all(), Max('id')),
+            'stock': (ItemStock.objects.all(), Max('updated_at')),
+            'stock_rows': (ItemStock.objects.all(), Count('pk')),
+            # 分类改名或删除时会更新商品的 updated_at（见 signals）
+            'items': (Item.objects.all(), Max('updated_at')),
+            'batches': (ItemBatch.objects.all(), Max('updated_at')),
+            'batch_rows': (ItemBatch.objects.all(), Count('id')),
+            # 货位分布显示货位编码与名称
+            'locations': (Location.objects.all(), Max('updated_at')),
+            'location_rows': (Location.objects.all(), Count('id')),
+        },
+        # 与页面缓存同一命名空间：批次货位等不带时间戳的改动也会递增它
+        (STOCK,),
+    )
+
+
+def near_expiry_etag(request) -> Optional[str]:
+    return _freshness_etag(
+        request,
+        {
+            'movement': (Movement.objects.all(), Max('id')),
+            'items': (Item.objects.all(), Max('updated_at')),
+            'batches': (ItemBatch.objects.all(), Max('updated_at')),
+            'batch_rows': (ItemBatch.objects.all(), Count('id')),
+        },
+        (STOCK,),
+    )
+
+
+def locations_etag(request) -> Optional[str]:
+    # 占用体积由出入库服务与 recompute_occupancy 更新，两处都会写 updated_at
+    return _freshness_etag(
+        request,
+        {
+            'locations': (Location.objects.all(), Max('updated_at')),
+            'location_rows': (Location.objects.all(), Count('id')),
+        },
+        (DASHBOARD, STOCK),
+    )
+
+
+def acondition(etag_func: Callable[..., Optional[str]]):
+    """``django.views.decorators.http.condition`` for async views.
+
+    Django calls ``etag_func`` synchronously even around a coroutine view,
+    where the ORM refuses to run; here it goes through ``sync_to_async``.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            etag = await sync_to_async(etag_func)(request, *args, **kwargs)
+            etag = quote_etag(etag) if etag is not None else None
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            if etag and request.method in ('GET', 'HEAD'):
+                response.headers.setdefault('ETag', etag)
+            return response
+
+        return inner
+
+    return decorator
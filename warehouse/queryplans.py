@@ -0,0 +1,125 @@
+"""EXPLAIN checks for the hot queries.
+
+``plan_checks`` lists the queries behind the near-expiry list, movement
+history, location stock, FEFO picking, the fast-mover ranking and search,
+each with the table it must not scan in full. ``full_scans`` reads the plan
+the backend returns (SQLite text, MySQL/PostgreSQL JSON) and names the tables
+it scans without an index. Only ``EXPLAIN`` runs, so the checks are safe on
+production data (``manage.py explain_audit``); the seeded version lives in
+``warehouse.tests.test_query_plans``.
+"""
+from __future__ import annotations
+
+import json
+import re
+from datetime import timedelta
+from typing import List, Set, Tuple
+
+from django.db import connection
+from django.db.models import Count, F, QuerySet, Sum
+from django.utils import timezone
+
+from .models import BatchLocation, ItemBatch, ItemDailyMovement, Location, Movement, SearchTerm
+from .search import SEARCH_CANDIDATE_LIMIT, grams
+
+SQLITE_SCAN = re.compile(r'\bSCAN (\w+)( USING (?:COVERING )?INDEX)?')
+
+
+def plan_checks(search_text: str = '商品') -> List[Tuple[str, type, QuerySet]]:
+    """``(label, model whose table must not be scanned, queryset)`` for each hot query.
+
+    Sample ids come from the first batch and location; returns an empty list
+    when there are none.
+    """
+    today = timezone.localdate()
+    threshold = today + timedelta(days=30)
+    batch = ItemBatch.objects.order_by('pk').first()
+    location = Location.objects.order_by('pk').first()
+    if batch is None or location is None:
+        return []
+    return [
+        (
+            '临期批次',
+            ItemBatch,
+            ItemBatch.objects.filter(expiry_date__isnull=False, expiry_date__lte=threshold, quantity_units__gt=0)
+            .select_related('item')
+            .order_by('expiry_date'),
+        ),
+        (
+            '最近出入库',
+            Movement,
+            Movement.objects.select_related('batch__item').order_by('-created_at')[:50],
+        ),
+        (
+            '批次流水',
+            Movement,
+            Movement.objects.filter(batch=batch).order_by('-created_at')[:50],
+        ),
+        (
+            '区间流水',
+            Movement,
+            Movement.objects.filter(created_at__gte=timezone.now() - timedelta(days=1)).values_list('batch_id', 'quantity_units'),
+        ),
+        (
+            '货位库存',
+            BatchLocation,
+            BatchLocation.objects.filter(location=location, quantity_units__gt=0).values_list('batch_id', 'quantity_units'),
+        ),
+        (
+            '先到期先出',
+            ItemBatch,
+            BatchLocation.objects.filter(batch__item_id=batch.item_id, quantity_units__gt=0)
+            .select_related('batch', 'location')
+            .order_by(F('batch__expiry_date').asc(nulls_last=True), 'batch__created_at', 'batch_id', 'location__code'),
+        ),
+        (
+            '高频进出',
+            ItemDailyMovement,
+            ItemDailyMovement.objects.filter(day__gte=today - timedelta(days=6), moves__gt=0)
+            .values('item_id', 'item__name')
+            .annotate(moves=Sum('moves'))
+            .order_by('-moves')[:20],
+        ),
+        (
+            '全局搜索',
+            SearchTerm,
+            SearchTerm.objects.filter(gram__in=grams(search_text))
+            .values('kind', 'object_id')
+            .annotate(hits=Count('gram'))
+            .order_by('-hits')[:SEARCH_CANDIDATE_LIMIT],
+        ),
+        (
+            '全局搜索（单字）',
+            SearchTerm,
+            SearchTerm.objects.filter(gram__in=grams(search_text[:1]))
+            .values('kind', 'object_id')
+            .annotate(hits=Count('gram'))
+            .order_by('-hits')[:SEARCH_CANDIDATE_LIMIT],
+        ),
+    ]
+
+
+def explain(queryset: QuerySet) -> str:
+    if connection.vendor in ('mysql', 'postgresql'):
+        return queryset.explain(format='json')
+    return queryset.explain()
+
+
+def full_scans(plan: str) -> Set[str]:
+    """Tables ``plan`` reads without an index."""
+    if connection.vendor == 'sqlite':
+        return {m.group(1) for m in SQLITE_SCAN.finditer(plan) if not m.group(2)}
+    scanned = set()
+    stack = [json.loads(plan)]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, dict):
+            # MySQL: access_type=ALL；PostgreSQL: Seq Scan
+            if node.get('access_type') == 'ALL' and 'table_name' in node:
+                scanned.add(node['table_name'])
+            if node.get('Node Type') == 'Seq Scan' and 'Relation Name' in node:
+                scanned.add(node['Relation Name'])
+            stack.extend(node.values())
+    return scanned
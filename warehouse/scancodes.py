@@ -0,0 +1,166 @@
+"""Scan-code resolution with an in-process LRU/TTL cache.
+
+A scanned code is either a batch barcode or an item SKU (barcode wins, as on
+the scan page). Both are resolved with one ``UNION`` query over the two
+unique indexes, and a found ``(item_id, batch_id)`` is cached per process.
+Only ids are cached, never stock figures, so callers still read fresh rows
+by primary key. Unknown codes are not cached: the usual next step after
+scanning a new barcode is to receive it, possibly on another worker.
+
+Signals on ``Item``/``ItemBatch`` drop the affected entries in this process
+at once. Only saves that can change a resolution elsewhere (a changed SKU or
+barcode, a new batch whose barcode may shadow a cached SKU) and deletes bump
+the ``scan`` version in the shared cache on commit (``warehouse.stats``);
+every process compares that version before a lookup and empties its cache
+when it moved, so ordinary edits leave other workers' caches warm. ``WAREHOUSE_SCAN_CACHE_TTL`` bounds
+staleness only when the cache backend is not shared between workers.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import IntegerField, Value
+
+from .models import Item, ItemBatch
+from .stats import SCAN, acache_version, cache_version
+
+
+@dataclass(frozen=True)
+class ScanMatch:
+    item_id: int
+    batch_id: Optional[int] = None
+
+    @property
+    def is_batch(self) -> bool:
+        return self.batch_id is not None
+
+
+class ScanCodeCache:
+    """Bounded LRU mapping with per-entry expiry and hit/miss counters. Thread-safe."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: 'OrderedDict[str, Tuple[float, ScanMatch]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._version: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def sync(self, version: int) -> None:
+        """Empty the cache when the shared ``version`` moved since the last lookup."""
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+
+    def get(self, code: str) -> Tuple[bool, Optional[ScanMatch]]:
+        """Return ``(found, match)``."""
+        with self._lock:
+            entry = self._entries.get(code)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[code]
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(code)
+            self.hits += 1
+            return True, entry[1]
+
+    def put(self, code: str, match: Optional[ScanMatch]) -> None:
+        """Cache ``match``; unknown codes (``None``) are never cached."""
+        if self.maxsize <= 0 or match is None:
+            return
+        with self._lock:
+            self._entries[code] = (time.monotonic() + self.ttl, match)
+            self._entries.move_to_end(code)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, *codes: str, item_id: Optional[int] = None, batch_id: Optional[int] = None) -> None:
+        """Drop ``codes`` plus any entry pointing at ``item_id``/``batch_id`` (catches renamed codes)."""
+        with self._lock:
+            for code in codes:
+                self._entries.pop(code, None)
+            if item_id is None and batch_id is None:
+                return
+            stale = [
+                code
+                for code, (_, match) in self._entries.items()
+                if (item_id is not None and match.item_id == item_id) or (batch_id is not None and match.batch_id == batch_id)
+            ]
+            for code in stale:
+                del self._entries[code]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+scan_cache = ScanCodeCache(
+    maxsize=getattr(settings, 'WAREHOUSE_SCAN_CACHE_SIZE', 4096),
+    ttl=getattr(settings, 'WAREHOUSE_SCAN_CACHE_TTL', 60),
+)
+
+
+def _lookup(code: str):
+    # 第一列区分来源（0=批次条码，1=SKU），排序后批次条码优先
+    batches = ItemBatch.objects.filter(barcode=code).order_by().values_list(
+        Value(0, output_field=IntegerField()), 'item_id', 'id'
+    )
+    items = Item.objects.filter(sku_code=code).order_by().values_list(
+        Value(1, output_field=IntegerField()), 'id', 'id'
+    )
+    return batches.union(items, all=True)
+
+
+def _to_match(rows) -> Optional[ScanMatch]:
+    if not rows:
+        return None
+    kind, item_id, row_id = min(rows)
+    return ScanMatch(item_id=item_id, batch_id=row_id if kind == 0 else None)
+
+
+def resolve_scan_code(code: str) -> Optional[ScanMatch]:
+    """Resolve a scanned SKU or batch barcode, consulting the process cache first."""
+    code = (code or '').strip()
+    if not code:
+        return None
+    scan_cache.sync(cache_version(SCAN))
+    found, match = scan_cache.get(code)
+    if not found:
+        match = _to_match(list(_lookup(code)))
+        scan_cache.put(code, match)
+    return match
+
+
+async def aresolve_scan_code(code: str) -> Optional[ScanMatch]:
+    """Async variant of ``resolve_scan_code`` sharing the same cache."""
+    code = (code or '').strip()
+    if not code:
+        return None
+    scan_cache.sync(await acache_version(SCAN))
+    found, match = scan_cache.get(code)
+    if not found:
+        match = _to_match([row async for row in _lookup(code)])
+        scan_cache.put(code, match)
+    return match
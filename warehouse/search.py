@@ -0,0 +1,217 @@
+"""Bigram search over items, batches and locations.
+
+Every indexed field is normalized (NFKC, lower case) and split into
+overlapping two-character grams, stored in ``SearchTerm`` with the field's
+weight; signals keep the rows current on save/delete. Every single
+character is stored as well, so a one-character query still finds it inside
+longer words (the old ``icontains`` filter did). A query matches an
+object when all of its grams are present, which is one grouped lookup on the
+``(gram, kind, object_id)`` index instead of a ``LIKE '%q%'`` table scan.
+Bigrams rather than trigrams so that the two-character words common in
+Chinese product names are searchable. Having every gram is necessary but not
+sufficient (``abab`` has the grams of ``ba ab``), so candidates are checked
+against the normalized field values, with one primary-key lookup per kind,
+before they are ranked.
+
+Results are ranked by summed gram weight, with exact and prefix matches on
+the code column (SKU, barcode, location code) ranked first; those come from
+the existing unique indexes with ``LIKE 'q%'``. ``limit`` caps the
+candidates read from each source; results cut off by it are flagged
+``truncated`` so callers can say so, and listings that must show every match
+pass ``limit=None``.
+"""
+from __future__ import annotations
+
+import unicodedata
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from .models import Item, ItemBatch, Location, SearchTerm
+
+GRAM_SIZE = 2
+# 搜索页每个来源最多取回的候选数，足够覆盖多页结果；超出时结果标记为截断
+SEARCH_CANDIDATE_LIMIT = 500
+# 核对候选时每次按主键读取的行数
+VERIFY_CHUNK_SIZE = 1000
+EXACT_CODE_BONUS = 1000
+PREFIX_CODE_BONUS = 500
+
+
+@dataclass(frozen=True)
+class SearchKind:
+    model: type
+    code_field: str
+    # 字段 -> 权重；编码类字段权重更高
+    fields: Dict[str, int]
+    select_related: Sequence[str] = ()
+
+
+KINDS: Dict[str, SearchKind] = {
+    SearchTerm.Kind.ITEM: SearchKind(Item, 'sku_code', {'sku_code': 3, 'name': 1, 'size_text': 1}, ('category',)),
+    SearchTerm.Kind.BATCH: SearchKind(ItemBatch, 'barcode', {'barcode': 3, 'batch_number': 3}, ('item',)),
+    SearchTerm.Kind.LOCATION: SearchKind(Location, 'code', {'code': 3, 'name': 1}),
+}
+INDEXED_FIELDS = {kind: set(spec.fields) for kind, spec in KINDS.items()}
+
+
+@dataclass
+class SearchHit:
+    kind: str
+    object_id: int
+    score: int
+    obj: Optional[object] = None
+
+    @property
+    def kind_label(self) -> str:
+        return SearchTerm.Kind(self.kind).label
+
+
+class SearchResults(list):
+    """Ranked ``SearchHit`` list; ``truncated`` is set when ``limit`` left matches out."""
+
+    truncated = False
+
+
+def normalize(text: str) -> str:
+    return unicodedata.normalize('NFKC', text or '').lower()
+
+
+def grams(text: str) -> Set[str]:
+    """Overlapping bigrams of each whitespace-separated word; one-character words are kept whole."""
+    found: Set[str] = set()
+    for word in normalize(text).split():
+        if len(word) < GRAM_SIZE:
+            found.add(word)
+        found.update(word[i:i + GRAM_SIZE] for i in range(len(word) - GRAM_SIZE + 1))
+    return found
+
+
+def index_grams(text: str) -> Set[str]:
+    """``grams`` plus every single character, as stored in the index."""
+    found = grams(text)
+    for word in normalize(text).split():
+        found.update(word)
+    return found
+
+
+def _terms(kind: str, obj) -> List[SearchTerm]:
+    weights: Dict[str, int] = {}
+    for field, weight in KINDS[kind].fields.items():
+        for gram in index_grams(getattr(obj, field) or ''):
+            weights[gram] = max(weight, weights.get(gram, 0))
+    return [SearchTerm(gram=gram, kind=kind, object_id=obj.pk, weight=weight) for gram, weight in weights.items()]
+
+
+def index_objects(kind: str, objects: Iterable) -> None:
+    """(Re)write the search terms of ``objects``; one delete and one bulk insert."""
+    objects = list(objects)
+    if not objects:
+        return
+    with transaction.atomic():
+        SearchTerm.objects.filter(kind=kind, object_id__in=[obj.pk for obj in objects]).delete()
+        SearchTerm.objects.bulk_create([term for obj in objects for term in _terms(kind, obj)], batch_size=1000)
+
+
+def unindex_objects(kind: str, object_ids: Iterable[int]) -> None:
+    SearchTerm.objects.filter(kind=kind, object_id__in=list(object_ids)).delete()
+
+
+def rebuild_search_index(kinds: Optional[Iterable[str]] = None, chunk_size: int = 1000) -> int:
+    """Rebuild the index for ``kinds`` (default all) from scratch; returns the number of objects indexed."""
+    total = 0
+    for kind in kinds or KINDS:
+        spec = KINDS[kind]
+        with transaction.atomic():
+            SearchTerm.objects.filter(kind=kind).delete()
+            chunk = []
+            for obj in spec.model.objects.order_by('pk').only('pk', *spec.fields).iterator(chunk_size=chunk_size):
+                chunk.append(obj)
+                if len(chunk) >= chunk_size:
+                    SearchTerm.objects.bulk_create([t for o in chunk for t in _terms(kind, o)], batch_size=1000)
+                    total += len(chunk)
+                    chunk = []
+            SearchTerm.objects.bulk_create([t for o in chunk for t in _terms(kind, o)], batch_size=1000)
+            total += len(chunk)
+    return total
+
+
+def _verified(kind: str, object_ids: Sequence[int], words: Sequence[str]) -> Set[int]:
+    """Ids among ``object_ids`` whose indexed fields contain every word of the query."""
+    spec = KINDS[kind]
+    found: Set[int] = set()
+    for start in range(0, len(object_ids), VERIFY_CHUNK_SIZE):
+        rows = spec.model.objects.filter(pk__in=object_ids[start:start + VERIFY_CHUNK_SIZE]).values_list('pk', *spec.fields)
+        for pk, *values in rows:
+            texts = [normalize(value) for value in values]
+            if all(any(word in text for text in texts) for word in words):
+                found.add(pk)
+    return found
+
+
+def search(query: str, kinds: Optional[Iterable[str]] = None, limit: Optional[int] = SEARCH_CANDIDATE_LIMIT) -> SearchResults:
+    """Ranked hits for ``query`` (objects not loaded; see ``load_hits``).
+
+    At most ``limit`` candidates are read from the gram index and from each
+    code prefix lookup; ``None`` reads them all.
+    """
+    results = SearchResults()
+    kinds = [kind for kind in (kinds or KINDS) if kind in KINDS]
+    wanted = grams(query)
+    if not wanted or not kinds:
+        return results
+    rows = list(
+        SearchTerm.objects.filter(gram__in=wanted, kind__in=kinds)
+        .values('kind', 'object_id')
+        .annotate(hits=Count('gram'), score=Sum('weight'))
+        .filter(hits=len(wanted))
+        .order_by('-score', 'kind', 'object_id')
+        .values_list('kind', 'object_id', 'score')[: limit + 1 if limit is not None else None]
+    )
+    if limit is not None and len(rows) > limit:
+        results.truncated = True
+        rows = rows[:limit]
+    # 含全部词元不代表含查询词本身（如 abab 与 ba ab），按实际字段值核对后再排序
+    words = normalize(query).split()
+    candidates: Dict[str, List[int]] = {}
+    for kind, pk, _score in rows:
+        candidates.setdefault(kind, []).append(pk)
+    verified = {kind: _verified(kind, ids, words) for kind, ids in candidates.items()}
+    scores: Dict[tuple, int] = {(kind, pk): score for kind, pk, score in rows if pk in verified[kind]}
+
+    code = normalize(query).strip()
+    if code and ' ' not in code:
+        for kind in kinds:
+            field = KINDS[kind].code_field
+            matches = list(
+                KINDS[kind].model.objects.filter(**{f'{field}__istartswith': code})
+                .order_by(field)
+                .values_list('pk', field)[: limit + 1 if limit is not None else None]
+            )
+            if limit is not None and len(matches) > limit:
+                results.truncated = True
+                matches = matches[:limit]
+            for pk, value in matches:
+                bonus = EXACT_CODE_BONUS if normalize(value) == code else PREFIX_CODE_BONUS
+                scores[(kind, pk)] = scores.get((kind, pk), 0) + bonus
+
+    order = {kind: i for i, kind in enumerate(KINDS)}
+    ranked = sorted(scores.items(), key=lambda entry: (-entry[1], order[entry[0][0]], entry[0][1]))
+    results.extend(SearchHit(kind=kind, object_id=pk, score=score) for (kind, pk), score in ranked)
+    return results
+
+
+def load_hits(hits: Sequence[SearchHit]) -> List[SearchHit]:
+    """Attach model instances to ``hits`` with one query per kind; hits whose object vanished are dropped."""
+    by_kind: Dict[str, List[int]] = {}
+    for hit in hits:
+        by_kind.setdefault(hit.kind, []).append(hit.object_id)
+    loaded = {
+        kind: KINDS[kind].model.objects.select_related(*KINDS[kind].select_related).in_bulk(ids)
+        for kind, ids in by_kind.items()
+    }
+    for hit in hits:
+        hit.obj = loaded[hit.kind].get(hit.object_id)
+    return [hit for hit in hits if hit.obj is not None]
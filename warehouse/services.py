@@ -1,11 +1,39 @@
 """Domain services for inventory movements."""
 from __future__ import annotations
 
+import random
+import time
 from dataclasses import dataclass
+from datetime import date, datetime
 from decimal import Decimal
-from typing import List, Optional, Tuple, TYPE_CHECKING
+from functools import wraps
+from typing import Callable, Collection, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple, Type, TYPE_CHECKING
 
-from .models import BatchLocation, ItemBatch, Location
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.db.models import (
+    Case,
+    Count,
+    DecimalField,
+    F,
+    IntegerField,
+    PositiveIntegerField,
+    Q,
+    Sum,
+    Value,
+    When,
+)
+from django.utils import timezone
+
+from .freespace import (
+    FreeSpaceIndex,
+    free_space_index,
+    invalidate_free_space_index,
+    queue_index_correction,
+    queue_occupancy_deltas,
+)
+from .models import NEAR_EXPIRY_DAYS, BatchLocation, ItemBatch, ItemDailyMovement, ItemStock, Location, Movement
+from .stats import DASHBOARD, STOCK, bump_cache_version
 
 if TYPE_CHECKING:
     from .models import Item
@@ -24,110 +52,931 @@ class DeallocationResult:
     assignments: List[Tuple[Location, int]]
 
 
-def _iter_candidate_locations(preferred: Optional[Location]) -> List[Location]:
-    locations: List[Location] = []
+@dataclass
+class PickPlan:
+    """First-expired-first-out picks for an item-level outbound."""
+
+    item: 'Item'
+    requested_units: int
+    picks: List[Tuple[BatchLocation, int]]
+
+    @property
+    def picked_units(self) -> int:
+        return sum(take for _, take in self.picks)
+
+    @property
+    def fits(self) -> bool:
+        return self.picked_units >= self.requested_units
+
+
+@dataclass
+class ItemReleaseResult:
+    removed_units: int
+    picks: List[Tuple[BatchLocation, int]]
+    movements: List[Movement]
+
+
+@dataclass
+class PlacementPlan:
+    """Where an inbound quantity would be placed, computed in a single capacity pass."""
+
+    item: 'Item'
+    requested_units: int
+    volume_per_unit: Decimal
+    assignments: List[Tuple[Location, int]]
+    # 规划的货位已加行锁并复核（见 lock_inbound_plan），allocate_inbound 不再重复确认
+    locked: bool = False
+
+    @property
+    def placeable_units(self) -> int:
+        """Units of the request that fit; equals total free capacity when the plan falls short."""
+        return sum(units for _, units in self.assignments)
+
+    @property
+    def shortfall_units(self) -> int:
+        return self.requested_units - self.placeable_units
+
+    @property
+    def fits(self) -> bool:
+        return self.shortfall_units <= 0
+
+
+VOLUME_QUANT = Decimal('0.001')
+INDEX_PLAN_ATTEMPTS = 3
+
+# 入库规划路径的进程内计数：index 为索引规划成功，scan 为回退到逐货位扫描，
+# corrections 为纠正索引中过期的货位。仅供基准命令统计索引命中率，多线程下为近似值
+PLANNING_COUNTERS: Dict[str, int] = {'index': 0, 'scan': 0, 'corrections': 0}
+
+
+DEADLOCK_ERROR_CODES = {1205, 1213}  # MySQL: lock wait timeout / deadlock found
+
+
+def _is_retryable(exc: OperationalError) -> bool:
+    code = exc.args[0] if exc.args else None
+    if code in DEADLOCK_ERROR_CODES:
+        return True
+    message = str(exc).lower()
+    return 'deadlock' in message or 'database is locked' in message
+
+
+def retry_on_deadlock(func: Optional[Callable] = None, *, attempts: Optional[int] = None, base_delay: float = 0.05):
+    """Re-run a whole transaction when the database reports a deadlock or lock timeout.
+
+    Place it outside ``transaction.atomic`` so every attempt starts a fresh
+    transaction; inside an outer atomic block the error is re-raised as is.
+    Retries back off exponentially with jitter.
+    """
+
+    def decorator(inner: Callable) -> Callable:
+        @wraps(inner)
+        def wrapper(*args, **kwargs):
+            tries = attempts or getattr(settings, 'WAREHOUSE_DEADLOCK_RETRIES', 3)
+            for attempt in range(tries):
+                try:
+                    return inner(*args, **kwargs)
+                except OperationalError as exc:
+                    if attempt == tries - 1 or not _is_retryable(exc) or connection.in_atomic_block:
+                        raise
+                    time.sleep(base_delay * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+        return wrapper
+
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+def _units_volume(units: int, per_unit: Optional[Decimal]) -> Decimal:
+    return (Decimal(units) * (per_unit or Decimal('0'))).quantize(VOLUME_QUANT)
+
+
+def _increment(key_field: str, deltas: Dict[int, object], output_field) -> Case:
+    return Case(
+        *(When(**{key_field: key}, then=Value(delta)) for key, delta in deltas.items() if delta),
+        default=Value(0),
+        output_field=output_field,
+    )
+
+
+def _shift_column(queryset, key_field: str, field: str, deltas: Dict[int, object], output_field, **extra) -> int:
+    """Add per-row deltas to ``field`` in a single ``UPDATE ... CASE`` statement (plus ``extra`` assignments)."""
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return 0
+    increment = _increment(key_field, deltas, output_field)
+    return queryset.filter(**{f'{key_field}__in': list(deltas)}).update(**{field: F(field) + increment}, **extra)
+
+
+def _shift_occupancy(deltas: Dict[Location, Decimal]) -> None:
+    """Apply volume deltas to stored location occupancy (same transaction as the caller)."""
+    _shift_column(
+        Location.objects.all(),
+        'id',
+        'occupied_volume',
+        {loc.pk: delta for loc, delta in deltas.items()},
+        DecimalField(max_digits=15, decimal_places=3),
+        updated_at=timezone.now(),
+    )
+    for loc, delta in deltas.items():
+        loc.occupied_volume = (loc.occupied_volume or Decimal('0')) + delta
+    committed = {loc.pk: delta for loc, delta in deltas.items() if delta}
+    if committed:
+        queue_occupancy_deltas(committed)
+
+
+def _candidate_locations(
+    preferred: Optional[Location],
+    with_room_only: bool = True,
+    location_ids: Optional[Collection[int]] = None,
+) -> List[Location]:
+    """Load candidate locations with their stored occupancy in one query, preferred first, then by code."""
+    qs = Location.objects.with_room() if with_room_only else Location.objects.all()
+    if location_ids is not None:
+        qs = qs.filter(id__in=list(location_ids))
     if preferred:
-        locations.append(preferred)
-        other_qs = Location.objects.exclude(id=preferred.id)
+        qs = qs.annotate(
+            _rank=Case(When(id=preferred.id, then=Value(0)), default=Value(1), output_field=IntegerField())
+        ).order_by('_rank', 'code')
     else:
-        other_qs = Location.objects.all()
-    locations.extend(other_qs.order_by('code'))
-    return locations
+        qs = qs.order_by('code')
+    return list(qs)
+
+
+def _fit_units(loc: Location, per_unit: Decimal) -> int:
+    available = (loc.capacity_volume or Decimal('0')) - (loc.occupied_volume or Decimal('0'))
+    if available <= 0:
+        return 0
+    return int(available // per_unit)
+
+
+class PutawayStrategy:
+    """Chooses the next location for the units of one inbound that are still unplaced.
 
+    A strategy is instantiated per plan, so ``__init__`` may load whatever the
+    picks depend on (e.g. where the item already sits). ``pick`` receives the
+    free-space index and returns a location id, or ``None`` when nothing fits.
+    A strategy that sets ``location_ids`` confines the whole plan to those
+    locations: the preferred location outside the set is ignored and the scan
+    fallback only reads them; ``pick`` must stay within the set itself.
+    """
 
-def allocate_inbound(batch: ItemBatch, quantity: int, preferred: Optional[Location] = None) -> AllocationResult:
-    """Assign inbound units across available locations and grow batch stock."""
+    name = ''
+    label = ''
+    location_ids: Optional[FrozenSet[int]] = None
+
+    def __init__(self, item: 'Item', batch: Optional[ItemBatch] = None):
+        self.item = item
+        self.batch = batch
+
+    def pick(self, index: FreeSpaceIndex, per_unit: Decimal, remaining: int, exclude: Set[int]) -> Optional[int]:
+        raise NotImplementedError
+
+
+PUTAWAY_STRATEGIES: Dict[str, Type[PutawayStrategy]] = {}
+
+
+def register_putaway_strategy(cls: Type[PutawayStrategy]) -> Type[PutawayStrategy]:
+    PUTAWAY_STRATEGIES[cls.name] = cls
+    return cls
+
+
+def putaway_strategy_choices() -> List[Tuple[str, str]]:
+    return [(name, cls.label) for name, cls in PUTAWAY_STRATEGIES.items()]
+
+
+@register_putaway_strategy
+class FirstFitStrategy(PutawayStrategy):
+    name = 'first_fit'
+    label = '按编码顺序（首次适应）'
+
+    def pick(self, index, per_unit, remaining, exclude):
+        return index.first_fit(per_unit, exclude)
+
+
+@register_putaway_strategy
+class BestFitStrategy(PutawayStrategy):
+    name = 'best_fit'
+    label = '最紧凑货位（最佳适应）'
+
+    def pick(self, index, per_unit, remaining, exclude):
+        # 优先放入恰好能容纳全部剩余数量的最小货位，否则填满能放下至少一件的最小货位
+        location_id = index.best_fit(per_unit * remaining, exclude)
+        if location_id is None:
+            location_id = index.best_fit(per_unit, exclude)
+        return location_id
+
+
+@register_putaway_strategy
+class WorstFitStrategy(PutawayStrategy):
+    name = 'worst_fit'
+    label = '最空闲货位（最差适应）'
+
+    def pick(self, index, per_unit, remaining, exclude):
+        return index.worst_fit(per_unit, exclude)
+
+
+@register_putaway_strategy
+class FewestSplitsStrategy(PutawayStrategy):
+    name = 'fewest_splits'
+    label = '尽量少拆分'
+
+    def pick(self, index, per_unit, remaining, exclude):
+        # 有货位能一次放下就选最紧凑的，否则先填最空闲的货位
+        location_id = index.best_fit(per_unit * remaining, exclude)
+        if location_id is None:
+            location_id = index.worst_fit(per_unit, exclude)
+        return location_id
+
+
+@register_putaway_strategy
+class ConsolidateStrategy(PutawayStrategy):
+    name = 'consolidate'
+    label = '与已有批次合并存放'
+
+    def __init__(self, item, batch=None):
+        super().__init__(item, batch)
+        rows = (
+            BatchLocation.objects.filter(batch__item=item, quantity_units__gt=0)
+            .values_list('location_id', 'batch_id')
+        )
+        same_batch = [location_id for location_id, batch_id in rows if batch is not None and batch_id == batch.pk]
+        same_item = [location_id for location_id, batch_id in rows if location_id not in same_batch]
+        self.existing = list(dict.fromkeys(same_batch + same_item))
+
+    def pick(self, index, per_unit, remaining, exclude):
+        for location_id in self.existing:
+            available = index.available(location_id)
+            if location_id not in exclude and available is not None and available >= per_unit:
+                return location_id
+        return index.first_fit(per_unit, exclude)
+
+
+def resolve_putaway_strategy(item: 'Item', strategy: Optional[str] = None) -> str:
+    """Explicit strategy, else the item's, else its category's, else ``WAREHOUSE_PUTAWAY_STRATEGY``."""
+    candidates = [strategy, item.putaway_strategy]
+    if item.category_id:
+        candidates.append(item.category.putaway_strategy)
+    candidates.append(getattr(settings, 'WAREHOUSE_PUTAWAY_STRATEGY', 'first_fit'))
+    for name in candidates:
+        if name:
+            if name not in PUTAWAY_STRATEGIES:
+                raise ValueError(f'Unknown putaway strategy: {name}')
+            return name
+    return FirstFitStrategy.name
+
+
+def _plan_from_index(
+    strategy: PutawayStrategy,
+    per_unit: Decimal,
+    units: int,
+    preferred: Optional[Location],
+    exclude: Collection[int] = (),
+) -> List[Tuple[int, int]]:
+    picks: List[Tuple[int, int]] = []
+    used: Set[int] = set(exclude)
+    remaining = units
+    if preferred and strategy.location_ids is not None and preferred.pk not in strategy.location_ids:
+        preferred = None
+    if preferred and preferred.pk in used:
+        preferred = None
+    with free_space_index() as index:
+        if preferred and preferred.pk in index:
+            used.add(preferred.pk)
+            available = index.available(preferred.pk) or Decimal('0')
+            take = min(int(available // per_unit), remaining) if available > 0 else 0
+            if take > 0:
+                picks.append((preferred.pk, take))
+                remaining -= take
+        while remaining > 0:
+            location_id = strategy.pick(index, per_unit, remaining, used)
+            if location_id is None:
+                break
+            used.add(location_id)
+            take = min(int(index.available(location_id) // per_unit), remaining)
+            if take <= 0:
+                continue
+            picks.append((location_id, take))
+            remaining -= take
+    return picks
+
+
+def _plan_by_scan(
+    plan: PlacementPlan,
+    preferred: Optional[Location],
+    location_ids: Optional[Collection[int]] = None,
+) -> PlacementPlan:
+    PLANNING_COUNTERS['scan'] += 1
+    remaining = plan.requested_units
+    per_unit = plan.volume_per_unit
+    if location_ids is not None and preferred and preferred.pk not in location_ids:
+        preferred = None
+    if per_unit > 0:
+        for loc in _candidate_locations(preferred, location_ids=location_ids):
+            if remaining <= 0:
+                break
+            assign_units = min(_fit_units(loc, per_unit), remaining)
+            if assign_units <= 0:
+                continue
+            plan.assignments.append((loc, assign_units))
+            remaining -= assign_units
+    else:
+        # 零体积商品不占空间，全部放入第一个候选货位
+        candidates = _candidate_locations(preferred, with_room_only=False, location_ids=location_ids)[:1]
+        if candidates:
+            plan.assignments.append((candidates[0], remaining))
+    return plan
+
+
+def plan_inbound(
+    item: 'Item',
+    quantity: int,
+    preferred: Optional[Location] = None,
+    strategy: Optional[str] = None,
+    batch: Optional[ItemBatch] = None,
+    stale: Collection[int] = (),
+) -> PlacementPlan:
+    """Plan where ``quantity`` units of ``item`` would go, without writing anything.
+
+    The preferred location is filled first; the rest is placed by the putaway
+    strategy resolved for the item (see ``resolve_putaway_strategy``), which
+    picks from the in-process free-space index. Only the picked rows are
+    loaded to confirm their capacity. A stale pick is queued for correction
+    (applied to the index on commit), left out of the index picks (as are
+    the ``stale`` ids the caller already found) and the plan is retried;
+    a plan that still falls short is recomputed by
+    scanning all locations (only the strategy's ``location_ids`` if it sets
+    them) so ``placeable_units`` is exact. The plan can be
+    checked (``fits``) and then handed to ``allocate_inbound`` so capacity is
+    not scanned twice.
+    """
+    units = max(0, int(quantity))
+    per_unit = item.packaging_volume or Decimal('0')
+    plan = PlacementPlan(item=item, requested_units=units, volume_per_unit=per_unit, assignments=[])
+    if units == 0:
+        return plan
+    chosen = PUTAWAY_STRATEGIES[resolve_putaway_strategy(item, strategy)](item, batch)
+    if per_unit <= 0:
+        return _plan_by_scan(plan, preferred, chosen.location_ids)
+
+    # 索引在事务提交前不会被纠正，重试时跳过已知过期的货位
+    skipped = set(stale)
+    for _ in range(INDEX_PLAN_ATTEMPTS):
+        picks = _plan_from_index(chosen, per_unit, units, preferred, skipped)
+        rows = Location.objects.in_bulk([location_id for location_id, _ in picks])
+        outdated = False
+        for location_id, take in picks:
+            loc = rows.get(location_id)
+            if loc is None or _fit_units(loc, per_unit) < take:
+                outdated = True
+                skipped.add(location_id)
+                _correct_index(location_id)
+        if not outdated:
+            plan.assignments = [(rows[location_id], take) for location_id, take in picks]
+            break
+    if plan.fits:
+        PLANNING_COUNTERS['index'] += 1
+        return plan
+    plan.assignments = []
+    return _plan_by_scan(plan, preferred, chosen.location_ids)
+
+
+def _correct_index(location_id: int) -> None:
+    PLANNING_COUNTERS['corrections'] += 1
+    queue_index_correction(location_id)
+
+
+def _lock_locations(location_ids: Iterable[int]) -> Dict[int, Location]:
+    """Row-lock locations in ascending id order, the first step of the service lock order."""
+    ids = sorted(set(location_ids))
+    if not ids:
+        return {}
+    return {loc.pk: loc for loc in Location.objects.select_for_update().filter(id__in=ids).order_by('id')}
+
+
+def _confirm_plan(
+    plan: PlacementPlan,
+    preferred: Optional[Location],
+    strategy: Optional[str],
+    batch: ItemBatch,
+) -> List[Tuple[Location, int]]:
+    """Lock the planned locations and re-check them; re-plan if another writer took the space."""
+    per_unit = plan.volume_per_unit
+    confirmed: List[Tuple[Location, int]] = []
+    stale: Set[int] = set()
+    for attempt in range(INDEX_PLAN_ATTEMPTS):
+        locked = _lock_locations(loc.pk for loc, _ in plan.assignments)
+        confirmed = []
+        conflict = False
+        for loc, planned in plan.assignments:
+            row = locked.get(loc.pk)
+            if row is None:
+                fit = 0
+            elif per_unit > 0:
+                fit = min(_fit_units(row, per_unit), planned)
+            else:
+                fit = planned
+            if fit < planned:
+                conflict = True
+                stale.add(loc.pk)
+                _correct_index(loc.pk)
+            if fit > 0:
+                confirmed.append((row, fit))
+        if not conflict or attempt == INDEX_PLAN_ATTEMPTS - 1:
+            break
+        plan = plan_inbound(plan.item, plan.requested_units, preferred, strategy=strategy, batch=batch, stale=stale)
+    return confirmed
+
+
+def lock_inbound_plan(
+    plan: PlacementPlan,
+    preferred: Optional[Location] = None,
+    strategy: Optional[str] = None,
+    batch: Optional[ItemBatch] = None,
+) -> PlacementPlan:
+    """Lock and re-check the planned locations before the caller writes the batch row.
+
+    The inbound view and API create the batch (or sync its barcode) before
+    allocating; that save locks the batch and, through the stock signal, the
+    item's ``ItemStock`` row. Locking the locations first keeps the service
+    lock order (locations, batch, item stock) that outbound uses.
+    ``allocate_inbound`` then keeps the confirmed assignments.
+    """
+    plan.assignments = _confirm_plan(plan, preferred, strategy, batch)
+    plan.locked = True
+    return plan
+
+
+def receive_batch(
+    item: 'Item',
+    batch_number: str,
+    barcode: str,
+    production_date=None,
+    expiry_date=None,
+) -> ItemBatch:
+    """Get or create the inbound batch; an existing batch keeps its dates and only takes the new barcode.
+
+    Call after ``lock_inbound_plan``: saving the batch also locks the item's stock summary.
+    """
+    batch, created = ItemBatch.objects.get_or_create(
+        item=item,
+        batch_number=batch_number,
+        defaults={
+            'production_date': production_date,
+            'expiry_date': expiry_date,
+            'barcode': barcode,
+            'quantity_units': 0,
+        },
+    )
+    if not created and batch.barcode != barcode:
+        batch.barcode = barcode
+        batch.save(update_fields=['barcode', 'updated_at'])
+    return batch
+
+
+def allocate_inbound(
+    batch: ItemBatch,
+    quantity: int,
+    preferred: Optional[Location] = None,
+    plan: Optional[PlacementPlan] = None,
+    strategy: Optional[str] = None,
+) -> AllocationResult:
+    """Assign inbound units across available locations and grow batch stock.
+
+    Capacities are read in one query and the assignment is planned in memory,
+    so the number of writes does not depend on how many locations are used.
+    Pass a ``plan`` from ``plan_inbound`` to commit it without re-reading capacity.
+
+    Must run inside a transaction. Locks are taken in a fixed order (planned
+    locations by id, then the batch row) and all counters are moved with
+    ``F()`` updates, so parallel inbounds cannot oversubscribe a location.
+    A plan already passed through ``lock_inbound_plan`` is used as confirmed.
+    """
     units = max(0, int(quantity))
     if units == 0:
         return AllocationResult(0, 0, [])
+    if plan is None:
+        plan = plan_inbound(batch.item, units, preferred, strategy=strategy, batch=batch)
+    elif plan.item.pk != batch.item_id or plan.requested_units != units:
+        raise ValueError('Placement plan does not match the inbound batch/quantity')
 
+    assignments = plan.assignments if plan.locked else _confirm_plan(plan, preferred, strategy, batch)
+
+    ItemBatch.objects.filter(pk=batch.pk).update(
+        quantity_units=F('quantity_units') + units,
+        updated_at=timezone.now(),
+    )
     batch.quantity_units = batch.quantity_units + units
-    batch.save(update_fields=['quantity_units', 'updated_at'])
 
-    assignments: List[Tuple[Location, int]] = []
-    remaining = units
-    volume_per_unit = batch.item.packaging_volume or Decimal('0')
+    if assignments:
+        _write_assignments(batch, assignments, plan.volume_per_unit)
 
-    for loc in _iter_candidate_locations(preferred):
-        if remaining <= 0:
-            break
-        if volume_per_unit > 0:
-            available_volume = Decimal(str(loc.available_volume))
-            if available_volume <= 0:
-                continue
-            max_units_fit = int(available_volume // volume_per_unit)
-            if max_units_fit <= 0:
-                continue
-            assign_units = min(max_units_fit, remaining)
-        else:
-            assign_units = remaining
-        if assign_units <= 0:
-            continue
-        bl, _ = BatchLocation.objects.get_or_create(batch=batch, location=loc)
-        bl.quantity_units = bl.quantity_units + assign_units
-        bl.save(update_fields=['quantity_units'])
-        assignments.append((loc, assign_units))
-        remaining -= assign_units
+    refresh_item_stock([batch.item_id])
+
+    allocated = sum(n for _, n in assignments)
+    return AllocationResult(allocated_units=allocated, remaining_units=units - allocated, assignments=assignments)
 
-    return AllocationResult(allocated_units=units - remaining, remaining_units=remaining, assignments=assignments)
+
+def _write_assignments(batch: ItemBatch, assignments: List[Tuple[Location, int]], volume_per_unit: Decimal) -> None:
+    units_by_location = {loc.pk: assign_units for loc, assign_units in assignments}
+    existing = set(
+        BatchLocation.objects.filter(batch=batch, location_id__in=list(units_by_location))
+        .values_list('location_id', flat=True)
+    )
+    _shift_column(
+        BatchLocation.objects.filter(batch=batch),
+        'location_id',
+        'quantity_units',
+        {location_id: n for location_id, n in units_by_location.items() if location_id in existing},
+        PositiveIntegerField(),
+    )
+    BatchLocation.objects.bulk_create(
+        [
+            BatchLocation(batch=batch, location_id=location_id, quantity_units=n)
+            for location_id, n in units_by_location.items()
+            if location_id not in existing
+        ]
+    )
+    _shift_occupancy({loc: _units_volume(n, volume_per_unit) for loc, n in assignments})
+
+
+def _apply_drains(drains: List[Tuple[BatchLocation, int]]) -> None:
+    """Write planned ``(batch_location, take)`` pairs: one update, one delete, one occupancy update."""
+    emptied = [bl.pk for bl, take in drains if bl.quantity_units - take <= 0]
+    BatchLocation.objects.filter(pk__in=emptied).delete()
+    _shift_column(
+        BatchLocation.objects.all(),
+        'id',
+        'quantity_units',
+        {bl.pk: -take for bl, take in drains if bl.pk not in emptied},
+        IntegerField(),
+    )
+    freed: Dict[Location, Decimal] = {}
+    for bl, take in drains:
+        bl.quantity_units -= take
+        freed[bl.location] = freed.get(bl.location, Decimal('0')) - _units_volume(take, bl.batch.item.packaging_volume)
+    _shift_occupancy(freed)
 
 
 def release_outbound(batch: ItemBatch, quantity: int, preferred: Optional[Location] = None) -> DeallocationResult:
-    """Release stock for outbound movement, favouring preferred location first."""
+    """Release stock for outbound movement, favouring preferred location first.
+
+    Must run inside a transaction. The batch's locations are locked by id,
+    then the batch row, then its ``BatchLocation`` rows, matching the lock
+    order of ``allocate_inbound``; stock is checked against the locked values.
+    """
     units = max(0, int(quantity))
     if units == 0:
         return DeallocationResult(0, [])
     if units > batch.quantity_units:
         raise ValueError('Not enough stock for outbound')
 
-    target = min(units, batch.quantity_units)
-    assignments: List[Tuple[Location, int]] = []
-    remaining = target
-
-    def _drain(bl: BatchLocation, wanted: int) -> int:
-        take = min(bl.quantity_units, wanted)
-        if take <= 0:
-            return 0
-        bl.quantity_units = bl.quantity_units - take
-        if bl.quantity_units <= 0:
-            bl.delete()
-        else:
-            bl.save(update_fields=['quantity_units'])
-        assignments.append((bl.location, take))
-        return take
+    _lock_locations(BatchLocation.objects.filter(batch=batch).values_list('location_id', flat=True))
+    locked = ItemBatch.objects.select_for_update().get(pk=batch.pk)
+    batch.quantity_units = locked.quantity_units
+    if units > batch.quantity_units:
+        raise ValueError('Not enough stock for outbound')
 
+    rows = list(
+        BatchLocation.objects.select_for_update()
+        .filter(batch=batch, quantity_units__gt=0)
+        .select_related('location')
+        .order_by('-quantity_units', 'location__code')
+    )
     if preferred:
-        try:
-            bl = BatchLocation.objects.get(batch=batch, location=preferred)
-            drained = _drain(bl, remaining)
-            remaining -= drained
-        except BatchLocation.DoesNotExist:
-            pass
-
-    if remaining > 0:
-        for bl in BatchLocation.objects.filter(batch=batch).order_by('-quantity_units'):
-            drained = _drain(bl, remaining)
-            remaining -= drained
-            if remaining <= 0:
-                break
+        rows.sort(key=lambda bl: bl.location_id != preferred.pk)
+
+    drains: List[Tuple[BatchLocation, int]] = []
+    remaining = units
+    for bl in rows:
+        if remaining <= 0:
+            break
+        take = min(bl.quantity_units, remaining)
+        bl.batch = batch
+        drains.append((bl, take))
+        remaining -= take
+    if drains:
+        _apply_drains(drains)
 
-    removed = target - remaining
+    removed = units - remaining
     if removed > 0:
-        batch.quantity_units = max(0, batch.quantity_units - removed)
-        batch.save(update_fields=['quantity_units', 'updated_at'])
+        ItemBatch.objects.filter(pk=batch.pk).update(
+            quantity_units=F('quantity_units') - removed,
+            updated_at=timezone.now(),
+        )
+        batch.quantity_units = batch.quantity_units - removed
+        refresh_item_stock([batch.item_id])
+
+    return DeallocationResult(removed_units=removed, assignments=[(bl.location, take) for bl, take in drains])
+
+
+def plan_fefo_outbound(item: 'Item', quantity: int, for_update: bool = False) -> PickPlan:
+    """Pick ``quantity`` units of ``item`` first-expired-first-out with one ordered query.
 
-    return DeallocationResult(removed_units=removed, assignments=assignments)
+    Batches without an expiry date go last; ties are broken by batch age and
+    location code. Pass ``for_update`` inside a transaction to lock the rows.
+    """
+    units = max(0, int(quantity))
+    plan = PickPlan(item=item, requested_units=units, picks=[])
+    if units == 0:
+        return plan
+    rows = (
+        BatchLocation.objects.filter(batch__item=item, quantity_units__gt=0)
+        .select_related('batch', 'location')
+        .order_by(F('batch__expiry_date').asc(nulls_last=True), 'batch__created_at', 'batch_id', 'location__code')
+    )
+    if for_update:
+        rows = rows.select_for_update()
+    remaining = units
+    for bl in rows.iterator(chunk_size=200):
+        take = min(bl.quantity_units, remaining)
+        bl.batch.item = item
+        plan.picks.append((bl, take))
+        remaining -= take
+        if remaining <= 0:
+            break
+    return plan
+
+
+def release_item_outbound(item: 'Item', quantity: int, user=None, note: str = '') -> ItemReleaseResult:
+    """Ship ``quantity`` units of ``item`` across its batches, earliest expiry first.
+
+    Must run inside a transaction. Locks follow the service order (locations by
+    id, then batches by id, then ``BatchLocation`` rows); the picks are written
+    with bulk updates and one ``Movement`` per touched batch is bulk-created.
+    Raises ``ValueError`` when the item's located stock is insufficient.
+    """
+    units = max(0, int(quantity))
+    if units == 0:
+        return ItemReleaseResult(0, [], [])
+
+    _lock_locations(
+        BatchLocation.objects.filter(batch__item=item, quantity_units__gt=0).values_list('location_id', flat=True)
+    )
+    list(ItemBatch.objects.select_for_update().filter(item=item, quantity_units__gt=0).order_by('id').values_list('id'))
+    plan = plan_fefo_outbound(item, units, for_update=True)
+    if not plan.fits:
+        raise ValueError('Not enough stock for outbound')
+
+    _apply_drains(plan.picks)
+    per_batch: Dict[int, int] = {}
+    batches: Dict[int, ItemBatch] = {}
+    for bl, take in plan.picks:
+        per_batch[bl.batch_id] = per_batch.get(bl.batch_id, 0) + take
+        batches[bl.batch_id] = bl.batch
+    _shift_column(
+        ItemBatch.objects.all(),
+        'id',
+        'quantity_units',
+        {batch_id: -take for batch_id, take in per_batch.items()},
+        IntegerField(),
+        updated_at=timezone.now(),
+    )
+
+    movements = []
+    # 备注由调用方备注与货位编码拼成，整体截断到字段长度，超长会在严格模式下报错
+    note_length = Movement._meta.get_field('note').max_length
+    for batch_id, take in per_batch.items():
+        batch = batches[batch_id]
+        batch.quantity_units -= take
+        locations = [bl.location for bl, _ in plan.picks if bl.batch_id == batch_id]
+        movements.append(
+            Movement(
+                batch=batch,
+                direction=Movement.Direction.OUT,
+                quantity_units=take,
+                user=user,
+                location=locations[0] if len(locations) == 1 else None,
+                note=((f'{note} ' if note else '') + '先到期先出：' + '，'.join(loc.code for loc in locations))[:note_length],
+            )
+        )
+    refresh_item_stock([item.pk])
+    Movement.objects.bulk_create(movements)
+    record_movements(movements)
+    return ItemReleaseResult(removed_units=plan.picked_units, picks=plan.picks, movements=movements)
 
 
 def max_placeable_units(item: 'Item', preferred: Optional[Location] = None) -> int:
     per_unit = item.packaging_volume or Decimal('0')
     if per_unit <= 0:
         return 1000000000
-    total = 0
-    for loc in _iter_candidate_locations(preferred):
-        avail = Decimal(str(loc.available_volume))
-        if avail <= 0:
+    return sum(_fit_units(loc, per_unit) for loc in _candidate_locations(preferred))
+
+
+def measure_occupancy(location_ids: Optional[Iterable[int]] = None) -> Dict[int, Decimal]:
+    """Compute occupied volume per location from ``BatchLocation`` rows in one aggregate query."""
+    qs = Location.objects.with_live_occupancy()
+    if location_ids is not None:
+        qs = qs.filter(id__in=list(location_ids))
+    return {loc_id: Decimal(str(used or 0)).quantize(VOLUME_QUANT) for loc_id, used in qs.values_list('id', 'live_used')}
+
+
+def recompute_occupancy(location_ids: Optional[Iterable[int]] = None, dry_run: bool = False) -> List[Tuple[Location, Decimal, Decimal]]:
+    """Repair drift between stored and measured occupancy.
+
+    Returns ``(location, stored, measured)`` for every location that was out of sync.
+    """
+    locations = Location.objects.with_live_occupancy()
+    if location_ids is not None:
+        locations = locations.filter(id__in=list(location_ids))
+    drifted: List[Tuple[Location, Decimal, Decimal]] = []
+    for loc in locations.order_by('code'):
+        stored = (loc.occupied_volume or Decimal('0')).quantize(VOLUME_QUANT)
+        actual = Decimal(str(loc.live_used or 0)).quantize(VOLUME_QUANT)
+        if stored == actual:
             continue
-        total += int(avail // per_unit)
-    return total
+        drifted.append((loc, stored, actual))
+        if not dry_run:
+            Location.objects.filter(pk=loc.pk).update(occupied_volume=actual, updated_at=timezone.now())
+            loc.occupied_volume = actual
+    if drifted and not dry_run:
+        transaction.on_commit(invalidate_free_space_index)
+        # 首页统计与货位、库存页面都显示占用，和其他占用写入一样让缓存失效
+        transaction.on_commit(lambda: bump_cache_version(DASHBOARD, STOCK))
+    return drifted
+
+
+def refresh_item_occupancy(item: 'Item') -> None:
+    """Re-measure the locations holding ``item``, e.g. after its packaging volume changed."""
+    location_ids = (
+        BatchLocation.objects.filter(batch__item=item)
+        .values_list('location_id', flat=True)
+        .distinct()
+    )
+    recompute_occupancy(list(location_ids))
+
+
+ROLLUP_FIELDS = ('moves', 'units_in', 'units_out')
+
+
+def _movement_day(created_at: datetime) -> date:
+    return timezone.localdate(created_at) if timezone.is_aware(created_at) else created_at.date()
+
+
+def _rollup_deltas(rows: Iterable[Tuple[int, str, int, datetime]], sign: int = 1) -> Dict[Tuple[int, date], List[int]]:
+    """Fold ``(item_id, direction, quantity, created_at)`` rows into per-(item, day) counters."""
+    deltas: Dict[Tuple[int, date], List[int]] = {}
+    for item_id, direction, quantity, created_at in rows:
+        counters = deltas.setdefault((item_id, _movement_day(created_at)), [0, 0, 0])
+        counters[0] += sign
+        counters[1 if direction == Movement.Direction.IN else 2] += sign * quantity
+    return deltas
+
+
+def record_movements(movements: Iterable[Movement], sign: int = 1) -> None:
+    """Fold saved movements into the ``ItemDailyMovement`` rollup (same transaction as the caller).
+
+    ``sign=-1`` takes movements back out, e.g. when they are deleted; rollup
+    rows are only created for positive deltas so a cascading item delete never
+    resurrects them.
+    """
+    movements = [mv for mv in movements if mv.created_at is not None]
+    if not movements:
+        return
+    # 批次通常已随明细加载；未加载的一次性查出所属商品
+    item_ids = {mv.batch_id: mv.batch.item_id for mv in movements if Movement.batch.is_cached(mv)}
+    missing = {mv.batch_id for mv in movements} - set(item_ids)
+    if missing:
+        item_ids.update(ItemBatch.objects.filter(pk__in=missing).values_list('id', 'item_id'))
+    deltas = _rollup_deltas(
+        (
+            (item_ids[mv.batch_id], mv.direction, mv.quantity_units, mv.created_at)
+            for mv in movements
+            if mv.batch_id in item_ids
+        ),
+        sign,
+    )
+    _apply_rollup(deltas, create=sign > 0)
+    # 批量写入的明细不触发信号，这里统一让首页统计与库存页面缓存失效
+    transaction.on_commit(lambda: bump_cache_version(DASHBOARD, STOCK))
+
+
+def _apply_rollup(deltas: Dict[Tuple[int, date], List[int]], create: bool = True) -> None:
+    deltas = {key: counters for key, counters in deltas.items() if any(counters)}
+    if not deltas:
+        return
+    if create:
+        ItemDailyMovement.objects.bulk_create(
+            [ItemDailyMovement(item_id=item_id, day=day) for item_id, day in deltas],
+            ignore_conflicts=True,
+        )
+    ids = {
+        (item_id, day): pk
+        for pk, item_id, day in ItemDailyMovement.objects.filter(
+            item_id__in={item_id for item_id, _ in deltas},
+            day__in={day for _, day in deltas},
+        ).values_list('id', 'item_id', 'day')
+    }
+    by_id = {ids[key]: counters for key, counters in deltas.items() if key in ids}
+    if not by_id:
+        return
+    ItemDailyMovement.objects.filter(id__in=list(by_id)).update(
+        **{
+            name: F(name) + _increment('id', {pk: counters[i] for pk, counters in by_id.items()}, IntegerField())
+            for i, name in enumerate(ROLLUP_FIELDS)
+        }
+    )
+
+
+def rebuild_movement_rollup(since: Optional[date] = None) -> int:
+    """Recompute the rollup from raw ``Movement`` rows, optionally only from ``since`` on.
+
+    Streams the history once and writes the counters with bulk inserts.
+    Returns the number of rollup rows written.
+    """
+    movements = Movement.objects.all()
+    rollups = ItemDailyMovement.objects.all()
+    if since is not None:
+        # 按本地日期切分，与汇总时的日期口径一致
+        start = timezone.make_aware(datetime.combine(since, datetime.min.time())) if settings.USE_TZ else since
+        movements = movements.filter(created_at__gte=start)
+        rollups = rollups.filter(day__gte=since)
+    deltas = _rollup_deltas(
+        movements.order_by().values_list('batch__item_id', 'direction', 'quantity_units', 'created_at').iterator(chunk_size=2000)
+    )
+    rollups.delete()
+    ItemDailyMovement.objects.bulk_create(
+        [
+            ItemDailyMovement(item_id=item_id, day=day, moves=moves, units_in=units_in, units_out=units_out)
+            for (item_id, day), (moves, units_in, units_out) in deltas.items()
+        ],
+        batch_size=1000,
+    )
+    return len(deltas)
+
+
+STOCK_FIELDS = ('total_units', 'near_expiry_units', 'batch_count', 'location_count', 'computed_on')
+
+
+def measure_item_stock(item_ids: Iterable[int], today: Optional[date] = None) -> Dict[int, Dict[str, object]]:
+    """Compute the ``ItemStock`` projection for ``item_ids`` from batches and placements (two grouped queries)."""
+    ids = list(item_ids)
+    today = today or timezone.localdate()
+    threshold = today + timezone.timedelta(days=NEAR_EXPIRY_DAYS)
+    measured = {
+        item_id: {'total_units': 0, 'near_expiry_units': 0, 'batch_count': 0, 'location_count': 0, 'computed_on': today}
+        for item_id in ids
+    }
+    batches = (
+        ItemBatch.objects.filter(item_id__in=ids)
+        .values('item_id')
+        .annotate(
+            total=Sum('quantity_units'),
+            near=Sum('quantity_units', filter=Q(expiry_date__isnull=False, expiry_date__lte=threshold)),
+            batches=Count('id'),
+        )
+        .order_by()
+    )
+    for row in batches:
+        measured[row['item_id']].update(
+            total_units=row['total'] or 0,
+            near_expiry_units=row['near'] or 0,
+            batch_count=row['batches'],
+        )
+    placed = (
+        BatchLocation.objects.filter(batch__item_id__in=ids, quantity_units__gt=0)
+        .values('batch__item_id')
+        .annotate(locations=Count('location_id', distinct=True))
+        .order_by()
+    )
+    for row in placed:
+        measured[row['batch__item_id']]['location_count'] = row['locations']
+    return measured
+
+
+def refresh_item_stock(item_ids: Iterable[int], create: bool = True) -> None:
+    """Recompute the ``ItemStock`` rows of ``item_ids`` inside the caller's transaction.
+
+    The rows are locked (by item id, after every other stock lock) before the
+    batches are re-read, so concurrent writers to the same item serialize and
+    the last one to commit always sees the others' changes. ``create=False``
+    only refreshes existing rows, for callers running inside an item delete.
+    """
+    ids = sorted(set(item_ids))
+    if not ids:
+        return
+    with transaction.atomic():
+        if create:
+            ItemStock.objects.bulk_create(
+                [ItemStock(item_id=item_id, computed_on=timezone.localdate()) for item_id in ids],
+                ignore_conflicts=True,
+            )
+        rows = list(ItemStock.objects.select_for_update().filter(item_id__in=ids).order_by('item_id'))
+        if not rows:
+            return
+        measured = measure_item_stock([row.item_id for row in rows])
+        for row in rows:
+            for name, value in measured[row.item_id].items():
+                setattr(row, name, value)
+            row.updated_at = timezone.now()
+        ItemStock.objects.bulk_update(rows, STOCK_FIELDS + ('updated_at',))
+    transaction.on_commit(lambda: bump_cache_version(DASHBOARD, STOCK))
+
 
+def refresh_stale_item_stock(chunk_size: int = 500) -> int:
+    """Re-date rows whose near-expiry figure was computed on an earlier day; returns the number refreshed."""
+    today = timezone.localdate()
+    stale = list(ItemStock.objects.filter(computed_on__lt=today).values_list('item_id', flat=True))
+    for start in range(0, len(stale), chunk_size):
+        refresh_item_stock(stale[start:start + chunk_size], create=False)
+    return len(stale)
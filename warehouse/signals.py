@@ -1,9 +1,17 @@
-﻿from django.db.models.signals import post_migrate
+﻿from django.db import transaction
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete, pre_save
 from django.contrib.auth.models import Group, Permission
 from django.contrib.contenttypes.models import ContentType
 from django.dispatch import receiver
+from django.utils import timezone
 
-from .models import BatchLocation, Item, ItemBatch, Location, Movement
+from .freespace import invalidate_free_space_index
+from .images import delete_variants, generate_variants, is_current
+from .models import BatchLocation, Category, Item, ItemBatch, ItemImage, Location, Movement, SearchTerm
+from .scancodes import scan_cache
+from .search import INDEXED_FIELDS, index_objects, unindex_objects
+from .services import recompute_occupancy, record_movements, refresh_item_stock
+from .stats import CATALOG, DASHBOARD, SCAN, STOCK, bump_cache_version
 
 
 @receiver(post_migrate)
@@ -34,3 +42,165 @@ def create_default_groups(sender, **kwargs):
     operators.permissions.add(add_mv, view_mv)
 
 
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+def reset_free_space_index(sender, **kwargs):
+    # 货位新增/删除或容量变化时重建空闲空间索引
+    transaction.on_commit(invalidate_free_space_index)
+
+
+@receiver(pre_delete, sender=ItemBatch)
+def remember_batch_locations(sender, instance, **kwargs):
+    instance._occupied_location_ids = list(instance.locations.values_list('location_id', flat=True))
+
+
+@receiver(post_delete, sender=ItemBatch)
+def release_deleted_batch_space(sender, instance, **kwargs):
+    # 删除批次（含删除商品时的级联删除）会一并删除批次货位，需重新核算这些货位的占用
+    location_ids = getattr(instance, '_occupied_location_ids', None)
+    if location_ids:
+        recompute_occupancy(location_ids)
+
+
+@receiver(post_save, sender=ItemBatch)
+def refresh_stock_on_batch_save(sender, instance, **kwargs):
+    refresh_item_stock([instance.item_id])
+
+
+@receiver(post_delete, sender=ItemBatch)
+def refresh_stock_on_batch_delete(sender, instance, **kwargs):
+    # 删除商品时汇总行可能已被级联删除，不能再新建
+    refresh_item_stock([instance.item_id], create=False)
+
+
+@receiver(pre_save, sender=Movement)
+def remember_movement(sender, instance, **kwargs):
+    # 在后台修改明细时，先记下旧值以便从每日汇总中扣回
+    instance._previous = sender.objects.filter(pk=instance.pk).first() if instance.pk else None
+
+
+@receiver(post_save, sender=Movement)
+def roll_up_movement(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous', None)
+    if previous is not None:
+        record_movements([previous], sign=-1)
+    record_movements([instance])
+
+
+@receiver(post_delete, sender=Movement)
+def roll_back_movement(sender, instance, **kwargs):
+    record_movements([instance], sign=-1)
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+@receiver(post_save, sender=ItemBatch)
+@receiver(post_delete, sender=ItemBatch)
+@receiver(post_save, sender=Movement)
+@receiver(post_delete, sender=Movement)
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+def invalidate_stock_caches(sender, **kwargs):
+    # BatchLocation 不挂信号，以免服务层批量删除退化为逐行删除；后台改动时由 refresh_item_stock 让缓存失效
+    transaction.on_commit(lambda: bump_cache_version(DASHBOARD, STOCK))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+def invalidate_catalog_pages(sender, **kwargs):
+    # 分类名出现在库存总览中，一并失效
+    transaction.on_commit(lambda: bump_cache_version(CATALOG, STOCK))
+
+
+@receiver(post_save, sender=ItemImage)
+@receiver(post_delete, sender=ItemImage)
+def touch_item_on_image_change(sender, instance, **kwargs):
+    # 分类浏览的分类片段以商品最近更新时间为键，图片增删改时同步更新
+    Item.objects.filter(pk=instance.item_id).update(updated_at=timezone.now())
+    transaction.on_commit(lambda: bump_cache_version(CATALOG))
+
+
+@receiver(post_save, sender=Category)
+@receiver(pre_delete, sender=Category)
+def touch_items_on_category_change(sender, instance, **kwargs):
+    # 库存总览的 ETag 取商品最近更新时间；分类改名或删除（商品分类置空不触发 auto_now）时同步更新
+    Item.objects.filter(category=instance).update(updated_at=timezone.now())
+
+
+SCAN_CODE_FIELDS = {Item: 'sku_code', ItemBatch: 'barcode'}
+
+
+@receiver(pre_save, sender=Item)
+@receiver(pre_save, sender=ItemBatch)
+def remember_scan_code(sender, instance, update_fields=None, **kwargs):
+    # 记下保存前的编码，保存后只在编码确实变化时才递增共享版本号
+    field = SCAN_CODE_FIELDS[sender]
+    if instance.pk is None:
+        instance._previous_scan_code = None
+    elif update_fields is not None and field not in update_fields:
+        instance._previous_scan_code = getattr(instance, field)
+    else:
+        instance._previous_scan_code = sender.objects.filter(pk=instance.pk).values_list(field, flat=True).first()
+
+
+@receiver(post_save, sender=Item)
+def forget_item_scan_code(sender, instance, created, **kwargs):
+    # 本进程按商品 id 清理（含改名前的旧编码）；新商品的 SKU 不可能已被缓存（未知编码不缓存），无需通知其他进程
+    scan_cache.discard(instance.sku_code, item_id=instance.pk)
+    previous = getattr(instance, '_previous_scan_code', None)
+    if not created and previous is not None and previous != instance.sku_code:
+        transaction.on_commit(lambda: bump_cache_version(SCAN))
+
+
+@receiver(post_save, sender=ItemBatch)
+def forget_batch_scan_code(sender, instance, created, **kwargs):
+    # 新批次的条码可能与已缓存的同名 SKU 相同（条码优先），新建或改条码时都要通知其他进程
+    scan_cache.discard(instance.barcode, batch_id=instance.pk)
+    if getattr(instance, '_previous_scan_code', None) != instance.barcode:
+        transaction.on_commit(lambda: bump_cache_version(SCAN))
+
+
+@receiver(post_delete, sender=Item)
+@receiver(post_delete, sender=ItemBatch)
+def forget_deleted_scan_code(sender, instance, **kwargs):
+    if sender is Item:
+        scan_cache.discard(instance.sku_code, item_id=instance.pk)
+    else:
+        scan_cache.discard(instance.barcode, batch_id=instance.pk)
+    transaction.on_commit(lambda: bump_cache_version(SCAN))
+
+
+SEARCH_KIND_BY_MODEL = {Item: SearchTerm.Kind.ITEM, ItemBatch: SearchTerm.Kind.BATCH, Location: SearchTerm.Kind.LOCATION}
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_save, sender=ItemBatch)
+@receiver(post_save, sender=Location)
+def index_search_terms(sender, instance, update_fields=None, **kwargs):
+    kind = SEARCH_KIND_BY_MODEL[sender]
+    # 只更新库存、占用等非检索字段时无需重建词元
+    if update_fields is not None and not INDEXED_FIELDS[kind] & set(update_fields):
+        return
+    index_objects(kind, [instance])
+
+
+@receiver(post_delete, sender=Item)
+@receiver(post_delete, sender=ItemBatch)
+@receiver(post_delete, sender=Location)
+def remove_search_terms(sender, instance, **kwargs):
+    unindex_objects(SEARCH_KIND_BY_MODEL[sender], [instance.pk])
+
+
+@receiver(post_save, sender=ItemImage)
+def build_image_variants(sender, instance, **kwargs):
+    # 新上传或替换图片后生成缩略图；提交后执行，避免回滚时留下孤立文件
+    if instance.image and not is_current(instance):
+        transaction.on_commit(lambda: generate_variants(instance))
+
+
+@receiver(post_delete, sender=ItemImage)
+def remove_image_variants(sender, instance, **kwargs):
+    variants = instance.variants
+    transaction.on_commit(lambda: delete_variants(variants))
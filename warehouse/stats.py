@@ -0,0 +1,98 @@
+"""Cached dashboard statistics.
+
+Cache entries are keyed by a per-namespace version number kept in the cache
+itself. Writers never delete entries; they bump the version (see
+``bump_cache_version``) and readers simply miss on the next request, which
+works the same on local-memory, file and shared backends.
+"""
+from __future__ import annotations
+
+from typing import Dict, List, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Aggregate, Count, QuerySet, Sum, Value
+from django.utils import timezone
+
+from .models import NEAR_EXPIRY_DAYS, Item, ItemBatch, ItemDailyMovement, ItemStock, Location
+
+DASHBOARD = 'dashboard'
+# 页面内容缓存（见 warehouse.pagecache）：分类浏览页，以及库存总览、临期列表等库存页面
+CATALOG = 'catalog'
+STOCK = 'stock'
+# 扫码识别码缓存（见 warehouse.scancodes）：各进程据此清空本进程的缓存
+SCAN = 'scan'
+
+
+def _version_key(namespace: str) -> str:
+    return f'warehouse:{namespace}:version'
+
+
+def cache_version(namespace: str) -> int:
+    return cache.get_or_set(_version_key(namespace), 1, None)
+
+
+async def acache_version(namespace: str) -> int:
+    return await cache.aget_or_set(_version_key(namespace), 1, None)
+
+
+def bump_cache_version(*namespaces: str) -> None:
+    """Invalidate every entry cached under ``namespaces``."""
+    for namespace in namespaces:
+        key = _version_key(namespace)
+        # 版本号不存在时从 2 开始，保证与读取方默认的 1 不同
+        if not cache.add(key, 2, None):
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, 2, None)
+
+
+def _scalar(queryset, aggregate) -> Tuple[str, List]:
+    """Compile ``aggregate`` over ``queryset`` into a scalar subquery (NULL-safe)."""
+    query = queryset.order_by().annotate(_one=Value(1)).values('_one').annotate(v=aggregate).values('v').query
+    sql, params = query.sql_with_params()
+    return f'COALESCE(({sql}), 0)', list(params)
+
+
+def fetch_scalars(aggregates: Dict[str, Tuple[QuerySet, Aggregate]]) -> Dict[str, object]:
+    """Evaluate ``name -> (queryset, aggregate)`` in one round trip; empty aggregates read as 0."""
+    parts = [_scalar(queryset, aggregate) for queryset, aggregate in aggregates.values()]
+    sql = 'SELECT ' + ', '.join(part for part, _ in parts)
+    params = [param for _, part_params in parts for param in part_params]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    return dict(zip(aggregates, row))
+
+
+def compute_dashboard_stats() -> Dict[str, int]:
+    """Compute all dashboard KPIs in one round trip (one SELECT of scalar subqueries)."""
+    today = timezone.localdate()
+    threshold = today + timezone.timedelta(days=NEAR_EXPIRY_DAYS)
+    kpis = {
+        'items_count': (Item.objects.all(), Count('id')),
+        'batches_count': (ItemStock.objects.all(), Sum('batch_count')),
+        'units_on_hand': (ItemStock.objects.all(), Sum('total_units')),
+        'near_expiry_count': (
+            ItemBatch.objects.filter(expiry_date__isnull=False, expiry_date__lte=threshold),
+            Count('id'),
+        ),
+        'today_in_units': (ItemDailyMovement.objects.filter(day=today), Sum('units_in')),
+        'today_out_units': (ItemDailyMovement.objects.filter(day=today), Sum('units_out')),
+        'full_locations': (Location.objects.near_full(1), Count('id')),
+        'near_full_locations': (Location.objects.near_full(), Count('id')),
+    }
+    return {name: int(value or 0) for name, value in fetch_scalars(kpis).items()}
+
+
+def dashboard_stats() -> Dict[str, int]:
+    """Dashboard KPIs from the cache, recomputed after any stock change or at the next local day."""
+    key = f'warehouse:{DASHBOARD}:{timezone.localdate().isoformat()}'
+    version = cache_version(DASHBOARD)
+    stats = cache.get(key, version=version)
+    if stats is None:
+        stats = compute_dashboard_stats()
+        cache.set(key, stats, settings.WAREHOUSE_DASHBOARD_CACHE_TTL, version=version)
+    return stats
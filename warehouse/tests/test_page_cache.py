@@ -0,0 +1,237 @@
+import re
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.signals import template_rendered
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from warehouse.models import BatchLocation, Category, Item, ItemBatch, ItemImage, Location, Movement
+from warehouse.services import recompute_occupancy, refresh_item_stock, release_outbound
+from warehouse.stats import DASHBOARD, STOCK, cache_version
+
+PREFIX = 'CACHECHECK'
+# 命中时只剩会话与用户两条查询
+HIT_QUERIES = 2
+# 每次渲染的 CSRF 令牌掩码不同，比较页面时去掉
+CSRF_INPUT = re.compile(r'<input type="hidden" name="csrfmiddlewaretoken"[^>]*>')
+FRAGMENTS = {
+    'catalog': 'warehouse/snippets/catalog_category.html',
+    'inventory': 'warehouse/snippets/inventory_row.html',
+}
+
+
+class PageCacheChecks:
+    """Page and fragment caching of the catalog, near-expiry and inventory pages, and their ETags.
+
+    Hits run no query on business data; every kind of change invalidates the
+    pages at once and re-renders only the fragments it touched. Subclasses
+    pick the cache backend.
+    """
+
+    backend = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cache_dir = tempfile.mkdtemp(prefix='wms-cache-')
+        cls.cache_settings = override_settings(CACHES={'default': {'BACKEND': cls.backend, 'LOCATION': cls.cache_dir}})
+        cls.cache_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.cache_settings.disable()
+        shutil.rmtree(cls.cache_dir, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        today = timezone.localdate()
+        cls.user = get_user_model().objects.create_superuser(PREFIX.lower(), f'{PREFIX.lower()}@example.com', None)
+        cls.location = Location.objects.create(code=f'{PREFIX}-L1', name='缓存检查货位', capacity_volume=Decimal('1000'))
+        category = Category.objects.create(name=f'{PREFIX}-分类A', slug=f'{PREFIX.lower()}-a')
+        cls.other = Category.objects.create(name=f'{PREFIX}-分类B', slug=f'{PREFIX.lower()}-b')
+        items = [
+            Item.objects.create(
+                name=f'{PREFIX}-商品{i}',
+                sku_code=f'{PREFIX}-{i}',
+                category=category if i < 2 else cls.other,
+                packaging_volume=Decimal('1.000'),
+            )
+            for i in range(4)
+        ]
+        batches = []
+        for i, item in enumerate(items):
+            batch = ItemBatch.objects.create(
+                item=item,
+                batch_number=f'{PREFIX}-{i}',
+                barcode=f'{PREFIX}-{i}',
+                expiry_date=today + timedelta(days=5 + i),
+                quantity_units=20,
+            )
+            BatchLocation.objects.create(batch=batch, location=cls.location, quantity_units=20)
+            batches.append(batch)
+        cls.item, cls.batch = items[0], batches[0]
+
+    def setUp(self):
+        # 数据库按测试回滚，缓存也要从空开始，否则会命中上一个测试写入的页面
+        cache.clear()
+        self.client.force_login(self.user)
+        self.pages = {
+            'catalog': reverse('warehouse:catalog'),
+            'near_expiry': reverse('warehouse:near_expiry'),
+            'inventory': reverse('warehouse:inventory'),
+        }
+        self.conditional = {
+            'near_expiry': self.pages['near_expiry'],
+            'inventory': self.pages['inventory'],
+            'locations': reverse('warehouse:locations'),
+        }
+
+    def test_hits_skip_business_queries(self):
+        for label, url in self.pages.items():
+            with self.subTest(label):
+                miss, miss_queries, _ = self._get(url)
+                hit, hit_queries, _ = self._get(url)
+                self.assertEqual(hit, miss)
+                # 支持条件请求的页面先读一次新鲜度令牌
+                self.assertLessEqual(hit_queries, HIT_QUERIES + (label in self.conditional))
+                self.assertLess(hit_queries, miss_queries)
+
+    def test_unchanged_pages_answer_304(self):
+        etags = self._etags()
+        for label, url in self.conditional.items():
+            with self.subTest(label):
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etags[label]).status_code, 304)
+
+    def test_rename_item_redraws_one_fragment(self):
+        self._warm()
+        etags = self._etags()
+        self._mutate(lambda: self._rename(self.item, f'{PREFIX}-改名商品'))
+        # 变动后第一次访问重建页面，只应重绘变动商品所在的分类片段与库存行
+        for label, url in self.pages.items():
+            with self.subTest(label):
+                content, _, rendered = self._get(url)
+                self.assertIn(f'{PREFIX}-改名商品', content)
+                if label in FRAGMENTS:
+                    self.assertEqual(rendered.get(FRAGMENTS[label], 0), 1)
+        self._assert_stale(etags, ('near_expiry', 'inventory'))
+
+    def test_outbound_invalidates_stock_pages(self):
+        self._warm()
+        etags = self._etags()
+        self._mutate(lambda: self._outbound(self.batch, 7))
+        self._assert_stale(etags, ('near_expiry', 'inventory', 'locations'))
+        self.assertIn('<td>13</td>', self._get(self.pages['inventory'])[0])
+        self.assertIn('<td>13</td>', self._get(self.pages['near_expiry'])[0])
+
+    def test_new_image_invalidates_catalog(self):
+        self._warm()
+        # 页面只链接缩略图，直接给出缩略图清单，不依赖实际文件
+        name = f'item_images/{PREFIX.lower()}'
+        variants = {'source': f'{name}.jpg', 'sizes': [{'w': 320, 'h': 240, 'webp': f'{name}__w320.webp', 'jpeg': f'{name}__w320.jpg'}]}
+        self._mutate(lambda: ItemImage.objects.create(item=self.item, image=f'{name}.jpg', variants=variants))
+        self.assertIn(f'{PREFIX.lower()}__w320.jpg', self._get(self.pages['catalog'])[0])
+
+    def test_rename_category_invalidates_catalog_and_inventory(self):
+        self._warm()
+        etags = self._etags()
+        self._mutate(lambda: self._rename(self.other, f'{PREFIX}-改名分类'))
+        self._assert_stale(etags, ('inventory',))
+        self.assertIn(f'{PREFIX}-改名分类', self._get(self.pages['catalog'])[0])
+        self.assertIn(f'{PREFIX}-改名分类', self._get(self.pages['inventory'])[0])
+
+    def test_rename_location_invalidates_etags(self):
+        etags = self._etags()
+        self._mutate(lambda: self._rename(self.location, f'{PREFIX}-改名货位'))
+        self._assert_stale(etags, ('inventory', 'locations'))
+
+    def test_placement_edit_invalidates_inventory(self):
+        self._warm()
+        etags = self._etags()
+        self._mutate(lambda: self._edit_placement(self.batch, 11))
+        self._assert_stale(etags, ('inventory', 'locations'))
+        self.assertIn('（11）', self._get(self.pages['inventory'])[0])
+
+    def test_occupancy_recompute_bumps_versions(self):
+        # 单独校正占用漂移（不经过库存汇总）也要让首页统计与库存、货位页面缓存失效
+        Location.objects.filter(pk=self.location.pk).update(occupied_volume=F('occupied_volume') + 1)
+        before = [cache_version(DASHBOARD), cache_version(STOCK)]
+        self._mutate(lambda: recompute_occupancy([self.location.pk]))
+        after = [cache_version(DASHBOARD), cache_version(STOCK)]
+        self.assertTrue(all(a > b for a, b in zip(after, before)), f'{before} → {after}')
+
+    def _warm(self):
+        for url in self.pages.values():
+            self._get(url)
+
+    def _get(self, url):
+        rendered = {}
+
+        def count(sender, template, **kwargs):
+            rendered[template.name] = rendered.get(template.name, 0) + 1
+
+        template_rendered.connect(count)
+        try:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+        finally:
+            template_rendered.disconnect(count)
+        self.assertEqual(response.status_code, 200, url)
+        return CSRF_INPUT.sub('', response.content.decode()), len(ctx), rendered
+
+    def _etags(self):
+        return {label: self.client.get(url)['ETag'] for label, url in self.conditional.items()}
+
+    def _assert_stale(self, etags, labels):
+        """The ETags taken before the change no longer match ``labels``."""
+        for label in labels:
+            with self.subTest(stale=label):
+                self.assertEqual(self.client.get(self.conditional[label], HTTP_IF_NONE_MATCH=etags[label]).status_code, 200)
+
+    def _mutate(self, change):
+        # 缓存版本在事务提交时递增，测试事务不会提交，直接执行提交回调
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+
+    @staticmethod
+    def _rename(obj, name):
+        obj.name = name
+        obj.save()
+
+    @staticmethod
+    def _edit_placement(batch, units):
+        # 与后台 BatchLocationAdmin.save_model 相同：保存后重算货位占用与商品库存汇总
+        placement = BatchLocation.objects.filter(batch=batch).first()
+        placement.quantity_units = units
+        placement.save(update_fields=['quantity_units'])
+        recompute_occupancy([placement.location_id])
+        refresh_item_stock([batch.item_id])
+
+    def _outbound(self, batch, quantity):
+        batch.refresh_from_db()
+        result = release_outbound(batch, quantity)
+        for location, units in result.assignments:
+            Movement.objects.create(
+                batch=batch,
+                direction=Movement.Direction.OUT,
+                quantity_units=units,
+                user=self.user,
+                location=location,
+            )
+
+
+class LocMemPageCacheTests(PageCacheChecks, TestCase):
+    backend = 'django.core.cache.backends.locmem.LocMemCache'
+
+
+class FilePageCacheTests(PageCacheChecks, TestCase):
+    backend = 'django.core.cache.backends.filebased.FileBasedCache'
@@ -0,0 +1,156 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+
+from warehouse import urls as warehouse_urls
+from warehouse.models import (
+    ApiToken,
+    BatchLocation,
+    Category,
+    Item,
+    ItemBatch,
+    ItemDailyMovement,
+    ItemImage,
+    Location,
+    Movement,
+)
+
+SMALL = 3
+LARGE = 30
+# 单个页面允许的最大查询数
+MAX_QUERIES = 20
+# 304 响应允许的最大查询数：会话、用户或令牌、新鲜度查询各一条
+MAX_NOT_MODIFIED = 3
+# 只接受 POST 的写接口，不做 GET 查询数检查
+POST_ONLY = {'api_inbound', 'api_outbound'}
+# 带 ETag 的页面再用 If-None-Match 请求一次，结果记在这个后缀下
+NOT_MODIFIED = ' (304)'
+# 额外请求的页面：(标签, URL 名称, 查询串)
+EXTRA_URLS = [('search (单字)', 'search', '?q=预')]
+# 页面必须包含的内容，防止搜索等页面查询数正常但结果为空
+EXPECTED_CONTENT = {'search': '预算商品0', 'search (单字)': '预算商品0'}
+
+
+# 页面缓存一律不命中，统计的是重新计算页面时的查询数
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class QueryBudgetTests(TestCase):
+    """Every warehouse page and admin changelist runs the same number of queries at any data size (no N+1)."""
+
+    def test_queries_do_not_grow_with_data(self):
+        small = self._measure(SMALL)
+        large = self._measure(LARGE)
+        for label, (status, count, content) in large.items():
+            small_status, small_count, _ = small[label]
+            with self.subTest(label):
+                if label.endswith(NOT_MODIFIED):
+                    # 数据未变，浏览器带上次的 ETag 重新验证：应直接 304，不再计算页面
+                    self.assertEqual((small_status, status), (304, 304))
+                    self.assertLessEqual(count, MAX_NOT_MODIFIED)
+                else:
+                    self.assertLess(max(small_status, status), 400)
+                    self.assertLessEqual(count, MAX_QUERIES)
+                self.assertLessEqual(count, small_count, f'N={SMALL}: {small_count}，N={LARGE}: {count}')
+                if label in EXPECTED_CONTENT:
+                    self.assertIn(EXPECTED_CONTENT[label], content)
+
+    def _measure(self, n):
+        """``{label: (status, queries, content)}`` for every page, on ``n`` rows per table (rolled back afterwards)."""
+        results = {}
+        with transaction.atomic():
+            user, item = self._seed(n)
+            token = ApiToken(user=user, name='query-budget')
+            key = token.generate_key()
+            token.save()
+            # 令牌请求头对会话页面无影响，供 /api/ 接口认证
+            client = Client(HTTP_AUTHORIZATION=f'Token {key}')
+            client.force_login(user)
+            for label, url in self._urls(item):
+                # 预热一次，排除会话、内容类型等一次性缓存的影响
+                client.get(url)
+                with CaptureQueriesContext(connection) as ctx:
+                    response = client.get(url)
+                    # 流式响应的查询发生在迭代内容时
+                    content = b''.join(response.streaming_content) if response.streaming else response.content
+                results[label] = (response.status_code, len(ctx), content.decode())
+                if response.has_header('ETag'):
+                    with CaptureQueriesContext(connection) as ctx:
+                        response = client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+                    results[label + NOT_MODIFIED] = (response.status_code, len(ctx), '')
+            transaction.set_rollback(True)
+        return results
+
+    def _urls(self, item):
+        samples = {'pk': item.pk, 'code': item.sku_code, 'category_id': item.category_id}
+        queries = {
+            'scan': f'?code={item.sku_code}',
+            'inbound': f'?item={item.pk}',
+            'search': '?q=预算',
+            'catalog_slides': '?page=2',
+            'packaging_list': '?q=预算商品',
+        }
+        for pattern in warehouse_urls.urlpatterns:
+            if not isinstance(pattern, URLPattern) or not pattern.name or pattern.name in POST_ONLY:
+                continue
+            kwargs = {key: samples[key] for key in pattern.pattern.converters}
+            url = reverse(f'warehouse:{pattern.name}', kwargs=kwargs) + queries.get(pattern.name, '')
+            yield pattern.name, url
+        for label, name, query in EXTRA_URLS:
+            yield label, reverse(f'warehouse:{name}') + query
+        for model in admin.site._registry:
+            opts = model._meta
+            yield f'admin:{opts.app_label}.{opts.model_name}', reverse(f'admin:{opts.app_label}_{opts.model_name}_changelist')
+
+    def _seed(self, n):
+        today = timezone.localdate()
+        user = get_user_model().objects.create_superuser('query-budget', 'query-budget@example.com', None)
+        categories = [Category.objects.create(name=f'预算分类{i}', slug=f'budget-{i}') for i in range(n)]
+        locations = [
+            Location.objects.create(code=f'BUDGET-{i:04d}', name=f'预算货位{i}', capacity_volume=Decimal('1000'))
+            for i in range(n)
+        ]
+        items = []
+        for i in range(n):
+            item = Item.objects.create(
+                name=f'预算商品{i}',
+                sku_code=f'BUDGET-{i:04d}',
+                category=categories[i],
+                packaging_volume=Decimal('1.000'),
+            )
+            ItemImage.objects.create(item=item, image=f'item_images/budget-{i}.jpg')
+            ItemDailyMovement.objects.create(item=item, day=today, moves=1, units_in=10)
+            items.append(item)
+        # 第一个分类的商品数随 N 增长，覆盖分类轮播的首屏与分页加载
+        for i in range(n * 5):
+            extra = Item.objects.create(
+                name=f'预算轮播商品{i}',
+                sku_code=f'BUDGET-C{i:04d}',
+                category=categories[0],
+                packaging_volume=Decimal('1.000'),
+            )
+            ItemImage.objects.create(item=extra, image=f'item_images/budget-c{i}.jpg')
+        # 第一个商品下的批次数也随 N 增长，覆盖扫码页的批次列表
+        for i in range(n):
+            for item in {items[i], items[0]}:
+                batch = ItemBatch.objects.create(
+                    item=item,
+                    batch_number=f'BUDGET-{i:04d}',
+                    barcode=f'BUDGET-{item.pk}-{i:04d}',
+                    expiry_date=today + timedelta(days=i % 40),
+                    quantity_units=10,
+                )
+                BatchLocation.objects.create(batch=batch, location=locations[i], quantity_units=10)
+                Movement.objects.create(
+                    batch=batch,
+                    direction=Movement.Direction.IN,
+                    quantity_units=10,
+                    user=user,
+                    location=locations[i],
+                )
+        return user, items[0]
@@ -0,0 +1,101 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from warehouse.models import BatchLocation, Item, ItemBatch, ItemDailyMovement, Location, Movement, SearchTerm
+from warehouse.queryplans import explain, full_scans, plan_checks
+from warehouse.search import rebuild_search_index
+
+BATCH_COUNT = 1000
+
+
+class QueryPlanTests(TestCase):
+    """The hot queries use an index once the tables hold a realistic spread of rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(7)
+        today = timezone.localdate()
+        now = timezone.now()
+        Item.objects.bulk_create(
+            [
+                Item(name=f'审计商品{i}', sku_code=f'AUDIT-{i:05d}', packaging_volume=Decimal('1.000'))
+                for i in range(BATCH_COUNT // 25)
+            ]
+        )
+        items = list(Item.objects.filter(sku_code__startswith='AUDIT-'))
+        Location.objects.bulk_create(
+            [
+                Location(code=f'AUDIT-{i:05d}', name=f'审计货位{i}', capacity_volume=Decimal('100000'))
+                for i in range(BATCH_COUNT // 10)
+            ]
+        )
+        locations = list(Location.objects.filter(code__startswith='AUDIT-'))
+        # 过期日期分布在未来数年内，临期条件只命中一小部分批次
+        ItemBatch.objects.bulk_create(
+            [
+                ItemBatch(
+                    item=rng.choice(items),
+                    batch_number=f'AUDIT-{i:06d}',
+                    barcode=f'AUDIT-{i:06d}',
+                    expiry_date=today + timedelta(days=rng.randint(-30, 1500)) if rng.random() < 0.9 else None,
+                    quantity_units=rng.choice((0, rng.randint(1, 500))),
+                )
+                for i in range(BATCH_COUNT)
+            ],
+            batch_size=1000,
+        )
+        batches = list(ItemBatch.objects.values_list('id', 'quantity_units'))
+        BatchLocation.objects.bulk_create(
+            [
+                BatchLocation(batch_id=batch_id, location=rng.choice(locations), quantity_units=quantity)
+                for batch_id, quantity in batches
+                if quantity
+            ],
+            batch_size=1000,
+        )
+        rebuild_search_index()
+        Movement.objects.bulk_create(
+            [
+                Movement(batch_id=rng.choice(batches)[0], direction=Movement.Direction.IN, quantity_units=rng.randint(1, 50))
+                for _ in range(BATCH_COUNT * 4)
+            ],
+            batch_size=1000,
+        )
+        # auto_now_add 会覆盖为当前时间，批量改写为分布在过去一年内的时间
+        Movement.objects.bulk_update(
+            [
+                Movement(pk=pk, created_at=now - timedelta(minutes=rng.randint(0, 525600)))
+                for pk in Movement.objects.values_list('id', flat=True)
+            ],
+            ['created_at'],
+            batch_size=1000,
+        )
+        ItemDailyMovement.objects.bulk_create(
+            [
+                ItemDailyMovement(item=item, day=today - timedelta(days=d), moves=rng.randint(1, 20))
+                for item in items
+                for d in range(0, 365, 3)
+            ],
+            batch_size=1000,
+        )
+        # MySQL 的 ANALYZE TABLE 会隐式提交事务，只依赖其范围估算（index dive）
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        elif connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                for model in (ItemBatch, Movement, BatchLocation, ItemDailyMovement, SearchTerm):
+                    cursor.execute(f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}')
+
+    def test_hot_queries_use_an_index(self):
+        checks = plan_checks('审计商品')
+        self.assertTrue(checks)
+        for label, model, queryset in checks:
+            with self.subTest(label):
+                plan = explain(queryset)
+                self.assertNotIn(model._meta.db_table, full_scans(plan), plan)
@@ -0,0 +1,31 @@
+from decimal import Decimal
+
+from django.test import TestCase
+
+from warehouse.models import Item, SearchTerm
+from warehouse.search import search
+
+ITEM = SearchTerm.Kind.ITEM
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reordered = Item.objects.create(name='ba ab', sku_code='S-1', packaging_volume=Decimal('1.000'))
+        cls.exact = Item.objects.create(name='abab', sku_code='S-2', packaging_volume=Decimal('1.000'))
+        for i in range(5):
+            Item.objects.create(name=f'桌子{i}', sku_code=f'DESK-{i}', packaging_volume=Decimal('1.000'))
+
+    def test_grams_out_of_order_do_not_match(self):
+        # “ba ab” 含有 abab 的全部词元，但不含查询词本身
+        self.assertEqual([hit.object_id for hit in search('abab', kinds=[ITEM])], [self.exact.pk])
+
+    def test_limit_flags_truncation(self):
+        hits = search('桌子', kinds=[ITEM], limit=3)
+        self.assertEqual(len(hits), 3)
+        self.assertTrue(hits.truncated)
+
+    def test_no_limit_returns_every_match(self):
+        hits = search('桌子', kinds=[ITEM], limit=None)
+        self.assertEqual(len(hits), 5)
+        self.assertFalse(hits.truncated)
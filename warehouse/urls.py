@@ -1,6 +1,6 @@
 ﻿from django.urls import path
 
-from . import views
+from . import api, views
 
 
 app_name = 'warehouse'
@@ -8,14 +8,25 @@ app_name = 'warehouse'
 urlpatterns = [
     path('', views.dashboard, name='dashboard'),
     path('catalog/', views.catalog, name='catalog'),
+    path('catalog/<int:category_id>/slides/', views.catalog_slides, name='catalog_slides'),
     path('scan/', views.scan_view, name='scan'),
     path('inbound/', views.inbound_view, name='inbound'),
     path('outbound/', views.outbound_view, name='outbound'),
+    path('outbound/item/', views.outbound_item_view, name='outbound_item'),
+    path('import/', views.movement_import, name='movement_import'),
     path('inventory/', views.inventory_summary, name='inventory'),
+    path('inventory/export/', views.inventory_export, name='inventory_export'),
     path('near-expiry/', views.near_expiry, name='near_expiry'),
     path('popular/', views.popular_items, name='popular_items'),
     path('locations/', views.locations, name='locations'),
     path('locations/new/', views.location_new, name='location_new'),
     path('packaging/', views.item_packaging_list, name='packaging_list'),
     path('packaging/<int:pk>/', views.item_packaging_update, name='packaging_update'),
+    path('search/', views.search_view, name='search'),
+    path('autocomplete/items/', views.autocomplete_items, name='autocomplete_items'),
+    path('autocomplete/batches/', views.autocomplete_batches, name='autocomplete_batches'),
+    path('autocomplete/locations/', views.autocomplete_locations, name='autocomplete_locations'),
+    path('api/scan/<str:code>/', api.scan, name='api_scan'),
+    path('api/inbound/', api.inbound, name='api_inbound'),
+    path('api/outbound/', api.outbound, name='api_outbound'),
 ]
@@ -1,70 +1,210 @@
+import csv
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required, permission_required
+from django.core.paginator import Paginator
 from django.db import transaction
-from django.db.models import Count, Prefetch, Q, Sum
+from django.db.models import Count, Max, Prefetch, Q, Sum, prefetch_related_objects
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.template.loader import render_to_string
 from django.utils import timezone
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 
 from .forms import (
     InboundForm,
+    ItemOutboundForm,
     ItemPackagingForm,
     LocationForm,
+    MovementImportForm,
     OutboundForm,
     ScanForm,
 )
-from .models import BatchLocation, Category, Item, ItemBatch, Location, Movement
-from .services import allocate_inbound, release_outbound, max_placeable_units
+from .importers import guess_format, import_movements
+from .models import (
+    NEAR_EXPIRY_DAYS,
+    BatchLocation,
+    Category,
+    Item,
+    ItemBatch,
+    ItemDailyMovement,
+    ItemStock,
+    Location,
+    Movement,
+    SearchTerm,
+)
+from .pagecache import (
+    acached_page,
+    acondition,
+    cached_fragments,
+    cached_page,
+    inventory_etag,
+    locations_etag,
+    near_expiry_etag,
+)
+from .scancodes import aresolve_scan_code, scan_cache
+from .search import load_hits, search
+from .services import (
+    allocate_inbound,
+    lock_inbound_plan,
+    plan_inbound,
+    receive_batch,
+    refresh_item_occupancy,
+    release_item_outbound,
+    release_outbound,
+    retry_on_deadlock,
+)
+from .stats import CATALOG, STOCK, dashboard_stats
+
+POPULAR_WINDOWS = (7, 30, 90)
+LOCATIONS_PER_PAGE = 200
+INVENTORY_PAGE_SIZE = 50
+NEAR_EXPIRY_PREVIEW = 50
+EXPORT_CHUNK_SIZE = 500
+AUTOCOMPLETE_PAGE_SIZE = 20
+SEARCH_PAGE_SIZE = 20
+PACKAGING_PER_PAGE = 50
+# 分类轮播首屏渲染的商品数，也是滑动时每次加载的数量
+CATALOG_SLIDES_PER_PAGE = 12
+INVENTORY_EXPORT_FIELDS = (
+    'item__sku_code',
+    'item__name',
+    'item__category__name',
+    'item__size_text',
+    'item__unit',
+    'batch_count',
+    'total_units',
+    'near_expiry_units',
+)
 
 
 @login_required
 def dashboard(request):
-    items_count = Item.objects.count()
-    batches_count = ItemBatch.objects.count()
-    near_expiry_count = ItemBatch.objects.filter(
-        expiry_date__isnull=False,
-        expiry_date__lte=timezone.localdate() + timezone.timedelta(days=30),
-    ).count()
-    context = {
-        'items_count': items_count,
-        'batches_count': batches_count,
-        'near_expiry_count': near_expiry_count,
-    }
-    return render(request, 'warehouse/dashboard.html', context)
+    return render(request, 'warehouse/dashboard.html', dashboard_stats())
+
+
+def _catalog_items():
+    return Item.objects.filter(active=True).prefetch_related('images').order_by('name', 'id')
 
 
 @login_required
 def catalog(request):
-    item_qs = (
-        Item.objects.filter(active=True)
-        .select_related('category')
-        .prefetch_related('images')
-        .order_by('name')
+    # 页面内容对所有操作员相同，整体缓存；导航、消息等仍按请求渲染
+    return render(request, 'warehouse/catalog.html', {'content': cached_page(request, (CATALOG,), _catalog_content)})
+
+
+def _catalog_content():
+    categories = list(
+        Category.objects.order_by('order', 'name').annotate(
+            item_count=Count('items', filter=Q(items__active=True)),
+            last_change=Max('items__updated_at'),
+        )
+    )
+    blocks = cached_fragments('catalog_category', categories, _category_vary_on, _render_category_blocks)
+    return render_to_string(
+        'warehouse/snippets/catalog_content.html',
+        {'category_blocks': blocks, 'page_size': CATALOG_SLIDES_PER_PAGE},
     )
-    categories = (
-        Category.objects.order_by('order', 'name')
-        .prefetch_related(Prefetch('items', queryset=item_qs))
+
+
+def _category_vary_on(category):
+    # 商品增删改、图片变化（会更新商品 updated_at）都会改变数量或最近更新时间
+    return (category.pk, category.name, category.description, category.item_count, category.last_change)
+
+
+def _render_category_blocks(categories):
+    # 只为未命中缓存的分类预取首屏商品（分片预取，一条窗口函数查询），其余由轮播滑动时从 catalog_slides 加载
+    prefetch_related_objects(
+        categories,
+        Prefetch('items', queryset=_catalog_items()[:CATALOG_SLIDES_PER_PAGE], to_attr='first_items'),
+    )
+    blocks = []
+    for category in categories:
+        # 首屏数据内嵌到页面，虚拟化轮播回收节点后据此重新填充
+        category.slide_data = [_slide_payload(item) for item in category.first_items]
+        blocks.append(
+            render_to_string(
+                'warehouse/snippets/catalog_category.html',
+                {'category': category, 'page_size': CATALOG_SLIDES_PER_PAGE},
+            )
+        )
+    return blocks
+
+
+def _page_param(request):
+    try:
+        return max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        return 1
+
+
+def _slide_payload(item):
+    image = next(iter(item.images.all()), None)
+    payload = {'id': item.pk, 'name': item.name, 'sku_code': item.sku_code, 'size_text': item.size_text, 'image': None}
+    # 没有缩略图时前端显示占位，不链接原图
+    size = image.display_size if image else None
+    if size:
+        payload['image'] = {
+            'src': image.display_url,
+            'webp_srcset': image.webp_srcset,
+            'jpeg_srcset': image.jpeg_srcset,
+            'width': size['w'],
+            'height': size['h'],
+            'alt': image.alt or item.name,
+        }
+    return payload
+
+
+@login_required
+def catalog_slides(request, category_id):
+    """One page of a category's carousel slides as JSON (``?page=``, ``results``/``more`` like the autocomplete endpoints)."""
+    category = get_object_or_404(Category, pk=category_id)
+    page = _page_param(request)
+    start = (page - 1) * CATALOG_SLIDES_PER_PAGE
+    rows = list(_catalog_items().filter(category=category)[start:start + CATALOG_SLIDES_PER_PAGE + 1])
+    return JsonResponse(
+        {
+            'results': [_slide_payload(item) for item in rows[:CATALOG_SLIDES_PER_PAGE]],
+            'more': len(rows) > CATALOG_SLIDES_PER_PAGE,
+        },
+        json_dumps_params={'ensure_ascii': False},
     )
-    return render(request, 'warehouse/catalog.html', {'categories': categories})
+
+
+async def _arender(request, template_name, context):
+    # 上下文处理器（user、messages）会同步读取会话与用户，放到线程中渲染；
+    # 页面数据需事先用异步 ORM 取成列表，模板中不再触发查询
+    request.user = await request.auser()
+    return await sync_to_async(render)(request, template_name, context)
 
 
 @login_required
-def scan_view(request):
+async def scan_view(request):
     form = ScanForm(request.GET or None)
     item = None
     batch = None
     batches = None
     if form.is_valid():
-        code = form.cleaned_data['code']
-        batch = ItemBatch.objects.filter(barcode=code).select_related('item').first()
-        if batch:
-            item = batch.item
-        else:
-            item = Item.objects.filter(sku_code=code).first()
+        match = await aresolve_scan_code(form.cleaned_data['code'])
+        if match and match.is_batch:
+            batch = await (
+                ItemBatch.objects.select_related('item').prefetch_related('item__images').filter(pk=match.batch_id).afirst()
+            )
+            item = batch.item if batch else None
+        elif match:
+            item = await Item.objects.prefetch_related('images').filter(pk=match.item_id).afirst()
             if item:
-                batches = item.batches.order_by('-created_at')
-            else:
-                messages.warning(request, '未找到匹配的商品或批次')
-    return render(
+                batches = [b async for b in item.batches.order_by('-created_at')]
+        if item is None:
+            messages.warning(request, '未找到匹配的商品或批次')
+    user = await request.auser()
+    return await _arender(
         request,
         'warehouse/scan.html',
         {
@@ -72,15 +212,15 @@ def scan_view(request):
             'item': item,
             'batch': batch,
             'batches': batches,
-            'can_edit_packaging': request.user.has_perm('warehouse.change_item'),
+            'can_edit_packaging': await user.ahas_perm('warehouse.change_item'),
+            'scan_cache_stats': scan_cache.stats() if user.is_staff else None,
         },
     )
 
 
-
-
 @login_required
 @permission_required('warehouse.add_movement', raise_exception=True)
+@retry_on_deadlock
 @transaction.atomic
 def inbound_view(request):
     if request.method == 'POST':
@@ -91,30 +231,30 @@ def inbound_view(request):
             item_id = form.cleaned_data.get('item_id')
             location = form.cleaned_data.get('location')
             if batch_id:
-                batch = get_object_or_404(ItemBatch, id=batch_id)
+                batch = get_object_or_404(ItemBatch.objects.select_related('item'), id=batch_id)
+                item = batch.item
             else:
                 item = form.cleaned_data.get('item') or get_object_or_404(Item, id=item_id)
-                batch, created = ItemBatch.objects.get_or_create(
-                    item=item,
-                    batch_number=form.cleaned_data['batch_number'],
-                    defaults={
-                        'production_date': form.cleaned_data.get('production_date'),
-                        'expiry_date': form.cleaned_data.get('expiry_date'),
-                        'barcode': form.cleaned_data['barcode'],
-                        'quantity_units': 0,
-                    },
-                )
-                if not created:
-                    # 保留原有生产/过期日期，仅同步条码信息
-                    batch.barcode = form.cleaned_data['barcode']
-                    batch.save(update_fields=['barcode', 'updated_at'])
+                # 只读取已有批次用于规划；写批次放在锁定货位之后
+                batch = ItemBatch.objects.filter(item=item, batch_number=form.cleaned_data['batch_number']).first()
             qty = int(form.cleaned_data['quantity_units'])
-            fit_total = max_placeable_units(batch.item, preferred=location)
-            if qty > fit_total:
-                unit_name = batch.item.unit or '件'
-                messages.error(request, f'货位容量不足，最多还能放置 {fit_total}{unit_name}，请调整数量或增加货位容量')
+            plan = plan_inbound(item, qty, preferred=location, batch=batch)
+            if not plan.fits:
+                unit_name = item.unit or '件'
+                messages.error(request, f'货位容量不足，最多还能放置 {plan.placeable_units}{unit_name}，请调整数量或增加货位容量')
                 return render(request, 'warehouse/inbound.html', {'form': form})
-            allocation = allocate_inbound(batch, qty, preferred=location)
+            # 先锁货位再写批次（保存批次会锁库存汇总），与出库的加锁顺序一致
+            lock_inbound_plan(plan, location, batch=batch)
+            if not batch_id:
+                # 已有批次保留原有生产/过期日期，仅同步条码信息
+                batch = receive_batch(
+                    item,
+                    form.cleaned_data['batch_number'],
+                    form.cleaned_data['barcode'],
+                    form.cleaned_data.get('production_date'),
+                    form.cleaned_data.get('expiry_date'),
+                )
+            allocation = allocate_inbound(batch, qty, plan=plan)
             Movement.objects.create(
                 batch=batch,
                 direction=Movement.Direction.IN,
@@ -157,6 +297,7 @@ def inbound_view(request):
 
 @login_required
 @permission_required('warehouse.add_movement', raise_exception=True)
+@retry_on_deadlock
 @transaction.atomic
 def outbound_view(request):
     if request.method == 'POST':
@@ -204,7 +345,65 @@ def outbound_view(request):
 
 
 @login_required
-def near_expiry(request):
+@permission_required('warehouse.add_movement', raise_exception=True)
+@retry_on_deadlock
+@transaction.atomic
+def outbound_item_view(request):
+    if request.method == 'POST':
+        form = ItemOutboundForm(request.POST)
+        if form.is_valid():
+            item = form.cleaned_data['item']
+            qty = int(form.cleaned_data['quantity_units'])
+            try:
+                result = release_item_outbound(item, qty, user=request.user, note=form.cleaned_data.get('note', ''))
+            except ValueError:
+                messages.error(request, '出库数量超过已上架库存')
+            else:
+                unit_name = item.unit or '件'
+                picked_text = '，'.join(
+                    f"{bl.batch.batch_number}@{bl.location.code}:{units}{unit_name}" for bl, units in result.picks
+                )
+                messages.info(request, f'按先到期先出扣减：{picked_text}')
+                messages.success(request, '出库成功')
+                return redirect('warehouse:scan')
+    else:
+        initial: dict[str, object] = {}
+        item_id = request.GET.get('item')
+        if item_id:
+            initial['item'] = Item.objects.filter(pk=item_id).first()
+        form = ItemOutboundForm(initial=initial)
+    return render(request, 'warehouse/outbound_item.html', {'form': form})
+
+
+@login_required
+@permission_required('warehouse.add_movement', raise_exception=True)
+def movement_import(request):
+    report = None
+    if request.method == 'POST':
+        form = MovementImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            fmt = form.cleaned_data.get('format') or guess_format(upload.name)
+            # 每块独立提交事务，这里不能包在 transaction.atomic 中
+            report = import_movements(upload.file, fmt, user=request.user)
+            if report.error_count:
+                messages.warning(request, f'共 {report.processed} 行，成功 {report.imported} 行，失败 {report.error_count} 行')
+            else:
+                messages.success(request, f'导入完成，共 {report.imported} 行')
+    else:
+        form = MovementImportForm()
+    return render(request, 'warehouse/import.html', {'form': form, 'report': report})
+
+
+@login_required
+@cache_control(private=True, no_cache=True)
+@acondition(near_expiry_etag)
+async def near_expiry(request):
+    content = await acached_page(request, (STOCK,), _near_expiry_content)
+    return await _arender(request, 'warehouse/near_expiry.html', {'content': content})
+
+
+async def _near_expiry_content():
     today = timezone.localdate()
     threshold = today + timezone.timedelta(days=30)
     batches = (
@@ -216,25 +415,49 @@ def near_expiry(request):
         .select_related('item')
         .order_by('expiry_date')
     )
-    return render(request, 'warehouse/near_expiry.html', {'batches': batches, 'today': today})
+    return await sync_to_async(render_to_string)(
+        'warehouse/snippets/near_expiry_content.html', {'batches': [b async for b in batches], 'today': today}
+    )
 
 
 @login_required
 def popular_items(request):
+    days = request.GET.get('days', '')
+    days = int(days) if days.isdigit() and int(days) in POPULAR_WINDOWS else 30
+    since = timezone.localdate() - timezone.timedelta(days=days - 1)
     popular = (
-        Movement.objects
-        .values('batch__item__id', 'batch__item__name', 'batch__item__sku_code')
-        .annotate(moves=Count('id'))
-        .order_by('-moves')[:20]
+        ItemDailyMovement.objects.filter(day__gte=since, moves__gt=0)
+        .values('item_id', 'item__name', 'item__sku_code')
+        .annotate(moves=Sum('moves'), units_in=Sum('units_in'), units_out=Sum('units_out'))
+        .order_by('-moves', 'item__name')[:20]
+    )
+    return render(
+        request,
+        'warehouse/popular.html',
+        {'popular': popular, 'days': days, 'windows': POPULAR_WINDOWS},
     )
-    return render(request, 'warehouse/popular.html', {'popular': popular})
 
 
 @login_required
 @permission_required('warehouse.view_location', raise_exception=True)
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=locations_etag)
 def locations(request):
-    locs = Location.objects.all().order_by('code')
-    return render(request, 'warehouse/locations.html', {'locations': locs})
+    locs = Location.objects.with_occupancy().order_by('code')
+    near_full = request.GET.get('near_full') == '1'
+    if near_full:
+        locs = locs.near_full()
+    page = Paginator(locs, LOCATIONS_PER_PAGE).get_page(request.GET.get('page'))
+    return render(
+        request,
+        'warehouse/locations.html',
+        {
+            'locations': page,
+            'page': page,
+            'near_full': near_full,
+            'near_full_percent': round(settings.WAREHOUSE_NEAR_FULL_RATIO * 100),
+        },
+    )
 
 
 @login_required
@@ -251,45 +474,121 @@ def location_new(request):
     return render(request, 'warehouse/location_form.html', {'form': form})
 
 
-@login_required
-def inventory_summary(request):
-    today = timezone.localdate()
-    threshold = today + timezone.timedelta(days=30)
-    base_rows = (
-        ItemBatch.objects.select_related('item', 'item__category')
-        .values(
-            'item_id',
-            'item__name',
-            'item__sku_code',
-            'item__unit',
-            'item__size_text',
-            'item__category__name',
-        )
-        .annotate(
-            total_units=Sum('quantity_units'),
-            near_expiry_units=Sum(
-                'quantity_units',
-                filter=Q(expiry_date__isnull=False, expiry_date__lte=threshold),
-            ),
-            batch_count=Count('id'),
-        )
-        .order_by('item__name')
+def _inventory_base():
+    # 读取商品库存汇总表；跨天的临期数量由定时任务刷新，未刷新的行在 _attach_locations 中按当天补算
+    return ItemStock.objects.filter(batch_count__gt=0).values(
+        'item_id',
+        'item__name',
+        'item__sku_code',
+        'item__unit',
+        'item__size_text',
+        'item__category__name',
+        'total_units',
+        'near_expiry_units',
+        'batch_count',
+        'computed_on',
+        'item__updated_at',
+        'updated_at',
     )
-    location_rows = (
-        BatchLocation.objects.select_related('batch__item', 'location')
+
+
+def _location_rows(rows):
+    return (
+        BatchLocation.objects.filter(batch__item_id__in=[row['item_id'] for row in rows], quantity_units__gt=0)
         .values('batch__item_id', 'location__code', 'location__name')
         .annotate(units=Sum('quantity_units'))
+        .order_by('batch__item_id', 'location__code')
+    )
+
+
+def _stale_near_expiry_rows(rows, today):
+    # 汇总行的临期数量按 computed_on 起 30 天计算；早于今天的行按当天重新统计（无此类行时不发查询）
+    stale = [row['item_id'] for row in rows if row['computed_on'] < today]
+    return (
+        ItemBatch.objects.filter(
+            item_id__in=stale,
+            expiry_date__isnull=False,
+            expiry_date__lte=today + timezone.timedelta(days=NEAR_EXPIRY_DAYS),
+        )
+        .values('item_id')
+        .annotate(units=Sum('quantity_units'))
+        .order_by()
     )
+
+
+def _attach_locations(rows, location_rows=None, near_expiry_rows=None):
+    """Fill ``row['locations']`` for the given item rows with one grouped query.
+
+    Rows whose stock projection was computed on an earlier day get their
+    near-expiry units re-counted for today with one more grouped query.
+    Pass already fetched ``location_rows`` (from ``_location_rows``) and
+    ``near_expiry_rows`` (from ``_stale_near_expiry_rows``) when the queries
+    were run elsewhere, e.g. by the async ORM.
+    """
+    today = timezone.localdate()
     location_map: dict[int, list[dict[str, object]]] = {}
+    if location_rows is None:
+        location_rows = _location_rows(rows)
+    if near_expiry_rows is None:
+        near_expiry_rows = _stale_near_expiry_rows(rows, today)
+    near_expiry = {row['item_id']: row['units'] for row in near_expiry_rows}
     for row in location_rows:
         location_map.setdefault(row['batch__item_id'], []).append(row)
+    for row in rows:
+        if row['computed_on'] < today:
+            row['near_expiry_units'] = near_expiry.get(row['item_id'])
+        row['near_expiry_units'] = row['near_expiry_units'] or 0
+        row['locations'] = location_map.get(row['item_id'], [])
+    return rows
+
+
+def _encode_cursor(row) -> str:
+    return urlsafe_b64encode(json.dumps([row['item__name'], row['item_id']]).encode()).decode()
+
+
+def _decode_cursor(value):
+    try:
+        name, item_id = json.loads(urlsafe_b64decode(value.encode()))
+        return str(name), int(item_id)
+    except (ValueError, TypeError):
+        return None
+
+
+@login_required
+@cache_control(private=True, no_cache=True)
+@acondition(inventory_etag)
+async def inventory_summary(request):
+    content = await acached_page(request, (STOCK,), lambda: _inventory_content(request))
+    return await _arender(request, 'warehouse/inventory.html', {'content': content})
 
-    inventory_rows: list[dict[str, object]] = []
-    for row in base_rows:
-        item_row = dict(row)
-        item_row['near_expiry_units'] = item_row['near_expiry_units'] or 0
-        item_row['locations'] = location_map.get(row['item_id'], [])
-        inventory_rows.append(item_row)
+
+async def _inventory_content(request):
+    today = timezone.localdate()
+    threshold = today + timezone.timedelta(days=30)
+    rows = _inventory_base()
+
+    # 按 (商品名, 商品 id) 做游标分页：after 取下一页，before 取上一页
+    after = _decode_cursor(request.GET.get('after', ''))
+    before = _decode_cursor(request.GET.get('before', '')) if after is None else None
+    if after:
+        rows = rows.filter(Q(item__name__gt=after[0]) | Q(item__name=after[0], item_id__gt=after[1]))
+    elif before:
+        rows = rows.filter(Q(item__name__lt=before[0]) | Q(item__name=before[0], item_id__lt=before[1]))
+    if before:
+        page = [row async for row in rows.order_by('-item__name', '-item_id')[: INVENTORY_PAGE_SIZE + 1]]
+        has_more = len(page) > INVENTORY_PAGE_SIZE
+        page = page[:INVENTORY_PAGE_SIZE][::-1]
+        has_previous, has_next = has_more, True
+    else:
+        page = [row async for row in rows.order_by('item__name', 'item_id')[: INVENTORY_PAGE_SIZE + 1]]
+        has_next = len(page) > INVENTORY_PAGE_SIZE
+        page = page[:INVENTORY_PAGE_SIZE]
+        has_previous = after is not None
+    inventory_rows = _attach_locations(
+        page,
+        [row async for row in _location_rows(page)],
+        [row async for row in _stale_near_expiry_rows(page, today)],
+    )
 
     near_expiry_batches = (
         ItemBatch.objects.filter(
@@ -298,37 +597,117 @@ def inventory_summary(request):
             quantity_units__gt=0,
         )
         .select_related('item', 'item__category')
-        .order_by('expiry_date')
+        .order_by('expiry_date')[:NEAR_EXPIRY_PREVIEW]
     )
-    return render(
-        request,
-        'warehouse/inventory.html',
+    return await sync_to_async(_render_inventory_content)(
         {
             'inventory_rows': inventory_rows,
-            'near_expiry_batches': near_expiry_batches,
+            'near_expiry_batches': [b async for b in near_expiry_batches],
+            'near_expiry_preview': NEAR_EXPIRY_PREVIEW,
             'threshold': threshold,
-        },
+            'next_cursor': _encode_cursor(inventory_rows[-1]) if inventory_rows and has_next else '',
+            'previous_cursor': _encode_cursor(inventory_rows[0]) if inventory_rows and has_previous else '',
+        }
     )
 
 
+def _inventory_row_vary_on(row):
+    # 库存汇总行每次重算都会更新 updated_at；分类名与货位分布不在这两个时间里，直接参与键
+    return (
+        row['item_id'],
+        row['item__updated_at'],
+        row['updated_at'],
+        row['item__category__name'],
+        # 跨天补算的临期数量不会更新 updated_at
+        row['near_expiry_units'],
+        [(loc['location__code'], loc['units']) for loc in row['locations']],
+    )
+
+
+def _render_inventory_content(context):
+    context['inventory_rows'] = cached_fragments(
+        'inventory_row',
+        context['inventory_rows'],
+        _inventory_row_vary_on,
+        lambda rows: [render_to_string('warehouse/snippets/inventory_row.html', {'row': row}) for row in rows],
+    )
+    return render_to_string('warehouse/snippets/inventory_content.html', context)
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def _export_rows():
+    rows = _inventory_base().order_by('item__name', 'item_id').iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    while True:
+        chunk = list(islice(rows, EXPORT_CHUNK_SIZE))
+        if not chunk:
+            return
+        yield from _attach_locations(chunk)
+
+
+@login_required
+def inventory_export(request):
+    fmt = request.GET.get('format', 'csv')
+    if fmt == 'jsonl':
+        lines = (
+            json.dumps(
+                {
+                    **{key.replace('item__', ''): row[key] for key in INVENTORY_EXPORT_FIELDS},
+                    'locations': {loc['location__code']: loc['units'] for loc in row['locations']},
+                },
+                ensure_ascii=False,
+            ) + '\n'
+            for row in _export_rows()
+        )
+        response = StreamingHttpResponse(lines, content_type='application/x-ndjson; charset=utf-8')
+        filename = f'inventory-{timezone.localdate():%Y%m%d}.jsonl'
+    else:
+        writer = csv.writer(_Echo())
+        header = ['SKU', '商品', '分类', '规格', '单位', '批次数', '库存数量', '临期数量', '货位分布']
+
+        def lines():
+            # 带 BOM，便于 Excel 直接打开中文
+            yield '\ufeff' + writer.writerow(header)
+            for row in _export_rows():
+                locations = '；'.join(f"{loc['location__code']}:{loc['units']}" for loc in row['locations'])
+                yield writer.writerow([row[key] if row[key] is not None else '' for key in INVENTORY_EXPORT_FIELDS] + [locations])
+
+        response = StreamingHttpResponse(lines(), content_type='text/csv; charset=utf-8')
+        filename = f'inventory-{timezone.localdate():%Y%m%d}.csv'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
 @login_required
 @permission_required('warehouse.view_item', raise_exception=True)
 def item_packaging_list(request):
     qs = Item.objects.select_related('category').order_by('name')
-    keyword = request.GET.get('q')
+    keyword = request.GET.get('q', '').strip()
     category_slug = request.GET.get('category')
-    if keyword:
-        qs = qs.filter(Q(name__icontains=keyword) | Q(sku_code__icontains=keyword))
     if category_slug:
         qs = qs.filter(category__slug=category_slug)
+    if keyword:
+        # 走搜索索引取得按相关度排序的全部商品 id（列表不截断），再按分类过滤、分页，只加载当前页
+        ranked = [hit.object_id for hit in search(keyword, kinds=[SearchTerm.Kind.ITEM], limit=None)]
+        allowed = set(qs.filter(pk__in=ranked).values_list('pk', flat=True)) if category_slug else set(ranked)
+        page = Paginator([pk for pk in ranked if pk in allowed], PACKAGING_PER_PAGE).get_page(request.GET.get('page'))
+        loaded = qs.in_bulk(list(page.object_list))
+        items = [loaded[pk] for pk in page.object_list if pk in loaded]
+    else:
+        page = Paginator(qs, PACKAGING_PER_PAGE).get_page(request.GET.get('page'))
+        items = page.object_list
     categories = Category.objects.order_by('order', 'name')
     return render(
         request,
         'warehouse/packaging_list.html',
         {
-            'items': qs,
+            'items': items,
+            'page': page,
             'categories': categories,
-            'keyword': keyword or '',
+            'keyword': keyword,
             'active_category': category_slug or '',
         },
     )
@@ -341,9 +720,74 @@ def item_packaging_update(request, pk: int):
     if request.method == 'POST':
         form = ItemPackagingForm(request.POST, instance=item)
         if form.is_valid():
-            form.save()
+            with transaction.atomic():
+                form.save()
+                if 'packaging_volume' in form.changed_data:
+                    refresh_item_occupancy(item)
             messages.success(request, '包装信息已更新')
             return redirect('warehouse:packaging_list')
     else:
         form = ItemPackagingForm(instance=item)
     return render(request, 'warehouse/packaging_form.html', {'form': form, 'item': item})
+
+
+def _autocomplete(request, queryset, prefix_fields):
+    """Page through ``queryset`` for a typeahead widget, matching ``q`` as a prefix of ``prefix_fields``.
+
+    Prefix matches (``LIKE 'q%'``) can use the indexes on the code columns;
+    one extra row is fetched to tell whether another page exists.
+    """
+    q = request.GET.get('q', '').strip()
+    page = _page_param(request)
+    if q:
+        condition = Q()
+        for field in prefix_fields:
+            condition |= Q(**{f'{field}__istartswith': q})
+        queryset = queryset.filter(condition)
+    start = (page - 1) * AUTOCOMPLETE_PAGE_SIZE
+    rows = list(queryset[start:start + AUTOCOMPLETE_PAGE_SIZE + 1])
+    return JsonResponse(
+        {
+            'results': [{'id': obj.pk, 'text': str(obj)} for obj in rows[:AUTOCOMPLETE_PAGE_SIZE]],
+            'more': len(rows) > AUTOCOMPLETE_PAGE_SIZE,
+        },
+        json_dumps_params={'ensure_ascii': False},
+    )
+
+
+@login_required
+def autocomplete_items(request):
+    return _autocomplete(request, Item.objects.order_by('name', 'id'), ('sku_code', 'name'))
+
+
+@login_required
+def autocomplete_batches(request):
+    # 与出库表单一致：只列出还有库存的批次
+    batches = ItemBatch.objects.filter(quantity_units__gt=0).select_related('item').order_by('-updated_at', '-id')
+    return _autocomplete(request, batches, ('barcode', 'batch_number', 'item__sku_code'))
+
+
+@login_required
+def autocomplete_locations(request):
+    return _autocomplete(request, Location.objects.order_by('code'), ('code', 'name'))
+
+
+@login_required
+def search_view(request):
+    keyword = request.GET.get('q', '').strip()
+    kind = request.GET.get('kind', '')
+    kinds = [kind] if kind in SearchTerm.Kind.values else None
+    results = search(keyword, kinds) if keyword else []
+    page = Paginator(results, SEARCH_PAGE_SIZE).get_page(request.GET.get('page'))
+    return render(
+        request,
+        'warehouse/search.html',
+        {
+            'keyword': keyword,
+            'kind': kind if kinds else '',
+            'kinds': SearchTerm.Kind.choices,
+            'page': page,
+            'hits': load_hits(page.object_list),
+            'truncated': getattr(results, 'truncated', False),
+        },
+    )
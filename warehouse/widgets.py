@@ -0,0 +1,45 @@
+from django import forms
+from django.core.exceptions import ValidationError
+from django.urls import reverse
+
+
+class AutocompleteSelect(forms.Select):
+    """``<select>`` for a ``ModelChoiceField`` that renders only the selected option.
+
+    Other options are fetched page by page from the ``url_name`` endpoint as the
+    user types (``static/js/autocomplete.js``). Submitted values are still
+    validated by the field with a primary-key lookup on its queryset.
+    """
+
+    def __init__(self, url_name, attrs=None):
+        super().__init__(attrs)
+        self.url_name = url_name
+
+    class Media:
+        js = ('js/autocomplete.js',)
+
+    def build_attrs(self, base_attrs, extra_attrs=None):
+        attrs = super().build_attrs(base_attrs, extra_attrs)
+        attrs['data-autocomplete-url'] = reverse(self.url_name)
+        return attrs
+
+    def optgroups(self, name, value, attrs=None):
+        field = self.choices.field
+        options = []
+        if field.empty_label is not None:
+            options.append(('', field.empty_label))
+        wanted = [v for v in value if v]
+        if wanted:
+            # 只查询已选中的记录，避免把整张表渲染成 <option>
+            key = field.to_field_name or 'pk'
+            try:
+                options.extend(
+                    (field.prepare_value(obj), field.label_from_instance(obj))
+                    for obj in field.queryset.filter(**{f'{key}__in': wanted})
+                )
+            except (ValueError, TypeError, ValidationError):
+                pass
+        return [
+            (None, [self.create_option(name, option_value, label, str(option_value) in value, index, attrs=attrs)], index)
+            for index, (option_value, label) in enumerate(options)
+        ]